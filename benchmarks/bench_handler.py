@@ -0,0 +1,356 @@
+"""Offline load test for Handler.
+
+Simulates many guilds queueing, inspecting and skipping songs at once against
+fake voice clients and a stub yt-dlp with configurable latency. No network
+access, Discord connection or ffmpeg is needed.
+
+Run with:
+
+    uv run python -m benchmarks.bench_handler --guilds 50
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import math
+import sys
+import threading
+import time
+import tracemalloc
+from types import SimpleNamespace
+from unittest import mock
+from src.extractor import Extractor
+from src.handler import Handler
+from src.position import FRAME_SECONDS
+
+
+class FakeYoutubeDL:
+    """Stands in for yt_dlp.YoutubeDL, taking a fixed time per extraction. Songs are as long as simulated tracks."""
+
+    latency = 0.5
+    duration = 5
+
+    def __init__(self, options=None):
+        self.options = options
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def extract_info(self, url, download=False, **kwargs):
+        time.sleep(self.latency)
+        video_id = url.split("v=")[-1]
+        # Youtube source URLs expire after 6 hours
+        expire = int(time.time()) + 6 * 60 * 60
+        return {
+            "title": f"Song {video_id}",
+            "duration": self.duration,
+            "url": f"https://example.com/{video_id}.webm?expire={expire}",
+            "format_id": "251",
+            "ext": "webm",
+            "acodec": "opus",
+            "abr": 130,
+        }
+
+
+class FakeAudioSource:
+    """Gives a frame of silence for each 20ms of a simulated track."""
+
+    duration = 5
+
+    def __init__(self, source, **kwargs):
+        self.source = source
+        self.n_frames = round(self.duration / FRAME_SECONDS)
+
+    def read(self):
+        if self.n_frames <= 0:
+            return b""
+        self.n_frames -= 1
+        return b"\0" * 160
+
+    def is_opus(self):
+        return True
+
+    def cleanup(self):
+        pass
+
+
+class FakeVoiceClient:
+    """Plays each song for a fixed time on a timer thread, like the audio player thread. Frames for the time played
+    are read once song ends so playback position is kept."""
+
+    def __init__(self, track_seconds, gaps):
+        self.track_seconds = track_seconds
+        self.gaps = gaps
+        self.timer = None
+        self.after = None
+        self.source = None
+        self.started_at = None
+        self.paused = False
+        self.finished_at = None
+        self.lock = threading.Lock()
+
+    def play(self, source, after=None):
+        with self.lock:
+            if self.finished_at is not None:
+                self.gaps.append(time.perf_counter() - self.finished_at)
+                self.finished_at = None
+            self.after = after
+            self.source = source
+            self.started_at = time.perf_counter()
+            self.timer = threading.Timer(self.track_seconds, self.__finish)
+            self.timer.start()
+
+    def __finish(self):
+        with self.lock:
+            if self.timer is None:
+                return
+            self.timer = None
+            after = self.after
+            source = self.source
+            played = min(self.track_seconds, time.perf_counter() - self.started_at)
+        for _ in range(round(played / FRAME_SECONDS)):
+            if not source.read():
+                break
+        with self.lock:
+            self.finished_at = time.perf_counter()
+        if after is not None:
+            after(None)
+
+    def stop(self):
+        with self.lock:
+            if self.timer is None:
+                return
+            self.timer.cancel()
+        self.__finish()
+
+    def pause(self):
+        self.paused = True
+
+    def resume(self):
+        self.paused = False
+
+    def is_playing(self):
+        return self.timer is not None and not self.paused
+
+    def is_paused(self):
+        return self.timer is not None and self.paused
+
+    def is_connected(self):
+        return True
+
+    async def disconnect(self):
+        self.stop()
+
+
+class FakeVoiceChannel:
+    def __init__(self, id, track_seconds, gaps):
+        self.id = id
+        self.track_seconds = track_seconds
+        self.gaps = gaps
+
+    async def connect(self):
+        return FakeVoiceClient(self.track_seconds, self.gaps)
+
+
+class FakeContext:
+    def __init__(self, channel):
+        self.author = SimpleNamespace(
+            id=channel.id, voice=SimpleNamespace(channel=channel)
+        )
+        self.guild = SimpleNamespace(id=channel.id)
+        self.messages = []
+
+    async def send(self, message):
+        self.messages.append(message)
+
+
+def percentile(samples, p):
+    """Gets p-th percentile of samples with nearest-rank method."""
+    if not samples:
+        return 0
+    ordered = sorted(samples)
+    k = max(0, min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1))
+    return ordered[k]
+
+
+def summarize(samples):
+    return {
+        "count": len(samples),
+        "p50": percentile(samples, 50),
+        "p95": percentile(samples, 95),
+        "p99": percentile(samples, 99),
+        "max": max(samples, default=0),
+    }
+
+
+async def probe_loop_lag(samples, interval=0.01):
+    """Measures how late the event loop wakes up from a fixed sleep."""
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(max(0, time.perf_counter() - start - interval))
+
+
+async def timed(latencies, command, coro):
+    start = time.perf_counter()
+    await coro
+    latencies.setdefault(command, []).append(time.perf_counter() - start)
+
+
+async def simulate_guild(handler, channel, config, latencies):
+    """Queues songs, checks the queue and skips a song like a busy guild would."""
+    ctx = FakeContext(channel)
+    for i in range(config.songs_per_guild):
+        url = f"https://youtube.com/watch?v={channel.id}-{i}"
+        await timed(latencies, "play", handler.play(ctx, url))
+    await timed(latencies, "info", handler.info(ctx))
+    await timed(latencies, "skip", handler.skip(ctx))
+
+
+async def wait_for_sessions_to_end(handler, timeout):
+    deadline = time.perf_counter() + timeout
+    while handler.session_cache and time.perf_counter() < deadline:
+        await asyncio.sleep(0.05)
+
+
+async def run_benchmark(config):
+    """Runs simulated guilds against a Handler and returns measurements."""
+    FakeYoutubeDL.latency = config.extraction_latency
+    FakeYoutubeDL.duration = config.track_seconds
+    FakeAudioSource.duration = config.track_seconds
+    latencies = {}
+    loop_lags = []
+    gaps = []
+
+    with (
+        mock.patch("yt_dlp.YoutubeDL", FakeYoutubeDL),
+        mock.patch("discord.FFmpegPCMAudio", FakeAudioSource),
+        mock.patch("discord.FFmpegOpusAudio", FakeAudioSource),
+    ):
+        bot = SimpleNamespace(loop=asyncio.get_running_loop())
+        extractor = Extractor(max_workers=config.extractor_workers)
+        handler = Handler(bot=bot, extractor=extractor)
+        channels = [
+            FakeVoiceChannel(i, config.track_seconds, gaps)
+            for i in range(config.guilds)
+        ]
+
+        tracemalloc.start()
+        memory_before, _ = tracemalloc.get_traced_memory()
+        lag_task = asyncio.create_task(probe_loop_lag(loop_lags))
+        start = time.perf_counter()
+
+        await asyncio.gather(
+            *[
+                simulate_guild(handler, channel, config, latencies)
+                for channel in channels
+            ]
+        )
+        memory_peak_sessions, _ = tracemalloc.get_traced_memory()
+        n_sessions = max(1, len(handler.session_cache))
+        await wait_for_sessions_to_end(handler, config.timeout)
+
+        elapsed = time.perf_counter() - start
+        lag_task.cancel()
+        tracemalloc.stop()
+        extractor.shutdown()
+
+    return {
+        "guilds": config.guilds,
+        "elapsed_seconds": elapsed,
+        "unfinished_sessions": len(handler.session_cache),
+        "command_latency_seconds": {
+            command: summarize(samples) for command, samples in latencies.items()
+        },
+        "event_loop_lag_seconds": summarize(loop_lags),
+        "song_transition_gap_seconds": summarize(gaps),
+        "memory_per_session_bytes": (memory_peak_sessions - memory_before) / n_sessions,
+    }
+
+
+def format_report(results):
+    lines = [
+        f"Simulated {results['guilds']} guilds in {results['elapsed_seconds']:.2f}s "
+        f"({results['unfinished_sessions']} sessions unfinished)",
+        "",
+        f"{'metric':<24}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}",
+    ]
+    rows = [
+        (f"command {command}", summary)
+        for command, summary in results["command_latency_seconds"].items()
+    ]
+    rows.append(("event loop lag", results["event_loop_lag_seconds"]))
+    rows.append(("song transition gap", results["song_transition_gap_seconds"]))
+    for name, summary in rows:
+        lines.append(
+            f"{name:<24}{summary['count']:>8}"
+            + "".join(
+                f"{summary[key] * 1000:>10.1f}" for key in ["p50", "p95", "p99", "max"]
+            )
+        )
+    lines.append("")
+    lines.append(
+        f"memory per session: {results['memory_per_session_bytes'] / 1024:.1f} KiB"
+    )
+    return "\n".join(lines)
+
+
+def check_thresholds(results, config):
+    """Gets list of failed regression thresholds."""
+    failures = []
+    for command, summary in results["command_latency_seconds"].items():
+        if (
+            config.max_command_p95 is not None
+            and summary["p95"] > config.max_command_p95
+        ):
+            failures.append(
+                f"{command} p95 latency {summary['p95']:.3f}s > {config.max_command_p95}s"
+            )
+    lag_p99 = results["event_loop_lag_seconds"]["p99"]
+    if config.max_loop_lag_p99 is not None and lag_p99 > config.max_loop_lag_p99:
+        failures.append(
+            f"event loop lag p99 {lag_p99:.3f}s > {config.max_loop_lag_p99}s"
+        )
+    if results["unfinished_sessions"] > 0:
+        failures.append(f"{results['unfinished_sessions']} sessions did not finish")
+    return failures
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--guilds", type=int, default=50)
+    parser.add_argument("--songs-per-guild", type=int, default=3)
+    parser.add_argument("--extraction-latency", type=float, default=0.5)
+    parser.add_argument("--extractor-workers", type=int, default=4)
+    parser.add_argument("--track-seconds", type=float, default=5)
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--max-command-p95", type=float, default=None)
+    parser.add_argument("--max-loop-lag-p99", type=float, default=None)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON.")
+    parser.add_argument(
+        "--verbose", action="store_true", help="Show bot output during the run."
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    config = parse_args(argv)
+    # Bot output is hidden unless asked for so the report is readable
+    quiet = contextlib.redirect_stdout(io.StringIO())
+    with contextlib.nullcontext() if config.verbose else quiet:
+        results = asyncio.run(run_benchmark(config))
+    print(json.dumps(results, indent=2) if config.json else format_report(results))
+
+    failures = check_thresholds(results, config)
+    for failure in failures:
+        print(f"FAILED: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,11 @@
 import os
-from dotenv import load_dotenv
-from src.bot import create_and_run_bot
+from src.startup import startup_timer
+
+# Imports are timed as part of startup
+with startup_timer.stage("import"):
+    from dotenv import load_dotenv
+    from src.bot import create_and_run_bot
+    from src.cluster import run_cluster
 
 if __name__ == "__main__":
     load_dotenv()
@@ -8,4 +13,146 @@ if __name__ == "__main__":
     discord_token = os.environ.get("DISCORD_TOKEN")
     discord_command_prefix = os.environ.get("DISCORD_COMMAND_PREFIX", "!")
 
-    create_and_run_bot(discord_token, discord_command_prefix)
+    extractor_options = {
+        "max_workers": int(os.environ.get("EXTRACTOR_MAX_WORKERS", "4")),
+        "timeout": float(os.environ.get("EXTRACTOR_TIMEOUT", "30")),
+        "use_processes": os.environ.get("EXTRACTOR_USE_PROCESSES", "false").lower()
+        == "true",
+        "retries": int(os.environ.get("EXTRACTOR_RETRIES", "2")),
+        "hedge_quantile": (
+            float(os.environ.get("EXTRACTOR_HEDGE_QUANTILE"))
+            if os.environ.get("EXTRACTOR_HEDGE_QUANTILE")
+            else None
+        ),
+        "circuit_failure_threshold": int(
+            os.environ.get("EXTRACTOR_CIRCUIT_FAILURE_THRESHOLD", "5")
+        ),
+        "circuit_reset_timeout": float(
+            os.environ.get("EXTRACTOR_CIRCUIT_RESET_TIMEOUT", "30")
+        ),
+        "max_waiting": (
+            int(os.environ.get("EXTRACTOR_MAX_WAITING"))
+            if os.environ.get("EXTRACTOR_MAX_WAITING")
+            else None
+        ),
+    }
+
+    cache_options = {
+        "path": os.environ.get("METADATA_CACHE_PATH", "guizhong-cache.sqlite3"),
+        "max_entries": int(os.environ.get("METADATA_CACHE_MAX_ENTRIES", "1024")),
+        "ttl": float(os.environ.get("METADATA_CACHE_TTL", str(7 * 24 * 60 * 60))),
+    }
+
+    search_cache_options = {
+        "path": os.environ.get("METADATA_CACHE_PATH", "guizhong-cache.sqlite3"),
+        "max_entries": int(os.environ.get("SEARCH_CACHE_MAX_ENTRIES", "1024")),
+        "ttl": float(os.environ.get("SEARCH_CACHE_TTL", str(24 * 60 * 60))),
+    }
+
+    journal_options = {
+        "path": os.environ.get("SESSION_JOURNAL_PATH", "guizhong-sessions.sqlite3"),
+    }
+
+    handler_options = {
+        "playback_mode": os.environ.get("PLAYBACK_MODE", "passthrough"),
+        "trace_slow_threshold": float(os.environ.get("TRACE_SLOW_THRESHOLD", "5")),
+        "paused_timeout": float(os.environ.get("SESSION_PAUSED_TIMEOUT", "900")),
+        "idle_timeout": float(os.environ.get("SESSION_IDLE_TIMEOUT", "300")),
+        "empty_channel_timeout": float(
+            os.environ.get("SESSION_EMPTY_CHANNEL_TIMEOUT", "60")
+        ),
+        "disconnected_timeout": float(
+            os.environ.get("SESSION_DISCONNECTED_TIMEOUT", "60")
+        ),
+        "max_sessions": (
+            int(os.environ.get("MAX_SESSIONS"))
+            if os.environ.get("MAX_SESSIONS")
+            else None
+        ),
+        "max_queue_length": int(os.environ.get("MAX_QUEUE_LENGTH", "1000")),
+        "user_rate_limit": int(os.environ.get("USER_RATE_LIMIT", "10")) or None,
+        "guild_rate_limit": int(os.environ.get("GUILD_RATE_LIMIT", "30")) or None,
+        "rate_limit_period": float(os.environ.get("RATE_LIMIT_PERIOD", "60")),
+        "prebuffer_lead": float(os.environ.get("PREBUFFER_LEAD", "10")) or None,
+        "prebuffer_max_bytes": int(
+            os.environ.get("PREBUFFER_MAX_BYTES", str(1024 * 1024))
+        ),
+        "profile_dir": os.environ.get("PROFILE_DIR", "profiles"),
+    }
+
+    # Local audio cache is opt-in
+    audio_cache_options = None
+    if os.environ.get("AUDIO_CACHE_DIR"):
+        audio_cache_options = {
+            "directory": os.environ.get("AUDIO_CACHE_DIR"),
+            "max_bytes": int(
+                os.environ.get("AUDIO_CACHE_MAX_BYTES", str(1024 * 1024 * 1024))
+            ),
+            "play_threshold": int(os.environ.get("AUDIO_CACHE_PLAY_THRESHOLD", "3")),
+        }
+
+    # Loudness normalization is opt-in
+    loudness_options = None
+    if os.environ.get("LOUDNESS_NORMALIZATION", "false").lower() == "true":
+        loudness_options = {
+            "target": float(os.environ.get("LOUDNESS_TARGET", "-16")),
+        }
+
+    # Load-adaptive stream quality is opt-in
+    format_options = None
+    if os.environ.get("ADAPTIVE_QUALITY", "false").lower() == "true":
+        format_options = {
+            "medium_sessions": int(os.environ.get("QUALITY_MEDIUM_SESSIONS", "20")),
+            "low_sessions": int(os.environ.get("QUALITY_LOW_SESSIONS", "50")),
+            "medium_bandwidth": (
+                int(os.environ.get("QUALITY_MEDIUM_BANDWIDTH"))
+                if os.environ.get("QUALITY_MEDIUM_BANDWIDTH")
+                else None
+            ),
+            "low_bandwidth": (
+                int(os.environ.get("QUALITY_LOW_BANDWIDTH"))
+                if os.environ.get("QUALITY_LOW_BANDWIDTH")
+                else None
+            ),
+        }
+
+    # Metrics endpoint is opt-in
+    metrics_options = None
+    if os.environ.get("METRICS_PORT"):
+        metrics_options = {
+            "host": os.environ.get("METRICS_HOST", "127.0.0.1"),
+            "port": int(os.environ.get("METRICS_PORT")),
+        }
+
+    bot_kwargs = {
+        "discord_token": discord_token,
+        "discord_command_prefix": discord_command_prefix,
+        "extractor_options": extractor_options,
+        "cache_options": cache_options,
+        "search_cache_options": search_cache_options,
+        "handler_options": handler_options,
+        "audio_cache_options": audio_cache_options,
+        "loudness_options": loudness_options,
+        "format_options": format_options,
+        "metrics_options": metrics_options,
+        "journal_options": journal_options,
+    }
+
+    # Sharding is opt-in. Shards can be spread across several worker processes.
+    cluster_workers = int(os.environ.get("CLUSTER_WORKERS", "1"))
+    shard_count = os.environ.get("SHARD_COUNT")
+    if cluster_workers > 1:
+        run_cluster(
+            bot_kwargs,
+            cluster_workers,
+            shard_count=(
+                int(shard_count) if shard_count and shard_count != "auto" else None
+            ),
+        )
+    elif shard_count:
+        shard_options = {}
+        if shard_count != "auto":
+            shard_options["shard_count"] = int(shard_count)
+        create_and_run_bot(**bot_kwargs, shard_options=shard_options)
+    else:
+        create_and_run_bot(**bot_kwargs)
@@ -0,0 +1,107 @@
+import concurrent.futures
+import os
+import threading
+from collections import Counter
+
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+DEFAULT_PLAY_THRESHOLD = 3
+TMP_DIR_NAME = ".tmp"
+
+AUDIO_CACHE_YDL_OPTIONS = {
+    "format": "bestaudio[acodec=opus]/bestaudio/best",
+    "quiet": True,
+    "postprocessors": [
+        {
+            "key": "FFmpegExtractAudio",
+            "preferredcodec": "opus",
+        }
+    ],
+}
+
+
+class AudioCache:
+    """Size-bounded directory of Opus files for frequently played songs by video id."""
+
+    def __init__(
+        self,
+        directory,
+        max_bytes=DEFAULT_MAX_BYTES,
+        play_threshold=DEFAULT_PLAY_THRESHOLD,
+    ):
+        self.directory = directory
+        self.tmp_directory = os.path.join(directory, TMP_DIR_NAME)
+        self.max_bytes = max_bytes
+        self.play_threshold = play_threshold
+        self.play_counts = Counter()
+        self.downloading = set()
+        self.lock = threading.Lock()
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="audio-cache"
+        )
+        os.makedirs(self.tmp_directory, exist_ok=True)
+
+    def path_for(self, video_id):
+        return os.path.join(self.directory, f"{video_id}.opus")
+
+    def get(self, video_id):
+        """Gets path to cached audio for video id. Returns None if song is not cached."""
+        path = self.path_for(video_id)
+        try:
+            # Mark as recently used for eviction
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def record_play(self, video_id):
+        """Counts a play of video id. Song is downloaded in the background once it has been played enough."""
+        with self.lock:
+            self.play_counts[video_id] += 1
+            if (
+                self.play_counts[video_id] < self.play_threshold
+                or video_id in self.downloading
+                or os.path.exists(self.path_for(video_id))
+            ):
+                return None
+            self.downloading.add(video_id)
+        return self.executor.submit(self.download, video_id)
+
+    def download(self, video_id):
+        """Downloads audio for video id into the cache. File only appears in the cache once it is complete."""
+        import yt_dlp
+
+        try:
+            options = {
+                **AUDIO_CACHE_YDL_OPTIONS,
+                "outtmpl": os.path.join(self.tmp_directory, "%(id)s.%(ext)s"),
+            }
+            with yt_dlp.YoutubeDL(options) as ydl:
+                ydl.download([f"https://www.youtube.com/watch?v={video_id}"])
+
+            tmp_path = os.path.join(self.tmp_directory, f"{video_id}.opus")
+            os.replace(tmp_path, self.path_for(video_id))
+            print(f"Cached audio for {video_id}")
+            self.evict()
+        except Exception as e:
+            print(f"Error: {e}")
+        finally:
+            with self.lock:
+                self.downloading.discard(video_id)
+
+    def evict(self):
+        """Removes least recently used files until cache fits in its size limit."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(".opus"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
@@ -1,23 +1,131 @@
+import asyncio
+import time
 import discord
 from discord.ext import commands
+from src.audio_cache import AudioCache
+from src.format_selector import FormatSelector
+from src.loudness import LoudnessAnalyzer
+from src.cache import MetadataCache, SearchCache
+from src.extractor import Extractor
 from src.handler import Handler
+from src.journal import SessionJournal
+from src.metrics import Metrics, MetricsServer, probe_event_loop_lag
+from src.startup import startup_timer
 
 
-def create_bot(discord_command_prefix):
+async def warm_up(extractor):
+    """Loads modules that are left out of startup to get the bot online sooner."""
+    with startup_timer.stage("warm_up"):
+        try:
+            await extractor.warm_up()
+        except Exception as e:
+            print(f"Error: {e}")
+
+
+def report_startup(metrics):
+    """Logs startup stages and exposes them as metrics."""
+    for name, stage in startup_timer.stages.items():
+        metrics.gauge(
+            "guizhong_startup_seconds",
+            "Time taken by each stage of starting the bot.",
+            labels={"stage": name},
+        ).set(stage["duration_ms"] / 1000)
+    startup_timer.report()
+
+
+def create_bot(
+    discord_command_prefix,
+    extractor_options=None,
+    cache_options=None,
+    handler_options=None,
+    audio_cache_options=None,
+    metrics_options=None,
+    journal_options=None,
+    shard_options=None,
+    search_cache_options=None,
+    loudness_options=None,
+    format_options=None,
+):
 
     intents = discord.Intents.default()
     intents.message_content = True
 
-    bot = commands.Bot(command_prefix=discord_command_prefix, intents=intents)
-    handler = Handler(bot=bot)
+    if shard_options is not None:
+        bot = commands.AutoShardedBot(
+            command_prefix=discord_command_prefix, intents=intents, **shard_options
+        )
+    else:
+        bot = commands.Bot(command_prefix=discord_command_prefix, intents=intents)
+    metrics = Metrics()
+    cache = MetadataCache(**cache_options) if cache_options is not None else None
+    search_cache = (
+        SearchCache(**search_cache_options)
+        if search_cache_options is not None
+        else None
+    )
+    extractor = Extractor(
+        cache=cache,
+        search_cache=search_cache,
+        metrics=metrics,
+        **(extractor_options or {}),
+    )
+    audio_cache = (
+        AudioCache(**audio_cache_options) if audio_cache_options is not None else None
+    )
+    journal = SessionJournal(**journal_options) if journal_options is not None else None
+    loudness_analyzer = (
+        LoudnessAnalyzer(cache=cache, **loudness_options)
+        if loudness_options is not None
+        else None
+    )
+    format_selector = (
+        FormatSelector(**format_options) if format_options is not None else None
+    )
+    handler = Handler(
+        bot=bot,
+        extractor=extractor,
+        metrics=metrics,
+        audio_cache=audio_cache,
+        journal=journal,
+        loudness_analyzer=loudness_analyzer,
+        format_selector=format_selector,
+        **(handler_options or {}),
+    )
+    background_tasks = []
 
     @bot.event
     async def on_ready():
         print("Bot is ready!")
 
+        # on_ready is called again on reconnect, so only start background work once
+        if background_tasks:
+            return
+        startup_timer.mark("ready")
+        warm_up_task = asyncio.create_task(warm_up(extractor))
+        background_tasks.append(asyncio.create_task(probe_event_loop_lag(metrics)))
+        background_tasks.append(asyncio.create_task(handler.run_reaper()))
+        if metrics_options is not None:
+            await MetricsServer(metrics, **metrics_options).start()
+        with startup_timer.stage("restore_sessions"):
+            await handler.restore_sessions()
+        await warm_up_task
+        report_startup(metrics)
+
+    @bot.before_invoke
+    async def before_invoke(ctx):
+        ctx.started_at = time.perf_counter()
+
+    @bot.after_invoke
+    async def after_invoke(ctx):
+        metrics.histogram(
+            "guizhong_command_seconds",
+            "Time spent handling bot commands.",
+            labels={"command": ctx.command.name},
+        ).observe(time.perf_counter() - ctx.started_at)
+
     @bot.command()
-    async def info(ctx):
-        await handler.info(ctx)
+    async def info(ctx, *args):
+        await handler.info(ctx, *args)
 
     @bot.command()
     async def play(ctx, *args):
@@ -31,6 +139,10 @@ def create_bot(discord_command_prefix):
     async def resume(ctx):
         await handler.resume(ctx)
 
+    @bot.command()
+    async def seek(ctx, *args):
+        await handler.seek(ctx, *args)
+
     @bot.command()
     async def skip(ctx, *args):
         await handler.skip(ctx, *args)
@@ -39,9 +151,59 @@ def create_bot(discord_command_prefix):
     async def stop(ctx):
         await handler.stop(ctx)
 
+    @bot.command()
+    @commands.is_owner()
+    async def purgecache(ctx):
+        await handler.purge_cache(ctx)
+
+    @bot.command()
+    @commands.is_owner()
+    async def profile(ctx, *args):
+        await handler.profile(ctx, *args)
+
+    @bot.command()
+    @commands.is_owner()
+    async def memory(ctx, *args):
+        await handler.memory(ctx, *args)
+
+    @bot.command()
+    @commands.is_owner()
+    async def sessions(ctx):
+        await handler.dump_sessions(ctx)
+
+    @bot.command()
+    @commands.is_owner()
+    async def tasks(ctx):
+        await handler.dump_tasks(ctx)
+
     return bot
 
 
-def create_and_run_bot(discord_token, discord_command_prefix):
-    bot = create_bot(discord_command_prefix)
+def create_and_run_bot(
+    discord_token,
+    discord_command_prefix,
+    extractor_options=None,
+    cache_options=None,
+    handler_options=None,
+    audio_cache_options=None,
+    metrics_options=None,
+    journal_options=None,
+    shard_options=None,
+    search_cache_options=None,
+    loudness_options=None,
+    format_options=None,
+):
+    bot = create_bot(
+        discord_command_prefix,
+        extractor_options=extractor_options,
+        cache_options=cache_options,
+        handler_options=handler_options,
+        audio_cache_options=audio_cache_options,
+        metrics_options=metrics_options,
+        journal_options=journal_options,
+        shard_options=shard_options,
+        search_cache_options=search_cache_options,
+        loudness_options=loudness_options,
+        format_options=format_options,
+    )
     bot.run(discord_token)
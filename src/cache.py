@@ -0,0 +1,172 @@
+import concurrent.futures
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_TTL = 7 * 24 * 60 * 60
+DEFAULT_SEARCH_TTL = 24 * 60 * 60
+# Seconds between removals of expired entries from the database
+PRUNE_INTERVAL = 60 * 60
+
+
+class SqliteCache:
+    """LRU cache of JSON values by key, backed by a table in a SQLite file. Subclasses name the table and its columns."""
+
+    table = None
+    key_column = None
+    value_column = None
+
+    def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.entries = OrderedDict()
+        # Values not written to the database yet
+        self.pending = {}
+        self.is_write_scheduled = False
+        self.pruned_at = None
+        self.lock = threading.Lock()
+        self.db_lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        # Cache file can be shared by several worker processes
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} ("
+            f"{self.key_column} TEXT PRIMARY KEY, {self.value_column} TEXT NOT NULL, cached_at REAL NOT NULL)"
+        )
+        self.db.commit()
+        # Database is written to in the background, and read from here by callers that cannot block
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="cache"
+        )
+
+    def __len__(self):
+        self.flush()
+        with self.db_lock:
+            (count,) = self.db.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()
+            return count
+
+    def __is_expired(self, cached_at):
+        return time.time() - cached_at > self.ttl
+
+    def __remember(self, key, value, cached_at):
+        self.entries[key] = (value, cached_at)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def is_in_memory(self, key):
+        """Checks if key can be looked up without reading the database."""
+        with self.lock:
+            return key in self.entries or key in self.pending
+
+    def get(self, key):
+        """Gets cached value for key. Returns None if missing or expired. Reads the database if key is not in memory."""
+        with self.lock:
+            entry = self.entries.get(key) or self.pending.get(key)
+        if entry is None:
+            with self.db_lock:
+                row = self.db.execute(
+                    f"SELECT {self.value_column}, cached_at FROM {self.table} WHERE {self.key_column} = ?",
+                    (key,),
+                ).fetchone()
+            if row is not None:
+                entry = (json.loads(row[0]), row[1])
+
+        with self.lock:
+            if entry is None or self.__is_expired(entry[1]):
+                self.entries.pop(key, None)
+                self.misses += 1
+                return None
+
+            self.__remember(key, *entry)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        """Stores value for key. Value is written to the database in the background."""
+        cached_at = time.time()
+        with self.lock:
+            self.__remember(key, value, cached_at)
+            self.pending[key] = (value, cached_at)
+            if self.is_write_scheduled:
+                return
+            self.is_write_scheduled = True
+        self.executor.submit(self.__write_pending)
+
+    def __write_pending(self):
+        """Writes pending values in a single commit, pruning expired entries from time to time."""
+        with self.lock:
+            pending = dict(self.pending)
+            self.is_write_scheduled = False
+        if len(pending) == 0:
+            return
+        try:
+            with self.db_lock:
+                self.db.executemany(
+                    f"INSERT OR REPLACE INTO {self.table} ({self.key_column}, {self.value_column}, cached_at) "
+                    "VALUES (?, ?, ?)",
+                    [
+                        (key, json.dumps(value), cached_at)
+                        for key, (value, cached_at) in pending.items()
+                    ],
+                )
+                now = time.time()
+                if self.pruned_at is None or now - self.pruned_at > PRUNE_INTERVAL:
+                    self.db.execute(
+                        f"DELETE FROM {self.table} WHERE cached_at < ?",
+                        (now - self.ttl,),
+                    )
+                    self.pruned_at = now
+                self.db.commit()
+        except Exception as e:
+            print(f"Error: {e}")
+        with self.lock:
+            # Values put again in the meantime are left for the next write
+            for key, entry in pending.items():
+                if self.pending.get(key) is entry:
+                    del self.pending[key]
+
+    def flush(self):
+        """Waits on pending values to be written."""
+        self.executor.submit(self.__write_pending).result()
+
+    def purge(self):
+        """Removes all cached values. Returns number of entries removed."""
+        self.flush()
+        with self.lock:
+            self.entries.clear()
+            self.pending.clear()
+        with self.db_lock:
+            count = self.db.execute(f"DELETE FROM {self.table}").rowcount
+            self.db.commit()
+            return count
+
+    def close(self):
+        self.flush()
+        self.executor.shutdown()
+        with self.db_lock:
+            self.db.close()
+
+
+class MetadataCache(SqliteCache):
+    """LRU cache of song metadata by video id, backed by a SQLite file."""
+
+    table = "songs"
+    key_column = "video_id"
+    value_column = "metadata"
+
+
+class SearchCache(SqliteCache):
+    """LRU cache of search results by normalized search query, backed by a SQLite file."""
+
+    table = "searches"
+    key_column = "query"
+    value_column = "result"
+
+    def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_SEARCH_TTL):
+        super().__init__(path, max_entries=max_entries, ttl=ttl)
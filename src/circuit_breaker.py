@@ -0,0 +1,59 @@
+import time
+from src.errors import CircuitOpenError
+
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT = 30
+
+# Circuit states, numbered for monitoring
+CIRCUIT_CLOSED = 0
+CIRCUIT_HALF_OPEN = 1
+CIRCUIT_OPEN = 2
+
+
+class CircuitBreaker:
+    """Fails calls fast after too many failures in a row. Once reset timeout has passed, a single trial call is let
+    through and its outcome decides whether calls are let through again."""
+
+    def __init__(
+        self,
+        failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+        reset_timeout=DEFAULT_RESET_TIMEOUT,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CIRCUIT_CLOSED
+        self.n_failures = 0
+        self.opened_at = None
+        self.trial_started_at = None
+
+    def check(self):
+        """Throws CircuitOpenError if call should not be made right now."""
+        now = time.monotonic()
+        if self.state == CIRCUIT_OPEN:
+            if now - self.opened_at < self.reset_timeout:
+                raise CircuitOpenError(
+                    f"circuit opened after {self.n_failures} failures"
+                )
+            self.state = CIRCUIT_HALF_OPEN
+            self.trial_started_at = None
+
+        if self.state == CIRCUIT_HALF_OPEN:
+            # Trial call that never reported back is given up on after reset timeout
+            if (
+                self.trial_started_at is not None
+                and now - self.trial_started_at < self.reset_timeout
+            ):
+                raise CircuitOpenError("waiting on trial call")
+            self.trial_started_at = now
+
+    def record_success(self):
+        self.state = CIRCUIT_CLOSED
+        self.n_failures = 0
+        self.trial_started_at = None
+
+    def record_failure(self):
+        self.n_failures += 1
+        if self.state == CIRCUIT_HALF_OPEN or self.n_failures >= self.failure_threshold:
+            self.state = CIRCUIT_OPEN
+            self.opened_at = time.monotonic()
+            self.trial_started_at = None
@@ -0,0 +1,191 @@
+import asyncio
+import copy
+import multiprocessing
+import os
+import signal
+import aiohttp
+from src.bot import create_and_run_bot
+from src.metrics import MetricsServer, merge_expositions
+
+GATEWAY_BOT_URL = "https://discord.com/api/v10/gateway/bot"
+DEFAULT_RESTART_DELAY = 5
+WORKER_CHECK_INTERVAL = 1
+WORKER_SCRAPE_TIMEOUT = 5
+
+
+def split_shards(shard_count, n_workers):
+    """Splits shard ids into contiguous ranges, one for each worker."""
+    if shard_count < n_workers:
+        raise ValueError(
+            f"Cannot split {shard_count} shards across {n_workers} workers"
+        )
+    return [
+        list(range(i * shard_count // n_workers, (i + 1) * shard_count // n_workers))
+        for i in range(n_workers)
+    ]
+
+
+async def fetch_shard_count(discord_token):
+    """Gets number of shards Discord recommends for the bot."""
+    async with aiohttp.ClientSession() as session:
+        async with session.get(
+            GATEWAY_BOT_URL, headers={"Authorization": f"Bot {discord_token}"}
+        ) as response:
+            response.raise_for_status()
+            return (await response.json())["shards"]
+
+
+def with_path_suffix(path, suffix):
+    root, ext = os.path.splitext(path)
+    return f"{root}-{suffix}{ext}"
+
+
+def run_worker(bot_kwargs):
+    create_and_run_bot(**bot_kwargs)
+
+
+class ClusterMetricsServer(MetricsServer):
+    """Serves metrics of all workers in Prometheus text format over HTTP, labelled by worker."""
+
+    def __init__(self, worker_urls, host="127.0.0.1", port=9100):
+        super().__init__(None, host=host, port=port)
+        self.worker_urls = worker_urls
+
+    async def __scrape(self, session, url):
+        try:
+            async with session.get(url) as response:
+                return await response.text()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Error: {e}")
+            return ""
+
+    async def handle_metrics(self, request):
+        from aiohttp import web
+
+        timeout = aiohttp.ClientTimeout(total=WORKER_SCRAPE_TIMEOUT)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            texts = await asyncio.gather(
+                *[self.__scrape(session, url) for url in self.worker_urls]
+            )
+        return web.Response(
+            text=merge_expositions(dict(enumerate(texts)), label="worker"),
+            content_type="text/plain",
+            charset="utf-8",
+        )
+
+
+class Supervisor:
+    """Runs ranges of bot shards in worker processes, restarting workers that exit."""
+
+    def __init__(
+        self,
+        bot_kwargs,
+        shard_count,
+        n_workers,
+        restart_delay=DEFAULT_RESTART_DELAY,
+    ):
+        self.bot_kwargs = bot_kwargs
+        self.shard_count = shard_count
+        self.shard_ranges = split_shards(shard_count, n_workers)
+        self.restart_delay = restart_delay
+        self.context = multiprocessing.get_context("spawn")
+        self.processes = [None] * n_workers
+        self.stopping = None
+
+    def worker_kwargs(self, worker_index):
+        """Gets bot options for worker. Workers keep their own session journal and serve metrics on their own port."""
+        kwargs = copy.deepcopy(self.bot_kwargs)
+        kwargs["shard_options"] = {
+            "shard_ids": self.shard_ranges[worker_index],
+            "shard_count": self.shard_count,
+        }
+        # Guilds stay on the same worker as long as shard and worker counts do not change
+        if kwargs.get("journal_options") is not None:
+            kwargs["journal_options"]["path"] = with_path_suffix(
+                kwargs["journal_options"]["path"], worker_index
+            )
+        if kwargs.get("metrics_options") is not None:
+            kwargs["metrics_options"]["port"] += worker_index + 1
+        return kwargs
+
+    def worker_metrics_urls(self):
+        return [
+            f"http://{options['host']}:{options['port']}/metrics"
+            for options in (
+                self.worker_kwargs(i)["metrics_options"]
+                for i in range(len(self.processes))
+            )
+        ]
+
+    def start_worker(self, worker_index):
+        process = self.context.Process(
+            target=run_worker,
+            args=(self.worker_kwargs(worker_index),),
+            name=f"guizhong-worker-{worker_index}",
+        )
+        process.start()
+        self.processes[worker_index] = process
+        print(
+            f"Started worker {worker_index} with shards {self.shard_ranges[worker_index]} (pid {process.pid})"
+        )
+
+    def stop_workers(self):
+        for process in self.processes:
+            if process is not None and process.is_alive():
+                process.terminate()
+        for process in self.processes:
+            if process is not None:
+                process.join()
+
+    async def run(self):
+        """Starts workers and keeps them running until the supervisor is told to stop."""
+        loop = asyncio.get_running_loop()
+        self.stopping = asyncio.Event()
+        for sig in [signal.SIGINT, signal.SIGTERM]:
+            loop.add_signal_handler(sig, self.stopping.set)
+
+        metrics_server = None
+        metrics_options = self.bot_kwargs.get("metrics_options")
+        if metrics_options is not None:
+            metrics_server = ClusterMetricsServer(
+                self.worker_metrics_urls(), **metrics_options
+            )
+            await metrics_server.start()
+
+        for i in range(len(self.processes)):
+            self.start_worker(i)
+
+        restart_at = {}
+        while not self.stopping.is_set():
+            for i, process in enumerate(self.processes):
+                if process.is_alive():
+                    continue
+                # Back off before restarting so a worker that keeps crashing does not spin
+                if i not in restart_at:
+                    print(
+                        f"Worker {i} exited with code {process.exitcode}, restarting in {self.restart_delay}s"
+                    )
+                    restart_at[i] = loop.time() + self.restart_delay
+                elif loop.time() >= restart_at[i]:
+                    del restart_at[i]
+                    self.start_worker(i)
+            try:
+                await asyncio.wait_for(
+                    self.stopping.wait(), timeout=WORKER_CHECK_INTERVAL
+                )
+            except asyncio.TimeoutError:
+                pass
+
+        print("Stopping workers")
+        await loop.run_in_executor(None, self.stop_workers)
+        if metrics_server is not None:
+            await metrics_server.stop()
+
+
+def run_cluster(bot_kwargs, n_workers, shard_count=None):
+    """Runs bot across worker processes. Shard count is fetched from Discord if not given."""
+    if shard_count is None:
+        shard_count = max(
+            n_workers, asyncio.run(fetch_shard_count(bot_kwargs["discord_token"]))
+        )
+    asyncio.run(Supervisor(bot_kwargs, shard_count, n_workers).run())
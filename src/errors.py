@@ -1,2 +1,22 @@
 class InvalidSongURLError(RuntimeError):
     """Exception for invalid song URL on parse."""
+
+
+class ExtractionTimeoutError(RuntimeError):
+    """Exception for extraction that did not finish in time."""
+
+
+class SessionLimitError(RuntimeError):
+    """Exception for new session when bot is already playing in as many voice channels as allowed."""
+
+
+class QueueFullError(RuntimeError):
+    """Exception for song queued when session queue is already as long as allowed."""
+
+
+class NoSearchResultsError(RuntimeError):
+    """Exception for search that found no songs."""
+
+
+class CircuitOpenError(RuntimeError):
+    """Exception for extraction not attempted because Youtube has been failing."""
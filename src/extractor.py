@@ -0,0 +1,390 @@
+import asyncio
+import concurrent.futures
+import functools
+import itertools
+import random
+import time
+from collections import deque
+from src.circuit_breaker import (
+    DEFAULT_FAILURE_THRESHOLD,
+    DEFAULT_RESET_TIMEOUT,
+    CircuitBreaker,
+)
+from src.errors import CircuitOpenError, ExtractionTimeoutError, NoSearchResultsError
+from src.metrics import Metrics
+from src.rate_limit import FairScheduler
+from src.song import QUALITY_HIGH, Song
+from src.utils import normalize_search_query
+from src.ydl_pool import YoutubeDLPool, init_process_pool
+
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_TIMEOUT = 30
+DEFAULT_PLAYLIST_PAGE_SIZE = 50
+DEFAULT_RETRIES = 2
+DEFAULT_RETRY_BACKOFF = 0.5
+# Number of recent lookup times kept to decide when a lookup is slow enough to hedge
+LATENCY_WINDOW_SIZE = 200
+MIN_LATENCIES_TO_HEDGE = 20
+
+
+def is_expected_error(e):
+    """Checks if lookup failed because of the request itself, such as a private video, rather than Youtube or
+    yt-dlp misbehaving. Expected errors are not retried."""
+    if isinstance(e, NoSearchResultsError):
+        return True
+    # yt-dlp wraps extractor errors, which are flagged as expected when Youtube refused the request
+    cause = getattr(e, "exc_info", None)
+    if cause is not None and len(cause) > 1 and cause[1] is not None:
+        e = cause[1]
+    return getattr(e, "expected", False) is True
+
+
+class Extractor:
+    def __init__(
+        self,
+        max_workers=DEFAULT_MAX_WORKERS,
+        timeout=DEFAULT_TIMEOUT,
+        use_processes=False,
+        cache=None,
+        metrics=None,
+        search_cache=None,
+        max_waiting=None,
+        retries=DEFAULT_RETRIES,
+        retry_backoff=DEFAULT_RETRY_BACKOFF,
+        hedge_quantile=None,
+        circuit_failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+        circuit_reset_timeout=DEFAULT_RESET_TIMEOUT,
+    ):
+        self.max_workers = max_workers
+        self.max_waiting = max_waiting
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.hedge_quantile = hedge_quantile
+        self.latencies = {}
+        self.circuit_breaker = CircuitBreaker(
+            failure_threshold=circuit_failure_threshold,
+            reset_timeout=circuit_reset_timeout,
+        )
+        self.timeout = timeout
+        self.cache = cache
+        self.search_cache = search_cache
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.inflight = {}
+        self.coalesced = self.metrics.counter(
+            "guizhong_extractions_coalesced_total",
+            "Extractions answered by an identical extraction already in flight.",
+        )
+        if cache is not None:
+            self.metrics.counter(
+                "guizhong_metadata_cache_hits_total",
+                "Song lookups answered from metadata cache.",
+                fn=lambda: cache.hits,
+            )
+            self.metrics.counter(
+                "guizhong_metadata_cache_misses_total",
+                "Song lookups not found in metadata cache.",
+                fn=lambda: cache.misses,
+            )
+        if search_cache is not None:
+            self.metrics.counter(
+                "guizhong_search_cache_hits_total",
+                "Searches answered from search cache.",
+                fn=lambda: search_cache.hits,
+            )
+            self.metrics.counter(
+                "guizhong_search_cache_misses_total",
+                "Searches not found in search cache.",
+                fn=lambda: search_cache.misses,
+            )
+        self.thread_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="extractor"
+        )
+        # Each worker reuses its own YoutubeDL instances. Worker processes create their own pool.
+        if use_processes:
+            self.executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=max_workers, initializer=init_process_pool
+            )
+            self.ydl_pool = None
+        else:
+            self.executor = self.thread_executor
+            self.ydl_pool = YoutubeDLPool()
+        # Extractions wait their turn by group, so one busy guild cannot starve the others
+        self.scheduler = FairScheduler(max_workers)
+        self.metrics.gauge(
+            "guizhong_extractions_waiting",
+            "Number of extractions waiting for a free worker.",
+            fn=lambda: self.scheduler.n_waiting,
+        )
+        self.retried = self.metrics.counter(
+            "guizhong_extraction_retries_total",
+            "Lookups retried after failing.",
+        )
+        self.hedged = self.metrics.counter(
+            "guizhong_extraction_hedges_total",
+            "Second lookups started because the first was slower than usual.",
+        )
+        self.short_circuited = self.metrics.counter(
+            "guizhong_extractions_short_circuited_total",
+            "Lookups failed fast because Youtube has been failing.",
+        )
+        self.metrics.gauge(
+            "guizhong_extractor_circuit_state",
+            "State of circuit breaker around Youtube lookups. 0 is closed, 1 is half-open and 2 is open.",
+            fn=lambda: self.circuit_breaker.state,
+        )
+
+    def is_busy(self):
+        """Checks if so many extractions are waiting that new requests should be turned away."""
+        return (
+            self.max_waiting is not None
+            and self.scheduler.n_waiting >= self.max_waiting
+        )
+
+    async def run(self, fn, *args, group=None, **kwargs):
+        """Runs blocking function on executor pool once it is the turn of group. Throws ExtractionTimeoutError if call
+        takes too long."""
+        return await self.__run(self.executor, group, fn, *args, **kwargs)
+
+    async def run_in_thread(self, fn, *args, group=None, **kwargs):
+        """Runs blocking function on thread pool. Used for work that cannot be sent to another process."""
+        return await self.__run(self.thread_executor, group, fn, *args, **kwargs)
+
+    def __extraction_time(self, kind):
+        return self.metrics.histogram(
+            "guizhong_extraction_seconds",
+            "Time spent extracting info with yt-dlp.",
+            labels={"kind": kind},
+        ).time()
+
+    async def __run(self, executor, group, fn, *args, **kwargs):
+        async with self.scheduler.slot(group):
+            loop = asyncio.get_running_loop()
+            fut = loop.run_in_executor(executor, functools.partial(fn, *args, **kwargs))
+            try:
+                return await asyncio.wait_for(fut, timeout=self.timeout)
+            except asyncio.TimeoutError as e:
+                raise ExtractionTimeoutError(
+                    f"extraction took longer than {self.timeout}s"
+                ) from e
+
+    def __get_hedge_delay(self, kind):
+        """Gets time after which a lookup is slower than usual and a second one is started."""
+        latencies = self.latencies.get(kind)
+        if (
+            self.hedge_quantile is None
+            or latencies is None
+            or len(latencies) < MIN_LATENCIES_TO_HEDGE
+        ):
+            return None
+        latencies = sorted(latencies)
+        return latencies[
+            min(len(latencies) - 1, int(self.hedge_quantile * len(latencies)))
+        ]
+
+    def __check_circuit(self):
+        try:
+            self.circuit_breaker.check()
+        except CircuitOpenError:
+            self.short_circuited.inc()
+            raise
+
+    def __record_failure(self, e):
+        """Records failed lookup with circuit breaker. Returns True if lookup is worth retrying."""
+        if is_expected_error(e):
+            # Youtube answered, it just did not have what was asked for
+            self.circuit_breaker.record_success()
+            return False
+        self.circuit_breaker.record_failure()
+        return True
+
+    async def __hedged_run(self, kind, fn, *args, group=None):
+        """Runs lookup, starting an identical second one if the first is slower than usual. First to succeed wins."""
+        first = asyncio.ensure_future(self.run(fn, *args, group=group))
+        hedge_delay = self.__get_hedge_delay(kind)
+        if hedge_delay is None:
+            return await first
+
+        pending = {first}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=hedge_delay)
+            if len(done) > 0:
+                return first.result()
+
+            self.hedged.inc()
+            pending.add(asyncio.ensure_future(self.run(fn, *args, group=group)))
+            error = None
+            while len(pending) > 0:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def __lookup(self, kind, fn, *args, group=None):
+        """Runs lookup with retries and hedging. Throws CircuitOpenError without trying if Youtube has been failing."""
+        for attempt in range(self.retries + 1):
+            self.__check_circuit()
+            started_at = time.perf_counter()
+            try:
+                with self.__extraction_time(kind):
+                    result = await self.__hedged_run(kind, fn, *args, group=group)
+            except Exception as e:
+                if not self.__record_failure(e) or attempt == self.retries:
+                    raise
+                print(f"Error: {e}")
+                self.retried.inc()
+                # Full jitter keeps retries from many sessions from arriving together
+                await asyncio.sleep(random.uniform(0, self.retry_backoff * 2**attempt))
+                continue
+
+            self.circuit_breaker.record_success()
+            self.latencies.setdefault(kind, deque(maxlen=LATENCY_WINDOW_SIZE)).append(
+                time.perf_counter() - started_at
+            )
+            return result
+
+    async def __single_flight(self, key, fn):
+        """Runs coroutine function once for all concurrent callers with the same key."""
+        task = self.inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self.inflight[key] = task
+
+            def forget(_):
+                if self.inflight.get(key) is task:
+                    del self.inflight[key]
+
+            task.add_done_callback(forget)
+        else:
+            self.coalesced.inc()
+        # Shield shared task so one caller giving up does not cancel it for the others
+        return await asyncio.shield(task)
+
+    async def __extract_song(self, video_id, quality, group):
+        song = await self.__lookup(
+            "song", Song.extract_song, video_id, self.ydl_pool, quality, group=group
+        )
+
+        if self.cache is not None:
+            self.cache.put(video_id, song.to_metadata())
+
+        return song
+
+    async def warm_up(self):
+        """Loads yt-dlp in the background so the first request does not wait on it."""
+        await asyncio.get_running_loop().run_in_executor(
+            self.thread_executor, Song.warm_up, self.ydl_pool
+        )
+
+    async def __cache_get(self, cache, key):
+        """Gets cached value, reading the cache database off the event loop if needed."""
+        if cache.is_in_memory(key):
+            return cache.get(key)
+        return await asyncio.get_running_loop().run_in_executor(
+            cache.executor, cache.get, key
+        )
+
+    async def extract_song(self, video_id, group=None, quality=QUALITY_HIGH):
+        """Gets Youtube song info by video id without blocking the event loop. Uses metadata cache if available.
+        Extraction is scheduled fairly with other groups and keeps a stream URL."""
+        if self.cache is not None:
+            metadata = await self.__cache_get(self.cache, video_id)
+            if metadata is not None:
+                return Song.from_metadata(video_id, metadata)
+
+        song = await self.__single_flight(
+            ("song", video_id), lambda: self.__extract_song(video_id, quality, group)
+        )
+        # Callers sharing an extraction each get their own song to queue
+        return song.copy()
+
+    async def __search(self, query, quality, group):
+        song = await self.__lookup(
+            "search", Song.search, query, self.ydl_pool, quality, group=group
+        )
+
+        # Seed metadata cache so the song is not looked up again when it is searched for or queued by URL
+        if self.cache is not None:
+            self.cache.put(song.video_id, song.to_metadata())
+        if self.search_cache is not None:
+            self.search_cache.put(query, {"video_id": song.video_id})
+
+        return song
+
+    async def search(self, query, group=None, quality=QUALITY_HIGH):
+        """Gets first Youtube song found for search query without blocking the event loop. Uses search cache if available."""
+        query = normalize_search_query(query)
+        if self.search_cache is not None:
+            result = await self.__cache_get(self.search_cache, query)
+            if result is not None:
+                return await self.extract_song(
+                    result["video_id"], group=group, quality=quality
+                )
+
+        song = await self.__single_flight(
+            ("search", query), lambda: self.__search(query, quality, group)
+        )
+        return song.copy()
+
+    async def __resolve_source_url(self, video_url, quality, group):
+        return await self.__lookup(
+            "source_url",
+            Song.resolve_source_url,
+            video_url,
+            self.ydl_pool,
+            quality,
+            group=group,
+        )
+
+    async def get_source_url(self, song, group=None, quality=QUALITY_HIGH):
+        """Gets song source URL without blocking the event loop. Reuses stored URL until shortly before it expires,
+        whatever its quality, and otherwise resolves a new one in stream quality."""
+        if not song.has_valid_source_url():
+            source_url, format_info = await self.__single_flight(
+                ("source_url", song.video_url, quality),
+                lambda: self.__resolve_source_url(song.video_url, quality, group),
+            )
+            song.set_source_url(source_url, dict(format_info))
+        return song.source_url
+
+    async def iter_playlist(
+        self, playlist_id, page_size=DEFAULT_PLAYLIST_PAGE_SIZE, group=None
+    ):
+        """Enumerates unresolved songs in Youtube playlist page by page without blocking the event loop."""
+        songs = Song.iter_playlist(playlist_id)
+        try:
+            while True:
+                self.__check_circuit()
+                try:
+                    with self.__extraction_time("playlist_page"):
+                        page = await self.run_in_thread(
+                            lambda: list(itertools.islice(songs, page_size)),
+                            group=group,
+                        )
+                except Exception as e:
+                    self.__record_failure(e)
+                    raise
+                self.circuit_breaker.record_success()
+                if len(page) > 0:
+                    yield page
+                if len(page) < page_size:
+                    return
+        finally:
+            try:
+                songs.close()
+            except ValueError:
+                # Generator is still running in a thread that timed out
+                pass
+
+    def shutdown(self):
+        """Stops executor pool, cancelling extractions that have not started."""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.thread_executor.shutdown(wait=False, cancel_futures=True)
+        if self.ydl_pool is not None:
+            self.ydl_pool.close()
@@ -0,0 +1,53 @@
+from src.song import QUALITIES
+
+# Bitrate in kbps assumed for streams of unknown bitrate
+DEFAULT_BITRATE = 160
+# Load has to fall this far below a threshold before quality is raised again, so quality does not flap
+RECOVERY_RATIO = 0.8
+
+
+def get_bitrate(song):
+    """Gets bitrate in kbps of song stream."""
+    return song.format_info.get("abr") or DEFAULT_BITRATE
+
+
+class FormatSelector:
+    """Picks stream quality from current load. Medium or low quality is used once playing sessions or the bandwidth of
+    their streams cross its threshold, and undone once load falls well below."""
+
+    def __init__(
+        self,
+        medium_sessions=None,
+        low_sessions=None,
+        medium_bandwidth=None,
+        low_bandwidth=None,
+    ):
+        self.thresholds = [
+            (medium_sessions, medium_bandwidth),
+            (low_sessions, low_bandwidth),
+        ]
+        self.level = 0
+
+    @property
+    def quality(self):
+        return QUALITIES[self.level]
+
+    def __get_level(self, n_sessions, bandwidth, ratio):
+        level = 0
+        for i, (max_sessions, max_bandwidth) in enumerate(self.thresholds, start=1):
+            if (max_sessions is not None and n_sessions >= max_sessions * ratio) or (
+                max_bandwidth is not None and bandwidth >= max_bandwidth * ratio
+            ):
+                level = i
+        return level
+
+    def select(self, n_sessions, bandwidth):
+        """Gets quality for number of sessions playing and total bitrate of their streams in kbps."""
+        level = self.__get_level(n_sessions, bandwidth, 1)
+        if level < self.level:
+            # Quality is only raised as far as load leaves headroom for
+            level = min(
+                self.level, self.__get_level(n_sessions, bandwidth, RECOVERY_RATIO)
+            )
+        self.level = level
+        return self.quality
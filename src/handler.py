@@ -1,40 +1,213 @@
 import asyncio
+import math
+import time
+from contextlib import asynccontextmanager, nullcontext
 import discord
-from src.errors import InvalidSongURLError
+from src.errors import (
+    CircuitOpenError,
+    ExtractionTimeoutError,
+    InvalidSongURLError,
+    NoSearchResultsError,
+    QueueFullError,
+    SessionLimitError,
+)
+from src.extractor import Extractor
+from src.format_selector import get_bitrate
+from src.metrics import Metrics, count_child_processes
+from src.position import PositionSource
+from src.prebuffer import DEFAULT_PREBUFFER_MAX_BYTES, BufferedSource
+from src.profiler import DEFAULT_PROFILE_DIR, Profiler
+from src.rate_limit import RateLimiter
 from src.session import Session
-from src.song import Song
-from src.utils import parse_youtube_video_url
+from src.song import QUALITY_HIGH, Song
+from src.song_queue import SongQueue
+from src.tracing import DEFAULT_SLOW_THRESHOLD, FirstPacketSource, Tracer
+from src.utils import (
+    StderrTail,
+    format_duration,
+    is_url,
+    parse_timestamp,
+    parse_youtube_playlist_url,
+    parse_youtube_video_url,
+)
 
 FFMPEG_OPTIONS = {
     "before_options": "-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5",
     "options": "-vn",
 }
 
+# Playback modes. Passthrough copies Opus streams to Discord without re-encoding,
+# while PCM always decodes with ffmpeg and re-encodes on the Python side.
+PLAYBACK_MODE_PASSTHROUGH = "passthrough"
+PLAYBACK_MODE_PCM = "pcm"
+
 COMMAND_PREFIX = "!"
 AUTHOR_NOT_IN_VOICE_CHANNEL_MESSAGE = "You need to be in a voice channel to use this command. Try joining a voice and trying again."
-SAMPLE_COMMAND_MESSAGE_PART = (
-    f"Try playing something with `{COMMAND_PREFIX}play <YOUTUBE VIDEO URL>`."
-)
+SAMPLE_COMMAND_MESSAGE_PART = f"Try playing something with `{COMMAND_PREFIX}play <SEARCH TERMS OR YOUTUBE VIDEO OR PLAYLIST URL>`."
 NO_SESSION_FOUND_MESSAGE = (
     f"You need to have music queued to use this command. {SAMPLE_COMMAND_MESSAGE_PART}"
 )
-INVALID_ARGS_FOR_PLAY_MESSAGE = (
-    f"A single URL must be provided for this command. {SAMPLE_COMMAND_MESSAGE_PART}"
-)
+INVALID_ARGS_FOR_PLAY_MESSAGE = f"Search terms or at least one URL must be provided for this command. {SAMPLE_COMMAND_MESSAGE_PART}"
 INVALID_YOUTUBE_URL_FOR_PLAY_MESSAGE = (
-    "Invalid URL provided. Please provide a valid Youtube video URL."
+    "Invalid URL provided. Please provide a valid Youtube video or playlist URL."
 )
 INVALID_NUMBER_OF_SONGS_TO_SKIP_MESSAGE = f"Invalid number of songs to skip. Try skipping songs with `{COMMAND_PREFIX}skip <NUMBER OF SONGS>`."
+INVALID_POSITION_FOR_SEEK_MESSAGE = (
+    f"Invalid position. Try seeking with `{COMMAND_PREFIX}seek <MINUTES:SECONDS>`."
+)
+POSITION_PAST_END_MESSAGE = "Position is past the end of the song."
+NOTHING_PLAYING_MESSAGE = "Nothing is playing right now."
+INVALID_PAGE_FOR_INFO_MESSAGE = f"Invalid page number. Try viewing the queue with `{COMMAND_PREFIX}info <PAGE NUMBER>`."
+INVALID_ARGS_FOR_PROFILE_MESSAGE = (
+    f"Try profiling with `{COMMAND_PREFIX}profile <start OR stop>`."
+)
+INVALID_ARGS_FOR_MEMORY_MESSAGE = f"Try taking a memory snapshot with `{COMMAND_PREFIX}memory` or stopping tracing with `{COMMAND_PREFIX}memory stop`."
+NO_SEARCH_RESULTS_MESSAGE = "No songs found. Try searching for something else."
+EXTRACTION_TIMEOUT_FOR_PLAY_MESSAGE = (
+    "Timed out while looking up song. Please try again in a moment."
+)
 GENERAL_ERROR_FOR_PLAY_MESSAGE = (
     "Unable to queue song due to an unknown error. Please contact the bot owner."
 )
+NO_CACHE_CONFIGURED_MESSAGE = "No song metadata cache is configured."
+TOO_MANY_SESSIONS_MESSAGE = (
+    "Bot is playing in too many voice channels right now. Please try again later."
+)
+QUEUE_FULL_MESSAGE = (
+    "Queue is full. Please wait for some songs to finish before queueing more."
+)
+USER_RATE_LIMITED_MESSAGE = (
+    "You are queueing songs too quickly. Please try again in {} seconds."
+)
+GUILD_RATE_LIMITED_MESSAGE = (
+    "This server is queueing songs too quickly. Please try again in {} seconds."
+)
+YOUTUBE_UNAVAILABLE_MESSAGE = (
+    "Youtube is not responding right now. Please try again in a few minutes."
+)
+EXTRACTOR_BUSY_MESSAGE = (
+    "Bot is busy looking up songs for other servers. Please try again in a moment."
+)
 MAX_SONG_INFOS_TO_DISPLAY = 5
 
+# Seconds a session can stay paused, idle, alone in its voice channel or disconnected before it is ended
+DEFAULT_PAUSED_TIMEOUT = 15 * 60
+DEFAULT_IDLE_TIMEOUT = 5 * 60
+DEFAULT_EMPTY_CHANNEL_TIMEOUT = 60
+DEFAULT_DISCONNECTED_TIMEOUT = 60
+DEFAULT_REAP_INTERVAL = 30
+DEFAULT_MAX_QUEUE_LENGTH = 1000
+
+# Number of songs each user and guild can request per rate limit period in seconds
+DEFAULT_USER_RATE_LIMIT = 10
+DEFAULT_GUILD_RATE_LIMIT = 30
+DEFAULT_RATE_LIMIT_PERIOD = 60
+
+# Seconds before the end of a song at which the next song starts being read into memory
+DEFAULT_PREBUFFER_LEAD = 10
+
+# Songs that stop more than this many seconds before their end, such as when the voice connection drops, are
+# resumed where they stopped up to a number of times
+RESUME_MARGIN = 5
+MAX_RESUMES = 3
+# Seconds between checks on whether a lost voice connection has come back
+RECONNECT_POLL_INTERVAL = 0.5
+
 
 class Handler:
-    def __init__(self, bot):
+    def __init__(
+        self,
+        bot,
+        extractor=None,
+        metrics=None,
+        playback_mode=PLAYBACK_MODE_PASSTHROUGH,
+        audio_cache=None,
+        trace_slow_threshold=DEFAULT_SLOW_THRESHOLD,
+        journal=None,
+        paused_timeout=DEFAULT_PAUSED_TIMEOUT,
+        idle_timeout=DEFAULT_IDLE_TIMEOUT,
+        empty_channel_timeout=DEFAULT_EMPTY_CHANNEL_TIMEOUT,
+        disconnected_timeout=DEFAULT_DISCONNECTED_TIMEOUT,
+        max_sessions=None,
+        max_queue_length=DEFAULT_MAX_QUEUE_LENGTH,
+        user_rate_limit=DEFAULT_USER_RATE_LIMIT,
+        guild_rate_limit=DEFAULT_GUILD_RATE_LIMIT,
+        rate_limit_period=DEFAULT_RATE_LIMIT_PERIOD,
+        prebuffer_lead=DEFAULT_PREBUFFER_LEAD,
+        prebuffer_max_bytes=DEFAULT_PREBUFFER_MAX_BYTES,
+        loudness_analyzer=None,
+        format_selector=None,
+        profile_dir=DEFAULT_PROFILE_DIR,
+    ):
         self.session_cache = {}
+        self.session_locks = {}
+        # Number of tasks holding or waiting on each session lock
+        self.session_lock_users = {}
         self.bot = bot
+        self.playback_mode = playback_mode
+        self.audio_cache = audio_cache
+        self.loudness_analyzer = loudness_analyzer
+        self.format_selector = format_selector
+        self.profiler = Profiler(profile_dir)
+        self.journal = journal
+        self.paused_timeout = paused_timeout
+        self.idle_timeout = idle_timeout
+        self.empty_channel_timeout = empty_channel_timeout
+        self.disconnected_timeout = disconnected_timeout
+        self.max_sessions = max_sessions
+        self.max_queue_length = max_queue_length
+        self.prebuffer_lead = prebuffer_lead
+        self.prebuffer_max_bytes = prebuffer_max_bytes
+        self.user_rate_limiter = (
+            RateLimiter(user_rate_limit, rate_limit_period)
+            if user_rate_limit is not None
+            else None
+        )
+        self.guild_rate_limiter = (
+            RateLimiter(guild_rate_limit, rate_limit_period)
+            if guild_rate_limit is not None
+            else None
+        )
+        self.tracer = Tracer(slow_threshold=trace_slow_threshold)
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.extractor = (
+            extractor if extractor is not None else Extractor(metrics=self.metrics)
+        )
+        self.handoff_latency = self.metrics.histogram(
+            "guizhong_song_handoff_seconds",
+            "Time between end of a song and start of the next one.",
+        )
+        self.metrics.gauge(
+            "guizhong_active_sessions",
+            "Number of voice channels bot is playing in.",
+            fn=lambda: len(self.session_cache),
+        )
+        self.metrics.gauge(
+            "guizhong_queued_songs",
+            "Number of songs queued across all sessions.",
+            fn=lambda: sum(
+                len(session.queue) for session in self.session_cache.values()
+            ),
+        )
+        self.metrics.gauge(
+            "guizhong_max_queue_depth",
+            "Number of songs queued in the longest queue.",
+            fn=lambda: max(
+                (len(session.queue) for session in self.session_cache.values()),
+                default=0,
+            ),
+        )
+        self.metrics.gauge(
+            "guizhong_ffmpeg_processes",
+            "Number of running ffmpeg processes.",
+            fn=lambda: count_child_processes("ffmpeg"),
+        )
+        if format_selector is not None:
+            self.metrics.gauge(
+                "guizhong_stream_quality_level",
+                "Quality new streams are resolved in, from 0 for best to 2 for lowest.",
+                fn=lambda: format_selector.level,
+            )
 
     async def __get_author_voicechannel(self, ctx):
         """Gets voicechannel caller is in."""
@@ -46,20 +219,328 @@ class Handler:
         voicechannel = voice_state.channel
         return voicechannel
 
-    async def __play_queue(self, voicechannel_id):
-        """Plays songs going down the session queue."""
-        session = self.session_cache[voicechannel_id]
+    @asynccontextmanager
+    async def __session_lock(self, voicechannel_id):
+        """Holds lock that serializes session creation, clean-up and queueing for voicechannel. Lock is forgotten once
+        no one holds or waits on it."""
+        lock = self.session_locks.get(voicechannel_id)
+        if lock is None:
+            lock = self.session_locks[voicechannel_id] = asyncio.Lock()
+        self.session_lock_users[voicechannel_id] = (
+            self.session_lock_users.get(voicechannel_id, 0) + 1
+        )
+        try:
+            async with lock:
+                yield
+        finally:
+            self.session_lock_users[voicechannel_id] -= 1
+            if self.session_lock_users[voicechannel_id] == 0:
+                del self.session_lock_users[voicechannel_id]
+                del self.session_locks[voicechannel_id]
+
+    async def __get_or_create_session(self, voicechannel, trace):
+        """Gets session for voicechannel, connecting to it if there is none. Session lock must be held."""
+        session = self.session_cache.get(voicechannel.id)
+        if session is None:
+            if (
+                self.max_sessions is not None
+                and len(self.session_cache) >= self.max_sessions
+            ):
+                raise SessionLimitError(
+                    f"Already playing in {len(self.session_cache)} voice channels"
+                )
+            with trace.span("voice_connect"):
+                vc = await voicechannel.connect()
+            session = self.session_cache[voicechannel.id] = Session(vc=vc)
+        return session
+
+    def __journal_append(self, voicechannel_id, session, songs):
+        """Records songs queued at the end of session."""
+        if self.journal is None:
+            return
+        self.journal.append(
+            voicechannel_id,
+            session.journal_tail,
+            [song.to_journal_entry() for song in songs],
+        )
+        session.journal_tail += len(songs)
+
+    def __journal_trim(self, voicechannel_id, session):
+        """Forgets songs that have left the front of session queue."""
+        if self.journal is None:
+            return
+        self.journal.trim(voicechannel_id, session.journal_tail - len(session.queue))
+
+    def __select_quality(self, voicechannel_id):
+        """Gets quality streams for voicechannel should be resolved in given how many sessions are playing, including
+        its own, and how much bandwidth their streams take up."""
+        if self.format_selector is None:
+            return QUALITY_HIGH
+        active_ids = {voicechannel_id}
+        bandwidth = 0
+        for session_id, session in self.session_cache.items():
+            if len(session.queue) == 0:
+                continue
+            active_ids.add(session_id)
+            if session.source is not None:
+                bandwidth += get_bitrate(session.queue[0])
+        return self.format_selector.select(len(active_ids), bandwidth)
+
+    async def __prefetch(self, voicechannel_id, song):
+        """Resolves song source URL ahead of playback."""
+        try:
+            await self.extractor.get_source_url(
+                song,
+                group=voicechannel_id,
+                quality=self.__select_quality(voicechannel_id),
+            )
+        except Exception as e:
+            print(f"Error: {e}")
+
+    def __cancel_prefetch(self, session):
+        """Cancels background resolution of upcoming song."""
+        if session.prefetch_task is not None:
+            session.prefetch_task.cancel()
+        session.prefetch_task = None
+        session.prefetch_song = None
+
+    def __prefetch_next_song(self, voicechannel_id, session):
+        """Resolves the next song in the background while the current song plays."""
+        queue = session.queue
+        next_song = queue[1] if len(queue) > 1 else None
+        if next_song is session.prefetch_song:
+            return
+
+        self.__cancel_prefetch(session)
+        if (
+            next_song is None
+            or next_song.has_valid_source_url()
+            or self.__get_cached_audio_path(next_song) is not None
+        ):
+            return
+
+        session.prefetch_song = next_song
+        session.prefetch_task = asyncio.create_task(
+            self.__prefetch(voicechannel_id, next_song)
+        )
+
+    def __discard_prebuffer(self, session):
+        """Stops reading upcoming song ahead, freeing its buffer and ffmpeg process."""
+        if session.prebuffer_task is not None:
+            session.prebuffer_task.cancel()
+        if session.prebuffer_source is not None:
+            session.prebuffer_source.cleanup()
+        session.prebuffer_task = None
+        session.prebuffer_song = None
+        session.prebuffer_source = None
+        session.prebuffer_stderr = None
+
+    def __take_prebuffer(self, session, song):
+        """Gets audio source and error output read ahead for song, if any. Anything read ahead for another song is
+        discarded."""
+        prebuffer = None
+        if session.prebuffer_song is song and session.prebuffer_source is not None:
+            prebuffer = (session.prebuffer_source, session.prebuffer_stderr)
+            session.prebuffer_source = None
+        self.__discard_prebuffer(session)
+        return prebuffer
+
+    def __schedule_prebuffer(self, voicechannel_id, session):
+        """Starts reading the next song into memory shortly before the current song ends."""
+        queue = session.queue
+        next_song = queue[1] if len(queue) > 1 else None
+        if next_song is session.prebuffer_song:
+            return
+
+        self.__discard_prebuffer(session)
+        if (
+            self.prebuffer_lead is None
+            or next_song is None
+            or queue[0].duration is None
+            or session.playing_started_at is None
+        ):
+            return
+
+        # Song may have been started part way through
+        offset = session.source.offset if session.source is not None else 0
+        delay = (
+            session.playing_started_at
+            + queue[0].duration
+            - offset
+            - self.prebuffer_lead
+            - time.perf_counter()
+        )
+        session.prebuffer_song = next_song
+        session.prebuffer_task = asyncio.create_task(
+            self.__prebuffer(voicechannel_id, session, next_song, max(0, delay))
+        )
+
+    async def __prebuffer(self, voicechannel_id, session, song, delay):
+        """Starts ffmpeg for song after delay and reads its audio ahead into a bounded buffer."""
+        await asyncio.sleep(delay)
+        stderr = StderrTail()
+        try:
+            local_path = self.__get_cached_audio_path(song)
+            if local_path is not None:
+                source = discord.FFmpegOpusAudio(
+                    local_path, codec="copy", stderr=stderr
+                )
+            else:
+                source_url = await self.extractor.get_source_url(
+                    song,
+                    group=voicechannel_id,
+                    quality=self.__select_quality(voicechannel_id),
+                )
+                source = self.__create_audio_source(song, source_url, stderr)
+        except Exception as e:
+            # Song is resolved again when it is played
+            print(f"Error: {e}")
+            return
+
+        source = BufferedSource(source, max_bytes=self.prebuffer_max_bytes)
+        source.start()
+        session.prebuffer_source = source
+        session.prebuffer_stderr = stderr
+        session.prebuffer_task = None
+
+    def __get_cached_audio_path(self, song):
+        """Gets path to locally cached audio for song if there is one."""
+        if self.audio_cache is None or song.video_id is None:
+            return None
+        return self.audio_cache.get(song.video_id)
+
+    def __get_ffmpeg_options(self, offset, is_local=False):
+        """Gets ffmpeg options for starting audio at offset in seconds. Local files are not given reconnect options,
+        which only exist for URLs."""
+        options = {} if is_local else FFMPEG_OPTIONS
+        if offset <= 0:
+            return options
+        # Seeking on the input side lets ffmpeg jump there with a range request instead of decoding up to it
+        before_options = f"-ss {offset:.2f}"
+        if not is_local:
+            before_options += f" {FFMPEG_OPTIONS['before_options']}"
+        return {**options, "before_options": before_options}
+
+    def __is_decoded(self, song):
+        """Checks if song is decoded when played, which is when gain can be applied to it."""
+        if self.__get_cached_audio_path(song) is not None:
+            return False
+        return self.playback_mode != PLAYBACK_MODE_PASSTHROUGH or not song.is_opus()
+
+    def __create_audio_source(self, song, source_url, stderr, offset=0):
+        """Creates audio source for song starting at offset in seconds. Opus streams are passed through without
+        re-encoding when possible. Decoded songs are brought to target loudness."""
+        options = self.__get_ffmpeg_options(offset)
+        if self.playback_mode == PLAYBACK_MODE_PASSTHROUGH and song.is_opus():
+            return discord.FFmpegOpusAudio(
+                source_url, codec="copy", stderr=stderr, **options
+            )
+
+        gain = (
+            self.loudness_analyzer.get_gain(song)
+            if self.loudness_analyzer is not None
+            else None
+        )
+        if gain is not None:
+            options = {
+                **options,
+                "options": f"{options['options']} -af volume={gain:.1f}dB",
+            }
+        return discord.FFmpegPCMAudio(source_url, stderr=stderr, **options)
+
+    def __get_resume_offset(self, session, song, is_forbidden):
+        """Gets position current song should be restarted at once it has stopped. Returns None if the next song should
+        be played instead."""
+        if session.source is None:
+            # Song never started playing, such as when it could not be resolved
+            return None
+        position = session.source.position
+        if session.seek_offset is not None:
+            offset = session.seek_offset
+            session.seek_offset = None
+            return offset
+        if session.is_stopping:
+            return None
+        if is_forbidden:
+            return position
+        if (
+            song.duration is not None
+            and position < song.duration - RESUME_MARGIN
+            and session.n_resumes < MAX_RESUMES
+        ):
+            print(f"{song} stopped early at {position:.1f}s, resuming")
+            session.n_resumes += 1
+            return position
+        return None
+
+    async def __finish_song(self, voicechannel_id, session, song, e, stderr, is_retry):
+        """Moves on to the next song once song has stopped, or restarts song if it was cut off."""
+        retry = e is not None and not is_retry and stderr.is_forbidden()
+        if retry:
+            # Stream URL was rejected, so resolve a new one and carry on from the same position
+            song.invalidate_source_url()
+        resume_offset = self.__get_resume_offset(session, song, retry)
+        session.source = None
+        session.is_stopping = False
+        if resume_offset is None:
+            # Queue may have been cleared while song was stopping
+            queue = session.queue
+            if len(queue) > 0 and queue[0] is song:
+                queue.popleft()
+            session.n_resumes = 0
+            # Only time taken to move on to the next song counts as handoff, not seeks and resumes
+            session.handoff_started_at = time.perf_counter()
+        await self.__play_queue(
+            voicechannel_id, is_retry=retry, offset=resume_offset or 0
+        )
+
+    async def __wait_for_connection(self, vc):
+        """Waits for voice client to reconnect. Returns False if it is still disconnected after the timeout."""
+        deadline = time.monotonic() + self.disconnected_timeout
+        while not vc.is_connected():
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(RECONNECT_POLL_INTERVAL)
+        return True
+
+    async def __play_queue(self, voicechannel_id, is_retry=False, offset=0):
+        """Plays songs going down the session queue, starting the song at the head at offset in seconds."""
+        session = self.session_cache.get(voicechannel_id)
+        if session is None:
+            # Session was ended while song was finishing
+            return
         vc = session.vc
         queue = session.queue
+        self.__journal_trim(voicechannel_id, session)
 
         if len(queue) > 0:
+            # Audio player gives up on a song while voice reconnects, so playing waits for the connection to be back
+            if not await self.__wait_for_connection(vc):
+                print(f"Error: voice connection in {voicechannel_id} did not come back")
+                await self.__reap_session(voicechannel_id, session, "disconnected")
+                return
+            if self.session_cache.get(voicechannel_id) is not session:
+                return
+            if session.queue is not queue:
+                # Queue was cleared while waiting, so session is cleaned up instead
+                await self.__play_queue(voicechannel_id)
+                return
+
             # Play next song in the queue
             song = queue[0]
+            stderr = StderrTail()
+            session.playing_started_at = None
+
+            # Continue trace of request that queued song if it is played right away
+            trace = song.trace
+            song.trace = None
 
             def post_play(e):
-                queue.pop(0)
+                # Runs on the audio player thread, so the queue is left to be changed on the event loop
                 fut = session.play_music_task = asyncio.run_coroutine_threadsafe(
-                    self.__play_queue(voicechannel_id),
+                    self.__finish_song(
+                        voicechannel_id, session, song, e, stderr, is_retry
+                    ),
                     self.bot.loop,
                 )
                 try:
@@ -69,17 +550,152 @@ class Handler:
 
             vc.stop()
 
-            # Taken from: https://stackoverflow.com/questions/75680967/using-yt-dlp-in-discord-py-to-play-a-song
-            source_url = song.get_source_url()
-            source = discord.FFmpegPCMAudio(source_url, **FFMPEG_OPTIONS)
-            vc.play(source, after=post_play)
+            # Next song may already be playing into memory
+            source = None
+            prebuffer = self.__take_prebuffer(session, song)
+            if prebuffer is not None:
+                source, stderr = prebuffer
+
+            # Wait on song being resolved in the background instead of resolving it again
+            prefetch_task = None
+            if session.prefetch_song is song:
+                prefetch_task = session.prefetch_task
+                session.prefetch_task = None
+                session.prefetch_song = None
+            self.__cancel_prefetch(session)
+            if prefetch_task is not None and source is None:
+                with trace.span("wait_prefetch") if trace else nullcontext():
+                    await prefetch_task
+
+            local_path = self.__get_cached_audio_path(song)
+            if source is not None:
+                if trace:
+                    trace.add_span(
+                        "prebuffered", time.perf_counter(), time.perf_counter()
+                    )
+            elif local_path is not None:
+                # Cached audio is already Opus so it can be played as is
+                with trace.span("ffmpeg_spawn", local=True) if trace else nullcontext():
+                    source = discord.FFmpegOpusAudio(
+                        local_path,
+                        codec="copy",
+                        stderr=stderr,
+                        **self.__get_ffmpeg_options(offset, is_local=True),
+                    )
+            else:
+                # Taken from: https://stackoverflow.com/questions/75680967/using-yt-dlp-in-discord-py-to-play-a-song
+                try:
+                    with (
+                        trace.span("get_source_url", reused=song.has_valid_source_url())
+                        if trace
+                        else nullcontext()
+                    ):
+                        source_url = await self.extractor.get_source_url(
+                            song,
+                            group=voicechannel_id,
+                            quality=self.__select_quality(voicechannel_id),
+                        )
+                except CircuitOpenError as e:
+                    # Hold song at the head of the queue until Youtube recovers instead of skipping every song
+                    print(f"Error: {e}")
+                    if trace:
+                        trace.finish(error=type(e).__name__)
+                    await asyncio.sleep(self.extractor.circuit_breaker.reset_timeout)
+                    if self.session_cache.get(voicechannel_id) is session:
+                        session.play_music_task = asyncio.create_task(
+                            self.__play_queue(voicechannel_id, offset=offset)
+                        )
+                    return
+                except Exception as e:
+                    # Skip song that could not be resolved and move on to the next one
+                    print(f"Error: {e}")
+                    if trace:
+                        trace.finish(error=type(e).__name__)
+                    post_play(e)
+                    return
+                with (
+                    trace.span("ffmpeg_spawn", local=False) if trace else nullcontext()
+                ):
+                    source = self.__create_audio_source(
+                        song, source_url, stderr, offset
+                    )
+
+            source = session.source = PositionSource(source, offset)
+            if trace:
+                play_started_at = time.perf_counter()
+
+                def on_first_packet():
+                    trace.add_span("first_packet", play_started_at, time.perf_counter())
+                    trace.finish()
+
+                source = FirstPacketSource(source, on_first_packet)
+            try:
+                vc.play(source, after=post_play)
+            except discord.ClientException as e:
+                # Connection was lost while song was being prepared
+                print(f"Error: {e}")
+                source.cleanup()
+                session.source = None
+                if trace:
+                    trace.finish(error=type(e).__name__)
+                # Song is tried again once voice reconnects, or left for the next request if voice is somehow up
+                session.play_music_task = (
+                    asyncio.create_task(
+                        self.__play_queue(voicechannel_id, offset=offset)
+                    )
+                    if not vc.is_connected()
+                    else None
+                )
+                return
+            session.playing_started_at = time.perf_counter()
+
+            if self.audio_cache is not None and song.video_id is not None:
+                self.audio_cache.record_play(song.video_id)
+            # Song is measured on first play so later plays can be normalized
+            if self.loudness_analyzer is not None and self.__is_decoded(song):
+                self.loudness_analyzer.request(song, song.source_url)
+
+            if session.handoff_started_at is not None:
+                self.handoff_latency.observe(
+                    time.perf_counter() - session.handoff_started_at
+                )
+                session.handoff_started_at = None
+
+            self.__prefetch_next_song(voicechannel_id, session)
+            self.__schedule_prebuffer(voicechannel_id, session)
         else:
             # No songs left in queue, clean up session and leave voice channel
-            del self.session_cache[voicechannel_id]
-            await vc.disconnect()
+            async with self.__session_lock(voicechannel_id):
+                if len(session.queue) > 0:
+                    # Songs were queued while waiting to clean up
+                    session.play_music_task = asyncio.create_task(
+                        self.__play_queue(voicechannel_id)
+                    )
+                    return
+                self.__cancel_prefetch(session)
+                self.__discard_prebuffer(session)
+                del self.session_cache[voicechannel_id]
+                if self.journal is not None:
+                    self.journal.delete(voicechannel_id)
+                await vc.disconnect()
+
+    async def info(self, ctx, *args):
+        """Provides info on current queue bot is playing, one page of songs at a time."""
+        page = 1
+        if len(args) == 1:
+            try:
+                page = int(args[0])
+            except ValueError:
+                await ctx.send(INVALID_PAGE_FOR_INFO_MESSAGE)
+                return
+        elif len(args) > 1:
+            await ctx.send(INVALID_PAGE_FOR_INFO_MESSAGE)
+            return
+
+        if page <= 0:
+            await ctx.send(INVALID_PAGE_FOR_INFO_MESSAGE)
+            return
 
-    async def info(self, ctx):
-        """Provides info on current queue bot is playing."""
         voicechannel = await self.__get_author_voicechannel(ctx)
         if voicechannel is None:
             await ctx.send(AUTHOR_NOT_IN_VOICE_CHANNEL_MESSAGE)
@@ -96,61 +712,401 @@ class Handler:
             await ctx.send("```\nNot playing\n```")
             return
 
+        # Only songs on the requested page are rendered, so long queues stay cheap to display
+        n_pages = (len(queue) - 1) // MAX_SONG_INFOS_TO_DISPLAY + 1
+        page = min(page, n_pages)
+        start = (page - 1) * MAX_SONG_INFOS_TO_DISPLAY
+        songs = queue.window(start, start + MAX_SONG_INFOS_TO_DISPLAY)
+
+        total_length = format_duration(queue.total_duration)
+        if queue.n_unknown_durations > 0:
+            total_length += "+"
+
         current_song = queue[0]
         await ctx.send(
             "```\n"
-            + f"Now playing: {current_song.title} [{current_song.duration}s]\n\n"
-            + "Queue:\n"
-            + "\n".join(
-                [f"{i+1}: {song.title}" for i, song in enumerate(queue)][
-                    :MAX_SONG_INFOS_TO_DISPLAY
-                ]
-            )
+            + f"Now playing: {current_song.title} [{current_song.duration}s]\n"
+            + f"Format: {self.__describe_format(current_song)}\n\n"
+            + f"Queue ({len(queue)} songs, {total_length} total, page {page}/{n_pages}):\n"
+            + "\n".join(f"{start+i+1}: {song.title}" for i, song in enumerate(songs))
             + "\n```"
         )
 
+    def __describe_format(self, song):
+        """Describes audio format of song stream and the quality it was picked for."""
+        format_info = song.format_info
+        parts = [format_info.get("acodec") or "unknown codec"]
+        if format_info.get("abr"):
+            parts.append(f"{format_info['abr']:.0f}kbps")
+        parts.append(f"{song.get_quality()} quality")
+        return ", ".join(parts)
+
+    def __start_playing(self, voicechannel_id, session):
+        """Starts a new music task if nothing is playing."""
+        if session.play_music_task is None:
+            session.play_music_task = asyncio.create_task(
+                self.__play_queue(voicechannel_id)
+            )
+        else:
+            self.__prefetch_next_song(voicechannel_id, session)
+            self.__schedule_prebuffer(voicechannel_id, session)
+
+    def __count_rejection(self, reason):
+        self.metrics.counter(
+            "guizhong_rejected_requests_total",
+            "Play requests rejected because of resource limits.",
+            labels={"reason": reason},
+        ).inc()
+
+    def __get_rate_limiters(self, ctx):
+        """Gets rate limiters that apply to request, along with key, message and kind of each."""
+        limits = [
+            (self.user_rate_limiter, ctx.author.id, USER_RATE_LIMITED_MESSAGE, "user"),
+            (
+                self.guild_rate_limiter,
+                ctx.guild.id,
+                GUILD_RATE_LIMITED_MESSAGE,
+                "guild",
+            ),
+        ]
+        return [limit for limit in limits if limit[0] is not None]
+
+    async def __check_rate_limits(self, ctx, cost):
+        """Takes cost of request from rate limits of user and guild. Returns False after telling user if either
+        limit is exceeded."""
+        limits = self.__get_rate_limiters(ctx)
+        for limiter, key, message, kind in limits:
+            retry_after = limiter.retry_after(key, cost)
+            if retry_after > 0:
+                print(f"Error: {kind} {key} is rate limited for {retry_after:.1f}s")
+                self.__count_rejection(f"{kind}_rate_limited")
+                await ctx.send(message.format(math.ceil(retry_after)))
+                return False
+        # Only take from limits once request is within all of them
+        for limiter, key, _, _ in limits:
+            limiter.take(key, cost)
+        return True
+
+    def __refund_rate_limits(self, ctx, cost):
+        """Gives cost of request turned away by the bot back to rate limits of user and guild."""
+        for limiter, key, _, _ in self.__get_rate_limiters(ctx):
+            limiter.give_back(key, cost)
+
+    def __get_queue_capacity(self, session):
+        """Gets number of songs that can still be added to session queue."""
+        if self.max_queue_length is None:
+            return None
+        queued = len(session.queue) if session is not None else 0
+        return max(0, self.max_queue_length - queued)
+
+    def __check_queue_length(self, session):
+        """Raises if no more songs can be added to session queue."""
+        if self.__get_queue_capacity(session) == 0:
+            raise QueueFullError(f"Queue already has {self.max_queue_length} songs")
+
+    async def __queue_song(self, ctx, voicechannel, video_id, trace):
+        """Extracts and queues a single song. Returns True if trace was handed off to song playing right away."""
+        self.__check_queue_length(self.session_cache.get(voicechannel.id))
+        with trace.span("extract_song", video_id=video_id):
+            song = await self.extractor.extract_song(
+                video_id,
+                group=voicechannel.id,
+                quality=self.__select_quality(voicechannel.id),
+            )
+        return await self.__add_song(ctx, voicechannel, song, trace)
+
+    async def __queue_search(self, ctx, voicechannel, query, trace):
+        """Searches for and queues a single song. Returns True if trace was handed off to song playing right away."""
+        self.__check_queue_length(self.session_cache.get(voicechannel.id))
+        with trace.span("search"):
+            song = await self.extractor.search(
+                query,
+                group=voicechannel.id,
+                quality=self.__select_quality(voicechannel.id),
+            )
+        return await self.__add_song(ctx, voicechannel, song, trace)
+
+    async def __add_song(self, ctx, voicechannel, song, trace):
+        """Adds song to the end of the queue. Returns True if trace was handed off to song playing right away."""
+        async with self.__session_lock(voicechannel.id):
+            # Session may have ended while song was being extracted
+            session = await self.__get_or_create_session(voicechannel, trace)
+            self.__check_queue_length(session)
+            handed_off = len(session.queue) == 0
+            if handed_off:
+                song.trace = trace
+            song.requester = ctx.author.id
+            session.queue.append(song)
+            self.__journal_append(voicechannel.id, session, [song])
+            self.__start_playing(voicechannel.id, session)
+        print(f"Added {song} to queue")
+        await ctx.send(f"Successfully queued {song.title}!")
+        return handed_off
+
+    async def __queue_playlist(self, ctx, voicechannel, playlist_id, trace):
+        """Queues songs from playlist as they are enumerated. Songs are resolved once they near the head of the queue.
+        Returns True if trace was handed off to song playing right away."""
+        self.__check_queue_length(self.session_cache.get(voicechannel.id))
+        session = None
+        queue = None
+        n_queued = 0
+        handed_off = False
+        is_full = False
+        page_started_at = time.perf_counter()
+        async for songs in self.extractor.iter_playlist(
+            playlist_id, group=voicechannel.id
+        ):
+            async with self.__session_lock(voicechannel.id):
+                if session is None:
+                    trace.add_span(
+                        "extract_playlist_page",
+                        page_started_at,
+                        time.perf_counter(),
+                        playlist_id=playlist_id,
+                    )
+                    session = await self.__get_or_create_session(voicechannel, trace)
+                    queue = session.queue
+                elif (
+                    self.session_cache.get(voicechannel.id) is not session
+                    or session.queue is not queue
+                ):
+                    # Stop enumerating if session was stopped in the meantime
+                    return handed_off
+                if n_queued == 0:
+                    self.__check_queue_length(session)
+                capacity = self.__get_queue_capacity(session)
+                if capacity is not None and len(songs) >= capacity:
+                    songs = songs[:capacity]
+                    is_full = True
+                if len(queue) == 0 and not handed_off:
+                    songs[0].trace = trace
+                    handed_off = True
+                for song in songs:
+                    song.requester = ctx.author.id
+                queue.extend(songs)
+                self.__journal_append(voicechannel.id, session, songs)
+                n_queued += len(songs)
+                self.__start_playing(voicechannel.id, session)
+            if is_full:
+                break
+        print(f"Added {n_queued} songs from playlist {playlist_id} to queue")
+        if is_full:
+            await ctx.send(
+                f"Queue is full. Only queued the first {n_queued} songs from playlist."
+            )
+        else:
+            await ctx.send(f"Successfully queued {n_queued} songs from playlist!")
+        return handed_off
+
     async def play(self, ctx, *args):
-        """Downloads and plays song in argument. If bot is not in call, bot will join call."""
+        """Downloads and plays songs and playlists in arguments. If bot is not in call, bot will join call."""
         if not args:
             await ctx.send(INVALID_ARGS_FOR_PLAY_MESSAGE)
             return
-        if len(args) != 1:
-            await ctx.send(INVALID_ARGS_FOR_PLAY_MESSAGE)
-            return
 
         voicechannel = await self.__get_author_voicechannel(ctx)
         if voicechannel is None:
             await ctx.send(AUTHOR_NOT_IN_VOICE_CHANNEL_MESSAGE)
             return
 
-        # Connect or get voice client
-        if voicechannel.id not in self.session_cache:
-            vc = await voicechannel.connect()
-            self.session_cache[voicechannel.id] = Session(vc=vc)
+        # Arguments are searched for together unless URLs are given
+        is_search = not any(is_url(arg) for arg in args)
+        queries = [" ".join(args)] if is_search else args
 
-        session = self.session_cache[voicechannel.id]
-        queue = session.queue
+        # Turn request away rather than have it wait behind a long line of extractions. Checked before rate limits
+        # so user is not charged for it.
+        if self.extractor.is_busy():
+            print("Error: too many extractions waiting")
+            self.__count_rejection("extractor_busy")
+            await ctx.send(EXTRACTOR_BUSY_MESSAGE)
+            return
+
+        if not await self.__check_rate_limits(ctx, len(queries)):
+            return
 
-        # Extract and queue song
-        url = args[0]
-        video_id = None
+        trace = self.tracer.start("play", voicechannel_id=voicechannel.id)
+        handed_off = False
+
+        # Connect or get voice client while songs have yet to be extracted
         try:
-            video_id = parse_youtube_video_url(url)
-            song = Song.extract_song(video_id)
-            queue.append(song)
-            print(f"Added {song} to queue")
-            await ctx.send(f"Successfully queued {song.title}!")
-        except InvalidSongURLError:
-            await ctx.send(INVALID_YOUTUBE_URL_FOR_PLAY_MESSAGE)
-        except Exception as e:
+            async with self.__session_lock(voicechannel.id):
+                await self.__get_or_create_session(voicechannel, trace)
+        except SessionLimitError as e:
             print(f"Error: {e}")
-            await ctx.send(GENERAL_ERROR_FOR_PLAY_MESSAGE)
-        finally:
-            # Start a new music task if nothing is playing
-            if session.play_music_task is None:
-                session.play_music_task = asyncio.create_task(
-                    self.__play_queue(voicechannel.id)
-                )
+            self.__count_rejection("too_many_sessions")
+            self.__refund_rate_limits(ctx, len(queries))
+            trace.finish(error=type(e).__name__)
+            await ctx.send(TOO_MANY_SESSIONS_MESSAGE)
+            return
+
+        # Extract and queue songs in the order they were provided
+        for url in queries:
+            try:
+                if is_search:
+                    handed_off |= await self.__queue_search(
+                        ctx, voicechannel, url, trace
+                    )
+                    continue
+                with trace.span("parse_url"):
+                    try:
+                        video_id = parse_youtube_video_url(url)
+                        playlist_id = None
+                    except InvalidSongURLError:
+                        playlist_id = parse_youtube_playlist_url(url)
+                if playlist_id is not None:
+                    handed_off |= await self.__queue_playlist(
+                        ctx, voicechannel, playlist_id, trace
+                    )
+                else:
+                    handed_off |= await self.__queue_song(
+                        ctx, voicechannel, video_id, trace
+                    )
+            except InvalidSongURLError:
+                await ctx.send(INVALID_YOUTUBE_URL_FOR_PLAY_MESSAGE)
+            except NoSearchResultsError as e:
+                print(f"Error: {e}")
+                await ctx.send(NO_SEARCH_RESULTS_MESSAGE)
+            except QueueFullError as e:
+                print(f"Error: {e}")
+                self.__count_rejection("queue_full")
+                await ctx.send(QUEUE_FULL_MESSAGE)
+                break
+            except SessionLimitError as e:
+                print(f"Error: {e}")
+                self.__count_rejection("too_many_sessions")
+                await ctx.send(TOO_MANY_SESSIONS_MESSAGE)
+                break
+            except CircuitOpenError as e:
+                print(f"Error: {e}")
+                self.__count_rejection("circuit_open")
+                await ctx.send(YOUTUBE_UNAVAILABLE_MESSAGE)
+                break
+            except ExtractionTimeoutError as e:
+                print(f"Error: {e}")
+                await ctx.send(EXTRACTION_TIMEOUT_FOR_PLAY_MESSAGE)
+            except Exception as e:
+                print(f"Error: {e}")
+                await ctx.send(GENERAL_ERROR_FOR_PLAY_MESSAGE)
+
+        # Start music task even if nothing was queued so an unused session is cleaned up
+        async with self.__session_lock(voicechannel.id):
+            session = self.session_cache.get(voicechannel.id)
+            if session is not None:
+                self.__start_playing(voicechannel.id, session)
+
+        # Songs queued behind others finish their trace once they are queued
+        if not handed_off:
+            trace.finish()
+
+    async def __restore_session(self, voicechannel_id, entries):
+        voicechannel = self.bot.get_channel(voicechannel_id)
+        if voicechannel is None:
+            print(f"Dropping saved session for unknown voice channel {voicechannel_id}")
+            self.journal.delete(voicechannel_id)
+            return
+
+        async with self.__session_lock(voicechannel_id):
+            if voicechannel_id in self.session_cache:
+                return
+            try:
+                vc = await voicechannel.connect()
+            except Exception as e:
+                print(f"Error: {e}")
+                self.journal.delete(voicechannel_id)
+                return
+
+            # Songs are only resolved once they near the head of the queue
+            session = Session(vc=vc)
+            session.queue.extend(Song.from_journal_entry(entry) for _, entry in entries)
+            session.journal_tail = entries[-1][0] + 1
+            self.session_cache[voicechannel_id] = session
+            self.__start_playing(voicechannel_id, session)
+        print(f"Restored {len(entries)} songs in voice channel {voicechannel_id}")
+
+    async def restore_sessions(self):
+        """Rejoins voice channels and resumes queues from the session journal, starting at the song that was playing."""
+        if self.journal is None:
+            return
+        await asyncio.gather(
+            *[
+                self.__restore_session(voicechannel_id, entries)
+                for voicechannel_id, entries in self.journal.load().items()
+            ]
+        )
+
+    def __get_reap_reason(self, session, now):
+        """Gets reason session should be ended, updating how long it has been paused, idle, alone or disconnected."""
+        vc = session.vc
+        is_paused = vc.is_paused()
+        is_idle = not is_paused and not vc.is_playing()
+        is_empty = not any(not member.bot for member in vc.channel.members)
+        # Voice client reports being disconnected while it reconnects, so it is given time to come back
+        is_disconnected = not vc.is_connected()
+
+        session.paused_since = (session.paused_since or now) if is_paused else None
+        session.idle_since = (session.idle_since or now) if is_idle else None
+        session.empty_since = (session.empty_since or now) if is_empty else None
+        session.disconnected_since = (
+            (session.disconnected_since or now) if is_disconnected else None
+        )
+
+        if (
+            session.disconnected_since is not None
+            and now - session.disconnected_since >= self.disconnected_timeout
+        ):
+            return "disconnected"
+        if (
+            session.empty_since is not None
+            and now - session.empty_since >= self.empty_channel_timeout
+        ):
+            return "empty_channel"
+        if (
+            session.paused_since is not None
+            and now - session.paused_since >= self.paused_timeout
+        ):
+            return "paused"
+        if (
+            session.idle_since is not None
+            and now - session.idle_since >= self.idle_timeout
+        ):
+            return "idle"
+        return None
+
+    async def __reap_session(self, voicechannel_id, session, reason):
+        """Ends session, freeing its queue, ffmpeg process and voice connection."""
+        async with self.__session_lock(voicechannel_id):
+            if self.session_cache.get(voicechannel_id) is not session:
+                return
+            self.__cancel_prefetch(session)
+            self.__discard_prebuffer(session)
+            session.queue = SongQueue()
+            del self.session_cache[voicechannel_id]
+            if self.journal is not None:
+                self.journal.delete(voicechannel_id)
+            await session.vc.disconnect(force=True)
+        self.metrics.counter(
+            "guizhong_sessions_reaped_total",
+            "Sessions ended for being paused, idle or alone for too long.",
+            labels={"reason": reason},
+        ).inc()
+        print(f"Ended session in voice channel {voicechannel_id}: {reason}")
+
+    async def reap_sessions(self):
+        """Ends sessions that have been paused, idle or alone in their voice channel for too long."""
+        now = time.monotonic()
+        for voicechannel_id, session in list(self.session_cache.items()):
+            try:
+                reason = self.__get_reap_reason(session, now)
+                if reason is not None:
+                    await self.__reap_session(voicechannel_id, session, reason)
+            except Exception as e:
+                print(f"Error: {e}")
+
+    async def run_reaper(self, interval=DEFAULT_REAP_INTERVAL):
+        """Continuously ends sessions that are no longer in use."""
+        while True:
+            await asyncio.sleep(interval)
+            await self.reap_sessions()
 
     async def pause(self, ctx):
         """Pauses current song."""
@@ -184,6 +1140,41 @@ class Handler:
 
         vc.resume()
 
+    async def seek(self, ctx, *args):
+        """Moves current song to position."""
+        if len(args) != 1:
+            await ctx.send(INVALID_POSITION_FOR_SEEK_MESSAGE)
+            return
+        try:
+            offset = parse_timestamp(args[0])
+        except ValueError as e:
+            await ctx.send(INVALID_POSITION_FOR_SEEK_MESSAGE)
+            return
+
+        voicechannel = await self.__get_author_voicechannel(ctx)
+        if voicechannel is None:
+            await ctx.send(AUTHOR_NOT_IN_VOICE_CHANNEL_MESSAGE)
+            return
+
+        if voicechannel.id not in self.session_cache:
+            await ctx.send(NO_SESSION_FOUND_MESSAGE)
+            return
+
+        session = self.session_cache[voicechannel.id]
+        if session.source is None or len(session.queue) == 0:
+            await ctx.send(NOTHING_PLAYING_MESSAGE)
+            return
+
+        song = session.queue[0]
+        if song.duration is not None and offset >= song.duration:
+            await ctx.send(POSITION_PAST_END_MESSAGE)
+            return
+
+        # Stopping current stream will trigger after callback and restart song at offset using its known stream URL
+        session.seek_offset = offset
+        session.vc.stop()
+        await ctx.send(f"Seeking to {format_duration(offset)}.")
+
     async def skip(self, ctx, *args):
         """Skips current song in queue."""
 
@@ -219,9 +1210,10 @@ class Handler:
         queue = session.queue
 
         # Remove n-1 next songs
-        del queue[1:n_skip]
+        queue.remove_range(1, n_skip)
 
         # Stopping current stream will trigger after callback and queue up next song
+        session.is_stopping = True
         vc.stop()
 
     async def stop(self, ctx):
@@ -238,5 +1230,71 @@ class Handler:
         session = self.session_cache[voicechannel.id]
 
         # Clear queue and stop voice client to force session clean-up
-        session.queue = []
+        self.__cancel_prefetch(session)
+        self.__discard_prebuffer(session)
+        session.queue = SongQueue()
+        session.is_stopping = True
         session.vc.stop()
+
+    async def profile(self, ctx, *args):
+        """Starts or stops sampling CPU profile of the event loop."""
+        if len(args) != 1 or args[0] not in ["start", "stop"]:
+            await ctx.send(INVALID_ARGS_FOR_PROFILE_MESSAGE)
+            return
+
+        if args[0] == "start":
+            if self.profiler.start_cpu_profile():
+                await ctx.send("Started CPU profile.")
+            else:
+                await ctx.send("CPU profile is already running.")
+            return
+
+        path = self.profiler.stop_cpu_profile()
+        if path is None:
+            await ctx.send("CPU profile is not running.")
+            return
+        await ctx.send(f"Wrote CPU profile to {path}.")
+
+    async def memory(self, ctx, *args):
+        """Takes memory snapshot, or stops tracing memory allocations."""
+        if len(args) == 1 and args[0] == "stop":
+            if self.profiler.stop_memory_tracing():
+                await ctx.send("Stopped tracing memory.")
+            else:
+                await ctx.send("Memory is not being traced.")
+            return
+        if len(args) > 0:
+            await ctx.send(INVALID_ARGS_FOR_MEMORY_MESSAGE)
+            return
+
+        # Comparing snapshots can take a while, so it is kept off the event loop
+        path = await asyncio.get_running_loop().run_in_executor(
+            None, self.profiler.take_memory_snapshot
+        )
+        await ctx.send(f"Wrote memory snapshot to {path}.")
+
+    async def dump_sessions(self, ctx):
+        """Writes memory taken up by each session."""
+        # Sessions are walked on the event loop so they do not change while being measured
+        path = self.profiler.write_session_memory(self.session_cache)
+        await ctx.send(f"Wrote session memory to {path}.")
+
+    async def dump_tasks(self, ctx):
+        """Writes running tasks and ffmpeg processes."""
+        path = self.profiler.write_tasks()
+        await ctx.send(f"Wrote tasks to {path}.")
+
+    async def purge_cache(self, ctx):
+        """Clears song metadata and search caches."""
+        cache = self.extractor.cache
+        if cache is None:
+            await ctx.send(NO_CACHE_CONFIGURED_MESSAGE)
+            return
+
+        n_purged = cache.purge()
+        message = f"Purged {n_purged} cached songs. Cache had {cache.hits} hits and {cache.misses} misses."
+        search_cache = self.extractor.search_cache
+        if search_cache is not None:
+            n_purged = search_cache.purge()
+            message += f" Purged {n_purged} cached searches."
+        await ctx.send(message)
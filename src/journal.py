@@ -0,0 +1,104 @@
+import concurrent.futures
+import json
+import sqlite3
+import threading
+import time
+
+
+class SessionJournal:
+    """Queued songs of each session by voice channel id, backed by a SQLite file so sessions survive restarts.
+
+    Songs are only ever added to the end of a queue and removed from the front, so each song is stored once
+    under its position in the session and played songs are trimmed off by position."""
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS queued_songs ("
+            "voicechannel_id INTEGER NOT NULL, position INTEGER NOT NULL, entry TEXT NOT NULL, "
+            "queued_at REAL NOT NULL, PRIMARY KEY (voicechannel_id, position))"
+        )
+        self.db.commit()
+        # Writes are applied in order on a background thread, with writes made in the meantime committed together
+        self.pending = []
+        self.pending_lock = threading.Lock()
+        self.is_write_scheduled = False
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="journal"
+        )
+
+    def __write(self, statement, rows):
+        """Queues statement to be run for each of rows on the background thread."""
+        with self.pending_lock:
+            self.pending.append((statement, rows))
+            if self.is_write_scheduled:
+                return
+            self.is_write_scheduled = True
+        self.executor.submit(self.__apply_pending)
+
+    def __apply_pending(self):
+        with self.pending_lock:
+            pending = self.pending
+            self.pending = []
+            self.is_write_scheduled = False
+        if len(pending) == 0:
+            return
+        try:
+            with self.lock:
+                for statement, rows in pending:
+                    self.db.executemany(statement, rows)
+                self.db.commit()
+        except Exception as e:
+            print(f"Error: {e}")
+
+    def flush(self):
+        """Waits on queued writes to be committed."""
+        self.executor.submit(self.__apply_pending).result()
+
+    def append(self, voicechannel_id, position, entries):
+        """Stores entries queued at the end of session, starting at given position."""
+        queued_at = time.time()
+        self.__write(
+            "INSERT OR REPLACE INTO queued_songs (voicechannel_id, position, entry, queued_at) "
+            "VALUES (?, ?, ?, ?)",
+            [
+                (voicechannel_id, position + i, json.dumps(entry), queued_at)
+                for i, entry in enumerate(entries)
+            ],
+        )
+
+    def trim(self, voicechannel_id, head_position):
+        """Removes entries before given position from session."""
+        self.__write(
+            "DELETE FROM queued_songs WHERE voicechannel_id = ? AND position < ?",
+            [(voicechannel_id, head_position)],
+        )
+
+    def delete(self, voicechannel_id):
+        """Removes all entries of session."""
+        self.__write(
+            "DELETE FROM queued_songs WHERE voicechannel_id = ?",
+            [(voicechannel_id,)],
+        )
+
+    def load(self):
+        """Gets stored sessions as lists of (position, entry) in queue order by voice channel id."""
+        self.flush()
+        sessions = {}
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT voicechannel_id, position, entry FROM queued_songs "
+                "ORDER BY voicechannel_id, position"
+            ).fetchall()
+        for voicechannel_id, position, entry in rows:
+            sessions.setdefault(voicechannel_id, []).append(
+                (position, json.loads(entry))
+            )
+        return sessions
+
+    def close(self):
+        self.flush()
+        self.executor.shutdown()
+        with self.lock:
+            self.db.close()
@@ -0,0 +1,111 @@
+import concurrent.futures
+import re
+import subprocess
+import threading
+
+DEFAULT_TARGET_LOUDNESS = -16
+DEFAULT_MAX_GAIN = 12
+# Seconds of audio measured at most, so long videos do not tie up the analyzer
+DEFAULT_MAX_ANALYSIS_SECONDS = 600
+ANALYSIS_TIMEOUT = 300
+# Songs waiting to be measured at most, so a burst of new songs does not pile up behind the analyzer
+DEFAULT_MAX_PENDING_ANALYSES = 20
+# Gain too small to be heard is not applied
+MIN_GAIN = 0.5
+
+
+def parse_integrated_loudness(output):
+    """Parses integrated loudness in LUFS from summary printed by ffmpeg ebur128 filter. Returns None if missing."""
+    matches = re.findall(r"I:\s+(-?\d+(?:\.\d+)?) LUFS", output)
+    if len(matches) == 0:
+        return None
+    loudness = float(matches[-1])
+    # Silence is reported as -70 LUFS, which is not worth correcting for
+    return loudness if loudness > -70 else None
+
+
+class LoudnessAnalyzer:
+    """Measures integrated loudness of songs once in the background so playback can apply a static gain."""
+
+    def __init__(
+        self,
+        cache=None,
+        target=DEFAULT_TARGET_LOUDNESS,
+        max_gain=DEFAULT_MAX_GAIN,
+        max_seconds=DEFAULT_MAX_ANALYSIS_SECONDS,
+        max_pending=DEFAULT_MAX_PENDING_ANALYSES,
+    ):
+        self.cache = cache
+        self.target = target
+        self.max_gain = max_gain
+        self.max_seconds = max_seconds
+        self.max_pending = max_pending
+        self.analyzing = set()
+        self.lock = threading.Lock()
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="loudness"
+        )
+
+    def get_gain(self, song):
+        """Gets gain in dB that brings song to target loudness. Returns None if song is not measured yet or is
+        already close enough."""
+        if song.loudness is None:
+            return None
+        gain = max(-self.max_gain, min(self.max_gain, self.target - song.loudness))
+        return gain if abs(gain) >= MIN_GAIN else None
+
+    def request(self, song, path):
+        """Measures song from local path or source URL in the background if it has not been measured yet. Songs are
+        skipped while too many are waiting, and measured on a later play instead."""
+        if song.loudness is not None or song.video_id is None or path is None:
+            return None
+        with self.lock:
+            if (
+                song.video_id in self.analyzing
+                or len(self.analyzing) >= self.max_pending
+            ):
+                return None
+            self.analyzing.add(song.video_id)
+        return self.executor.submit(self.analyze, song, path)
+
+    def measure(self, path):
+        """Gets integrated loudness of audio at path or URL in LUFS. Returns None if it could not be measured."""
+        args = ["ffmpeg", "-hide_banner", "-nostats"]
+        if "://" in path:
+            args += ["-reconnect", "1", "-reconnect_streamed", "1"]
+        args += [
+            "-t",
+            str(self.max_seconds),
+            "-i",
+            path,
+            "-vn",
+            "-af",
+            "ebur128=framelog=quiet",
+            "-f",
+            "null",
+            "-",
+        ]
+        result = subprocess.run(
+            args,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            timeout=ANALYSIS_TIMEOUT,
+        )
+        return parse_integrated_loudness(result.stderr.decode(errors="replace"))
+
+    def analyze(self, song, path):
+        """Measures song and stores its loudness along with its cached metadata."""
+        try:
+            loudness = self.measure(path)
+            if loudness is None:
+                return
+            song.loudness = loudness
+            if self.cache is not None:
+                self.cache.put(song.video_id, song.to_metadata())
+            print(f"Measured loudness of {song.video_id}: {loudness} LUFS")
+        except Exception as e:
+            print(f"Error: {e}")
+        finally:
+            with self.lock:
+                self.analyzing.discard(song.video_id)
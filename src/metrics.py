@@ -0,0 +1,281 @@
+import asyncio
+import bisect
+import os
+import threading
+import time
+
+DEFAULT_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+DEFAULT_LAG_PROBE_INTERVAL = 0.5
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels.items()) + "}"
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonically increasing value. Value can be read from a function instead of being incremented."""
+
+    type = "counter"
+
+    def __init__(self, name, description, labels=None, fn=None):
+        self.name = name
+        self.description = description
+        self.labels = labels or {}
+        self.fn = fn
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def get(self):
+        return self.fn() if self.fn is not None else self.value
+
+    def samples(self):
+        return [(self.name, self.labels, self.get())]
+
+
+class Gauge(Counter):
+    """Value that can go up and down."""
+
+    type = "gauge"
+
+    def set(self, value):
+        with self.lock:
+            self.value = value
+
+
+class Histogram:
+    """Cumulative histogram of observed values."""
+
+    type = "histogram"
+
+    def __init__(self, name, description, labels=None, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = labels or {}
+        self.buckets = sorted(buckets)
+        self.bucket_counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        with self.lock:
+            i = bisect.bisect_left(self.buckets, value)
+            if i < len(self.buckets):
+                self.bucket_counts[i] += 1
+            self.count += 1
+            self.sum += value
+
+    def time(self):
+        """Gets context manager that observes time spent in it."""
+        return Timer(self)
+
+    def samples(self):
+        with self.lock:
+            samples = []
+            cumulative_count = 0
+            for bucket, bucket_count in zip(self.buckets, self.bucket_counts):
+                cumulative_count += bucket_count
+                samples.append(
+                    (
+                        f"{self.name}_bucket",
+                        {**self.labels, "le": format_value(float(bucket))},
+                        cumulative_count,
+                    )
+                )
+            samples.append(
+                (f"{self.name}_bucket", {**self.labels, "le": "+Inf"}, self.count)
+            )
+            samples.append((f"{self.name}_sum", self.labels, self.sum))
+            samples.append((f"{self.name}_count", self.labels, self.count))
+            return samples
+
+
+class Timer:
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+class Metrics:
+    """Registry of bot metrics."""
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def __get_or_create(self, cls, name, description, labels, **kwargs):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self.lock:
+            if key not in self.metrics:
+                self.metrics[key] = cls(name, description, labels=labels, **kwargs)
+            return self.metrics[key]
+
+    def counter(self, name, description, labels=None, fn=None):
+        """Gets counter by name and labels, creating it if it does not exist yet."""
+        return self.__get_or_create(Counter, name, description, labels, fn=fn)
+
+    def gauge(self, name, description, labels=None, fn=None):
+        """Gets gauge by name and labels, creating it if it does not exist yet."""
+        return self.__get_or_create(Gauge, name, description, labels, fn=fn)
+
+    def histogram(self, name, description, labels=None, buckets=DEFAULT_BUCKETS):
+        """Gets histogram by name and labels, creating it if it does not exist yet."""
+        return self.__get_or_create(
+            Histogram, name, description, labels, buckets=buckets
+        )
+
+    def render(self):
+        """Renders all metrics in Prometheus text format."""
+        with self.lock:
+            metrics = list(self.metrics.values())
+
+        lines = []
+        described = set()
+        for metric in sorted(metrics, key=lambda metric: metric.name):
+            if metric.name not in described:
+                described.add(metric.name)
+                lines.append(f"# HELP {metric.name} {metric.description}")
+                lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def merge_expositions(expositions, label):
+    """Merges metrics in Prometheus text format from several processes, labelling each sample with its process."""
+    families = {}
+    for value, text in expositions.items():
+        family = None
+        for line in text.splitlines():
+            if not line:
+                continue
+            if line.startswith("# "):
+                _, kind, name = line.split(" ", 3)[:3]
+                family = families.setdefault(
+                    name, {"HELP": None, "TYPE": None, "samples": []}
+                )
+                # Families are described the same way by every process
+                if family.get(kind, "") is None:
+                    family[kind] = line
+                continue
+
+            name, _, sample_value = line.rpartition(" ")
+            if family is None:
+                family = families.setdefault(
+                    name, {"HELP": None, "TYPE": None, "samples": []}
+                )
+            process_label = f'{label}="{value}"'
+            if name.endswith("}"):
+                name = f"{name[:-1]},{process_label}}}"
+            else:
+                name = f"{name}{{{process_label}}}"
+            family["samples"].append(f"{name} {sample_value}")
+
+    lines = []
+    for family in families.values():
+        lines.extend(line for line in [family["HELP"], family["TYPE"]] if line)
+        lines.extend(family["samples"])
+    return "\n".join(lines) + "\n"
+
+
+def list_child_processes(name):
+    """Gets ids of running child processes of this process by executable name. Only supported on Linux."""
+    pid = os.getpid()
+    pids = []
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return pids
+
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # Executable name is in parentheses and may contain spaces, parent pid follows state
+        comm = stat[stat.find("(") + 1 : stat.rfind(")")]
+        fields = stat[stat.rfind(")") + 2 :].split()
+        if comm == name and fields[1] == str(pid):
+            pids.append(int(entry))
+    return pids
+
+
+def count_child_processes(name):
+    """Counts running child processes of this process by executable name. Only supported on Linux."""
+    return len(list_child_processes(name))
+
+
+async def probe_event_loop_lag(metrics, interval=DEFAULT_LAG_PROBE_INTERVAL):
+    """Continuously measures how late the event loop wakes up from a fixed sleep."""
+    histogram = metrics.histogram(
+        "guizhong_event_loop_lag_seconds",
+        "Delay of event loop in running scheduled callbacks.",
+    )
+    gauge = metrics.gauge(
+        "guizhong_event_loop_lag_last_seconds",
+        "Most recently measured event loop delay.",
+    )
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lag = max(0, time.perf_counter() - start - interval)
+        histogram.observe(lag)
+        gauge.set(lag)
+
+
+class MetricsServer:
+    """Serves metrics in Prometheus text format over HTTP."""
+
+    def __init__(self, metrics, host="127.0.0.1", port=9100):
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self.runner = None
+
+    async def handle_metrics(self, request):
+        from aiohttp import web
+
+        return web.Response(
+            text=self.metrics.render(),
+            content_type="text/plain",
+            charset="utf-8",
+        )
+
+    async def start(self):
+        # aiohttp server is only imported when metrics are served to keep startup fast
+        from aiohttp import web
+
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle_metrics)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, self.host, self.port)
+        await site.start()
+        print(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
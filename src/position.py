@@ -0,0 +1,37 @@
+import discord
+
+FRAME_SECONDS = discord.opus.Encoder.FRAME_LENGTH / 1000
+
+
+class PositionSource(discord.AudioSource):
+    """Wraps audio source to keep track of playback position from the number of frames read for sending. Frames are
+    not read while paused, so position stays accurate across pauses."""
+
+    def __init__(self, original, offset=0):
+        self.original = original
+        self.offset = offset
+        self.n_frames = 0
+
+    def __getattr__(self, name):
+        # Forward anything else, such as ffmpeg errors read by the audio player
+        if name == "original":
+            raise AttributeError(name)
+        return getattr(self.original, name)
+
+    @property
+    def position(self):
+        """Gets seconds into song that have been played."""
+        return self.offset + self.n_frames * FRAME_SECONDS
+
+    def read(self):
+        data = self.original.read()
+        if data:
+            self.n_frames += 1
+        return data
+
+    def is_opus(self):
+        return self.original.is_opus()
+
+    def cleanup(self):
+        if "original" in self.__dict__:
+            self.original.cleanup()
@@ -0,0 +1,86 @@
+import collections
+import threading
+import discord
+
+DEFAULT_PREBUFFER_MAX_BYTES = 1024 * 1024
+
+
+class BufferedSource(discord.AudioSource):
+    """Wraps audio source to read its frames ahead on a background thread, keeping up to max bytes of audio in memory.
+    Lets ffmpeg start on the next song while the current one plays."""
+
+    def __init__(self, original, max_bytes=DEFAULT_PREBUFFER_MAX_BYTES):
+        self.original = original
+        self.max_bytes = max_bytes
+        self.frames = collections.deque()
+        self.n_bytes = 0
+        self.is_finished = False
+        self.is_closed = False
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def __getattr__(self, name):
+        # Forward anything else, such as ffmpeg errors read by the audio player
+        if name == "original":
+            raise AttributeError(name)
+        return getattr(self.original, name)
+
+    def start(self):
+        """Starts reading frames ahead if not started yet."""
+        with self.condition:
+            if self.thread is not None:
+                return
+            self.thread = threading.Thread(
+                target=self.__fill, name="prebuffer", daemon=True
+            )
+        self.thread.start()
+
+    def __fill(self):
+        while True:
+            with self.condition:
+                while self.n_bytes >= self.max_bytes and not self.is_closed:
+                    self.condition.wait()
+                if self.is_closed:
+                    return
+
+            try:
+                frame = self.original.read()
+            except Exception as e:
+                print(f"Error: {e}")
+                frame = b""
+
+            with self.condition:
+                if frame and not self.is_closed:
+                    self.frames.append(frame)
+                    self.n_bytes += len(frame)
+                else:
+                    self.is_finished = True
+                self.condition.notify_all()
+                if self.is_finished:
+                    return
+
+    def read(self):
+        self.start()
+        with self.condition:
+            while len(self.frames) == 0 and not self.is_finished:
+                self.condition.wait()
+            if len(self.frames) == 0:
+                return b""
+            frame = self.frames.popleft()
+            self.n_bytes -= len(frame)
+            self.condition.notify_all()
+            return frame
+
+    def is_opus(self):
+        return self.original.is_opus()
+
+    def cleanup(self):
+        with self.condition:
+            self.is_closed = True
+            self.is_finished = True
+            self.frames.clear()
+            self.n_bytes = 0
+            self.condition.notify_all()
+        # Stopping ffmpeg also ends a read that the background thread is blocked on
+        if "original" in self.__dict__:
+            self.original.cleanup()
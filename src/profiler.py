@@ -0,0 +1,212 @@
+import asyncio
+import collections
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from src.metrics import list_child_processes
+
+DEFAULT_PROFILE_DIR = "profiles"
+DEFAULT_SAMPLE_INTERVAL = 0.005
+# Number of allocation sites written for memory snapshots
+MAX_ALLOCATION_SITES = 50
+# Frames kept by tracemalloc for each allocation
+TRACEMALLOC_FRAMES = 10
+
+
+def format_frame(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({code.co_filename}:{frame.f_lineno})"
+
+
+def deep_sizeof(obj, seen=None):
+    """Gets approximate number of bytes taken up by object and everything it holds. Objects from other libraries,
+    such as voice clients, are counted shallowly so only bot state is walked."""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(
+            deep_sizeof(key, seen) + deep_sizeof(value, seen)
+            for key, value in obj.items()
+        )
+    elif isinstance(obj, (list, tuple, set, frozenset, collections.deque)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    elif type(obj).__module__.startswith("src."):
+        if hasattr(obj, "__dict__"):
+            size += deep_sizeof(vars(obj), seen)
+        for name in getattr(type(obj), "__slots__", ()):
+            size += deep_sizeof(getattr(obj, name, None), seen)
+    return size
+
+
+def read_process_info(pid):
+    """Gets command line and resident memory of process. Only supported on Linux."""
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            cmdline = f.read().replace(b"\0", b" ").decode(errors="replace").strip()
+        with open(f"/proc/{pid}/status") as f:
+            rss = next(
+                (
+                    line.split(":", 1)[1].strip()
+                    for line in f
+                    if line.startswith("VmRSS")
+                ),
+                "unknown",
+            )
+    except OSError:
+        return None, None
+    return cmdline, rss
+
+
+class SamplingProfiler:
+    """Samples stack of a thread at an interval from a background thread. Samples are counted by stack and written in
+    collapsed stack format, which flame graph tools read."""
+
+    def __init__(self, thread_id, interval=DEFAULT_SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.n_samples = 0
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(
+            target=self.__sample, name="profiler", daemon=True
+        )
+        self.thread.start()
+
+    def __sample(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(format_frame(frame))
+                frame = frame.f_back
+            if len(stack) == 0:
+                continue
+            self.stacks[";".join(reversed(stack))] += 1
+            self.n_samples += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def write(self, path):
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class Profiler:
+    """Looks inside the running bot on demand. Results are written to files in directory to be analysed offline."""
+
+    def __init__(self, directory=DEFAULT_PROFILE_DIR):
+        self.directory = directory
+        self.cpu_profiler = None
+        self.snapshot = None
+
+    def __get_path(self, kind):
+        """Gets path without extension for new result of kind."""
+        os.makedirs(self.directory, exist_ok=True)
+        return os.path.join(self.directory, f"{kind}-{time.time_ns() // 1000000}")
+
+    def start_cpu_profile(self, interval=DEFAULT_SAMPLE_INTERVAL):
+        """Starts sampling calling thread, which should be running the event loop. Returns False if already started."""
+        if self.cpu_profiler is not None:
+            return False
+        self.cpu_profiler = SamplingProfiler(threading.get_ident(), interval)
+        self.cpu_profiler.start()
+        return True
+
+    def stop_cpu_profile(self):
+        """Stops sampling and writes samples. Returns path written to, or None if nothing was being sampled."""
+        profiler = self.cpu_profiler
+        if profiler is None:
+            return None
+        self.cpu_profiler = None
+        profiler.stop()
+        path = f"{self.__get_path('cpu')}.txt"
+        profiler.write(path)
+        return path
+
+    def take_memory_snapshot(self):
+        """Writes top allocation sites and growth since previous snapshot, along with the raw snapshot. Tracing starts
+        on first snapshot, so older allocations are missed. Returns report path."""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__)]
+        )
+        current, peak = tracemalloc.get_traced_memory()
+
+        path = self.__get_path("memory")
+        snapshot.dump(f"{path}.tracemalloc")
+        with open(f"{path}.txt", "w") as f:
+            f.write(f"Traced memory: {current} bytes, peak {peak} bytes\n\n")
+            f.write("Top allocation sites:\n")
+            for stat in snapshot.statistics("lineno")[:MAX_ALLOCATION_SITES]:
+                f.write(f"{stat}\n")
+            if self.snapshot is not None:
+                f.write("\nGrowth since previous snapshot:\n")
+                stats = snapshot.compare_to(self.snapshot, "lineno")
+                for stat in stats[:MAX_ALLOCATION_SITES]:
+                    f.write(f"{stat}\n")
+        self.snapshot = snapshot
+        return f"{path}.txt"
+
+    def stop_memory_tracing(self):
+        """Stops tracing allocations and forgets previous snapshot. Returns False if not tracing."""
+        if not tracemalloc.is_tracing():
+            return False
+        tracemalloc.stop()
+        self.snapshot = None
+        return True
+
+    def write_session_memory(self, session_cache):
+        """Writes approximate memory taken up by each session, largest first. Returns path written to."""
+        lines = []
+        total = 0
+        for voicechannel_id, session in session_cache.items():
+            size = deep_sizeof(session)
+            queue_size = deep_sizeof(session.queue)
+            prebuffer = session.prebuffer_source
+            prebuffer_size = prebuffer.n_bytes if prebuffer is not None else 0
+            total += size
+            lines.append(
+                (
+                    size,
+                    f"{voicechannel_id}: {size} bytes, {len(session.queue)} songs taking {queue_size} bytes, "
+                    + f"{prebuffer_size} bytes prebuffered",
+                )
+            )
+        lines.sort(key=lambda line: line[0], reverse=True)
+
+        path = f"{self.__get_path('sessions')}.txt"
+        with open(path, "w") as f:
+            f.write(f"{len(lines)} sessions, {total} bytes\n\n")
+            for _, line in lines:
+                f.write(f"{line}\n")
+        return path
+
+    def write_tasks(self):
+        """Writes running asyncio tasks with their stacks and running ffmpeg processes. Returns path written to."""
+        path = f"{self.__get_path('tasks')}.txt"
+        tasks = sorted(asyncio.all_tasks(), key=lambda task: task.get_name())
+        pids = list_child_processes("ffmpeg")
+        with open(path, "w") as f:
+            f.write(f"{len(tasks)} tasks\n\n")
+            for task in tasks:
+                task.print_stack(file=f)
+                f.write("\n")
+            f.write(f"{len(pids)} ffmpeg processes\n\n")
+            for pid in pids:
+                cmdline, rss = read_process_info(pid)
+                f.write(f"{pid}: {rss} resident\n  {cmdline}\n")
+        return path
@@ -0,0 +1,140 @@
+import asyncio
+import contextlib
+import time
+from collections import OrderedDict, deque
+
+# Number of tracked keys above which buckets that have fully refilled are forgotten
+MAX_TRACKED_KEYS = 10000
+
+
+class TokenBucket:
+    """Allows bursts of up to capacity requests, refilling at a fixed rate of tokens per second."""
+
+    def __init__(self, capacity, rate):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def __refill(self, now):
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated_at) * self.rate
+        )
+        self.updated_at = now
+
+    def is_full(self, now):
+        self.__refill(now)
+        return self.tokens >= self.capacity
+
+    def retry_after(self, now, cost=1):
+        """Gets seconds until cost can be taken from bucket. Returns 0 if it can be taken now."""
+        self.__refill(now)
+        if self.tokens >= cost:
+            return 0
+        return (min(cost, self.capacity) - self.tokens) / self.rate
+
+    def take(self, now, cost=1):
+        self.__refill(now)
+        self.tokens -= cost
+
+    def give_back(self, now, cost=1):
+        self.__refill(now)
+        self.tokens = min(self.capacity, self.tokens + cost)
+
+
+class RateLimiter:
+    """Token bucket rate limits by key, allowing up to limit requests per period."""
+
+    def __init__(self, limit, period):
+        self.limit = limit
+        self.period = period
+        self.buckets = {}
+
+    def __get_bucket(self, key):
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            if len(self.buckets) >= MAX_TRACKED_KEYS:
+                self.__forget_full_buckets()
+            bucket = TokenBucket(self.limit, self.limit / self.period)
+            self.buckets[key] = bucket
+        return bucket
+
+    def __forget_full_buckets(self):
+        now = time.monotonic()
+        for key in [key for key, bucket in self.buckets.items() if bucket.is_full(now)]:
+            del self.buckets[key]
+
+    def retry_after(self, key, cost=1):
+        """Gets seconds until key can make a request of given cost. Returns 0 if it can be made now."""
+        return self.__get_bucket(key).retry_after(time.monotonic(), cost)
+
+    def take(self, key, cost=1):
+        """Records request of given cost made by key."""
+        self.__get_bucket(key).take(time.monotonic(), cost)
+
+    def give_back(self, key, cost=1):
+        """Undoes request of given cost made by key, such as when it was turned away for reasons of the bot's own."""
+        self.__get_bucket(key).give_back(time.monotonic(), cost)
+
+
+class FairScheduler:
+    """Limits number of jobs running at once. Waiting jobs are admitted from each group in turn, so a group with many
+    waiting jobs cannot hold up the others."""
+
+    def __init__(self, max_running):
+        self.max_running = max_running
+        self.n_running = 0
+        self.n_waiting = 0
+        # Waiting jobs by group, in the order groups take turns
+        self.waiters = OrderedDict()
+
+    @contextlib.asynccontextmanager
+    async def slot(self, group=None):
+        """Waits for turn of group to run a job."""
+        await self.__acquire(group)
+        try:
+            yield
+        finally:
+            self.__release()
+
+    async def __acquire(self, group):
+        if self.n_running < self.max_running and self.n_waiting == 0:
+            self.n_running += 1
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.setdefault(group, deque()).append(waiter)
+        self.n_waiting += 1
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Turn was given to job just as it was cancelled
+                self.__release()
+            else:
+                self.__forget_waiter(group, waiter)
+            raise
+
+    def __forget_waiter(self, group, waiter):
+        waiters = self.waiters.get(group)
+        if waiters is None or waiter not in waiters:
+            return
+        waiters.remove(waiter)
+        self.n_waiting -= 1
+        if len(waiters) == 0:
+            del self.waiters[group]
+
+    def __release(self):
+        self.n_running -= 1
+        while self.n_running < self.max_running and len(self.waiters) > 0:
+            group, waiters = next(iter(self.waiters.items()))
+            waiter = waiters.popleft()
+            self.n_waiting -= 1
+            # Group goes to the back of the line once it has had its turn
+            if len(waiters) > 0:
+                self.waiters.move_to_end(group)
+            else:
+                del self.waiters[group]
+            if not waiter.done():
+                waiter.set_result(None)
+                self.n_running += 1
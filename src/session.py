@@ -1,5 +1,30 @@
+from src.song_queue import SongQueue
+
+
 class Session:
     def __init__(self, vc):
         self.vc = vc
-        self.queue = []
+        self.queue = SongQueue()
         self.play_music_task = None
+        self.prefetch_task = None
+        self.prefetch_song = None
+        self.handoff_started_at = None
+        # Upcoming song being read ahead into memory, along with its ffmpeg error output
+        self.prebuffer_task = None
+        self.prebuffer_song = None
+        self.prebuffer_source = None
+        self.prebuffer_stderr = None
+        self.playing_started_at = None
+        # Source of song playing, which keeps track of playback position
+        self.source = None
+        # Position song is restarted at once it stops, and whether it was stopped on purpose
+        self.seek_offset = None
+        self.is_stopping = False
+        self.n_resumes = 0
+        # Journal position of the next song to be queued
+        self.journal_tail = 0
+        # Times since which session has been paused, idle, alone in its channel or disconnected
+        self.paused_since = None
+        self.idle_since = None
+        self.empty_since = None
+        self.disconnected_since = None
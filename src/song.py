@@ -1,45 +1,267 @@
-import yt_dlp
+import contextlib
+import time
+from src import ydl_pool as ydl_pools
+from src.errors import NoSearchResultsError
+from src.utils import parse_source_url_expiry
 
-YDL_OPTIONS = {
+# Stream qualities from best to worst, picked from current load when a source URL is resolved
+QUALITY_HIGH = "high"
+QUALITY_MEDIUM = "medium"
+QUALITY_LOW = "low"
+QUALITIES = [QUALITY_HIGH, QUALITY_MEDIUM, QUALITY_LOW]
+
+# Lean option profiles for lookups that never download, one for each stream quality. Song lookups also keep the
+# source URL they find, so the same profiles serve both. DASH manifests are skipped since audio is streamed from
+# direct format URLs.
+STREAM_YDL_OPTIONS = {
     "format": "bestaudio/best",
-    "outtmpl": "%(extractor)s-%(id)s-%(title)s.%(ext)s",
     "quiet": True,
-    "postprocessors": [
-        {
-            "key": "FFmpegExtractAudio",
-            "preferredcodec": "mp3",
-            "preferredquality": "192",
-        }
-    ],
+    "no_warnings": True,
+    "noplaylist": True,
+    "extractor_args": {"youtube": {"skip": ["dash", "translated_subs"]}},
+}
+# Lower qualities prefer Opus so passthrough playback still avoids re-encoding
+STREAM_MEDIUM_YDL_OPTIONS = {
+    **STREAM_YDL_OPTIONS,
+    "format": "bestaudio[acodec=opus][abr<=96]/bestaudio[abr<=96]/worstaudio/best",
+}
+STREAM_LOW_YDL_OPTIONS = {
+    **STREAM_YDL_OPTIONS,
+    "format": "worstaudio[acodec=opus]/worstaudio/best",
+}
+YDL_PROFILES = {
+    "stream": STREAM_YDL_OPTIONS,
+    "stream_medium": STREAM_MEDIUM_YDL_OPTIONS,
+    "stream_low": STREAM_LOW_YDL_OPTIONS,
+}
+STREAM_PROFILES = {
+    QUALITY_HIGH: "stream",
+    QUALITY_MEDIUM: "stream_medium",
+    QUALITY_LOW: "stream_low",
 }
+PLAYLIST_YDL_OPTIONS = {
+    "extract_flat": "in_playlist",
+    "lazy_playlist": True,
+    "quiet": True,
+}
+FORMAT_INFO_KEYS = ["format_id", "ext", "acodec", "abr"]
+# Seconds before expiry at which a source URL is no longer reused
+SOURCE_URL_EXPIRY_MARGIN = 5 * 60
+
+
+@contextlib.contextmanager
+def youtube_dl(profile, ydl_pool=None):
+    """Gets YoutubeDL instance for option profile. Instance is reused from pool if there is one."""
+    if ydl_pool is None:
+        ydl_pool = ydl_pools.process_pool
+    if ydl_pool is not None:
+        yield ydl_pool.get(profile, YDL_PROFILES[profile])
+        return
+
+    import yt_dlp
+
+    with yt_dlp.YoutubeDL(YDL_PROFILES[profile]) as ydl:
+        yield ydl
 
 
 class Song:
-    def __init__(self, title, duration, video_url):
+    # Long queues hold many songs, so attributes are kept in slots instead of a dict per song
+    __slots__ = (
+        "title",
+        "duration",
+        "video_url",
+        "video_id",
+        "format_info",
+        "source_url",
+        "source_url_expires_at",
+        "trace",
+        "requester",
+        "loudness",
+    )
+
+    def __init__(self, title, duration, video_url, video_id=None, format_info=None):
         self.title = title
         self.duration = duration
         self.video_url = video_url
+        self.video_id = video_id
+        self.format_info = format_info if format_info is not None else {}
+        self.source_url = None
+        self.source_url_expires_at = None
+        # Trace of request that queued song, continued if song is played right away
+        self.trace = None
+        # Id of user that queued song
+        self.requester = None
+        # Integrated loudness in LUFS, once measured
+        self.loudness = None
 
     def __str__(self):
         return str(self.title)
 
     @staticmethod
-    def extract_song(video_id):
-        """Gets Youtube song info by voicechannel id and video id."""
+    def from_metadata(video_id, metadata):
+        """Creates song from cached metadata."""
+        song = Song(
+            video_url=f"https://www.youtube.com/watch?v={video_id}",
+            video_id=video_id,
+            title=metadata["title"],
+            duration=metadata["duration"],
+            format_info=metadata.get("format_info"),
+        )
+        song.loudness = metadata.get("loudness")
+        return song
+
+    @staticmethod
+    def from_playlist_entry(entry):
+        """Creates unresolved song from flat playlist entry. Source URL is resolved when song is about to play."""
+        video_id = entry["id"]
+        return Song(
+            video_url=f"https://www.youtube.com/watch?v={video_id}",
+            video_id=video_id,
+            title=entry.get("title"),
+            duration=entry.get("duration"),
+        )
+
+    @staticmethod
+    def from_journal_entry(entry):
+        """Creates song from session journal entry. Stored source URL is reused if it has not expired yet."""
+        song = Song.from_metadata(entry["video_id"], entry)
+        if entry.get("source_url") is not None:
+            song.set_source_url(entry["source_url"])
+        song.requester = entry.get("requester")
+        return song
+
+    def copy(self):
+        """Gets copy of song that can be queued separately."""
+        song = Song(
+            title=self.title,
+            duration=self.duration,
+            video_url=self.video_url,
+            video_id=self.video_id,
+            format_info=dict(self.format_info),
+        )
+        song.source_url = self.source_url
+        song.source_url_expires_at = self.source_url_expires_at
+        song.requester = self.requester
+        song.loudness = self.loudness
+        return song
+
+    def to_metadata(self):
+        """Gets song metadata to be cached."""
+        return {
+            "title": self.title,
+            "duration": self.duration,
+            "format_info": self.format_info,
+            "loudness": self.loudness,
+        }
+
+    def to_journal_entry(self):
+        """Gets song info to be stored in session journal."""
+        return {
+            **self.to_metadata(),
+            "video_id": self.video_id,
+            "source_url": self.source_url,
+            "requester": self.requester,
+        }
+
+    @staticmethod
+    def warm_up(ydl_pool=None):
+        """Imports yt-dlp and loads its Youtube extractor. yt-dlp is otherwise imported on first use to keep startup fast."""
+        with youtube_dl("stream", ydl_pool) as ydl:
+            ydl.get_info_extractor("Youtube")
+
+    @staticmethod
+    def extract_song(video_id, ydl_pool=None, quality=QUALITY_HIGH):
+        """Gets Youtube song info by voicechannel id and video id, along with a source URL in stream quality."""
         video_url = f"https://www.youtube.com/watch?v={video_id}"
 
-        with yt_dlp.YoutubeDL(YDL_OPTIONS) as ydl:
+        with youtube_dl(STREAM_PROFILES[quality], ydl_pool) as ydl:
             url = video_url
             info = ydl.extract_info(url, download=False)
+            return Song.from_info(video_id, info, quality)
 
-            return Song(
-                video_url=video_url,
-                title=info["title"],
-                duration=info["duration"],
-            )
+    @staticmethod
+    def search(query, ydl_pool=None, quality=QUALITY_HIGH):
+        """Gets first Youtube song found for search query. Throws NoSearchResultsError if nothing is found."""
+        with youtube_dl(STREAM_PROFILES[quality], ydl_pool) as ydl:
+            info = ydl.extract_info(f"ytsearch1:{query}", download=False)
 
-    def get_source_url(self):
-        with yt_dlp.YoutubeDL(YDL_OPTIONS) as ydl:
-            info = ydl.extract_info(self.video_url, download=False)
+        entries = [entry for entry in info.get("entries") or [] if entry is not None]
+        if len(entries) == 0:
+            raise NoSearchResultsError(f"no results for {query}")
+        return Song.from_info(entries[0]["id"], entries[0], quality)
+
+    @staticmethod
+    def from_info(video_id, info, quality=QUALITY_HIGH):
+        """Creates song from info extracted for video in stream quality, keeping its source URL."""
+        format_info = Song.parse_format_info(info)
+        if quality != QUALITY_HIGH:
+            format_info["quality"] = quality
+        song = Song(
+            video_url=f"https://www.youtube.com/watch?v={video_id}",
+            video_id=video_id,
+            title=info["title"],
+            duration=info["duration"],
+            format_info=format_info,
+        )
+        song.set_source_url(info["url"])
+        return song
+
+    @staticmethod
+    def iter_playlist(playlist_id):
+        """Lazily enumerates unresolved songs in Youtube playlist by playlist id. Pages can be fetched from different
+        threads, so a pooled instance is not used."""
+        import yt_dlp
+
+        playlist_url = f"https://www.youtube.com/playlist?list={playlist_id}"
+
+        with yt_dlp.YoutubeDL(PLAYLIST_YDL_OPTIONS) as ydl:
+            # Unprocessed result keeps entries as a generator that fetches pages on demand
+            info = ydl.extract_info(playlist_url, download=False, process=False)
+            for entry in info.get("entries") or []:
+                if entry.get("id") is not None:
+                    yield Song.from_playlist_entry(entry)
+
+    @staticmethod
+    def parse_format_info(info):
+        """Gets info on selected audio format from extracted info."""
+        return {key: info[key] for key in FORMAT_INFO_KEYS if key in info}
+
+    @staticmethod
+    def resolve_source_url(video_url, ydl_pool=None, quality=QUALITY_HIGH):
+        """Gets a fresh source URL and its format info for video URL in stream quality."""
+        with youtube_dl(STREAM_PROFILES[quality], ydl_pool) as ydl:
+            info = ydl.extract_info(video_url, download=False)
             source_url = info["url"]
-            return source_url
+            return source_url, {**Song.parse_format_info(info), "quality": quality}
+
+    def set_source_url(self, source_url, format_info=None):
+        """Stores source URL along with its expiry and format info."""
+        self.source_url = source_url
+        self.source_url_expires_at = parse_source_url_expiry(source_url)
+        if format_info is not None:
+            self.format_info = format_info
+
+    def get_quality(self):
+        """Gets stream quality source URL was resolved in. URLs found while extracting metadata are best quality."""
+        return self.format_info.get("quality", QUALITY_HIGH)
+
+    def is_opus(self):
+        """Checks if source audio is Opus encoded and can be played without re-encoding."""
+        return self.format_info.get("acodec") == "opus"
+
+    def invalidate_source_url(self):
+        """Forgets stored source URL so it is resolved again on next use."""
+        self.source_url = None
+        self.source_url_expires_at = None
+
+    def has_valid_source_url(self):
+        """Checks if stored source URL can still be used. URLs with unknown expiry are not reused."""
+        if self.source_url is None or self.source_url_expires_at is None:
+            return False
+        return time.time() < self.source_url_expires_at - SOURCE_URL_EXPIRY_MARGIN
+
+    def get_source_url(self):
+        """Gets source URL, reusing stored URL until shortly before it expires."""
+        if not self.has_valid_source_url():
+            self.set_source_url(*Song.resolve_source_url(self.video_url))
+        return self.source_url
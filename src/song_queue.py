@@ -0,0 +1,75 @@
+import itertools
+from collections import Counter, deque
+
+
+class SongQueue:
+    """Queue of songs with constant time removal from the front. Total duration and number of songs queued by each
+    user are kept up to date as songs are added and removed."""
+
+    def __init__(self, songs=()):
+        self.songs = deque()
+        self.total_duration = 0
+        self.n_unknown_durations = 0
+        self.requester_counts = Counter()
+        self.extend(songs)
+
+    def __len__(self):
+        return len(self.songs)
+
+    def __iter__(self):
+        return iter(self.songs)
+
+    def __getitem__(self, index):
+        return self.songs[index]
+
+    def __add(self, song):
+        if song.duration is None:
+            self.n_unknown_durations += 1
+        else:
+            self.total_duration += song.duration
+        if song.requester is not None:
+            self.requester_counts[song.requester] += 1
+
+    def __remove(self, song):
+        if song.duration is None:
+            self.n_unknown_durations -= 1
+        else:
+            self.total_duration -= song.duration
+        if song.requester is not None:
+            self.requester_counts[song.requester] -= 1
+            if self.requester_counts[song.requester] <= 0:
+                del self.requester_counts[song.requester]
+
+    def append(self, song):
+        self.songs.append(song)
+        self.__add(song)
+
+    def extend(self, songs):
+        for song in songs:
+            self.append(song)
+
+    def popleft(self):
+        """Removes and gets song at the front of the queue."""
+        song = self.songs.popleft()
+        self.__remove(song)
+        return song
+
+    def remove_range(self, start, stop):
+        """Removes songs from start up to but not including stop. Takes time proportional to stop."""
+        start = max(0, start)
+        stop = min(len(self.songs), stop)
+        if start >= stop:
+            return
+        # Rotate removed range to the front so songs after it do not have to move
+        self.songs.rotate(-start)
+        for _ in range(stop - start):
+            self.__remove(self.songs.popleft())
+        self.songs.rotate(start)
+
+    def window(self, start, stop):
+        """Gets songs from start up to but not including stop."""
+        return list(itertools.islice(self.songs, start, stop))
+
+    def count_requested_by(self, requester):
+        """Gets number of songs in the queue requested by user."""
+        return self.requester_counts[requester]
@@ -0,0 +1,46 @@
+import json
+import time
+
+
+class StartupTimer:
+    """Records how long each stage of starting the bot took, counted from when this module is first imported."""
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.stages = {}
+
+    def stage(self, name):
+        """Gets context manager that records time spent in it as a stage."""
+        return StartupStage(self, name)
+
+    def record(self, name, start, end):
+        self.stages[name] = {
+            "start_ms": round((start - self.started_at) * 1000, 3),
+            "duration_ms": round((end - start) * 1000, 3),
+        }
+
+    def mark(self, name):
+        """Records time from start until now as a stage."""
+        self.record(name, self.started_at, time.perf_counter())
+
+    def report(self):
+        """Logs stages as a JSON line."""
+        print(json.dumps({"event": "startup", "stages": self.stages}), flush=True)
+
+
+class StartupStage:
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.timer.record(self.name, self.start, time.perf_counter())
+        return False
+
+
+# Created on first import so startup is timed from as early as possible
+startup_timer = StartupTimer()
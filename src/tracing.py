@@ -0,0 +1,121 @@
+import json
+import threading
+import time
+import uuid
+import discord
+
+DEFAULT_SLOW_THRESHOLD = 5
+
+
+class Span:
+    def __init__(self, trace, name, attrs):
+        self.trace = trace
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self.trace.add_span(self.name, self.start, time.perf_counter(), **self.attrs)
+        return False
+
+
+class Trace:
+    """Timeline of stages for a single request, correlated by request id."""
+
+    def __init__(self, name, slow_threshold=DEFAULT_SLOW_THRESHOLD, **attrs):
+        self.name = name
+        self.slow_threshold = slow_threshold
+        self.attrs = attrs
+        self.request_id = uuid.uuid4().hex[:16]
+        self.started_at = time.perf_counter()
+        self.finished_at = None
+        self.spans = []
+        self.lock = threading.Lock()
+
+    def span(self, name, **attrs):
+        """Gets context manager that records time spent in it as a span."""
+        return Span(self, name, attrs)
+
+    def add_span(self, name, start, end, **attrs):
+        """Records span that started and ended at given performance counter times."""
+        with self.lock:
+            if self.finished_at is not None:
+                return
+            self.spans.append(
+                {
+                    "name": name,
+                    "start_ms": round((start - self.started_at) * 1000, 3),
+                    "duration_ms": round((end - start) * 1000, 3),
+                    **attrs,
+                }
+            )
+
+    def is_finished(self):
+        return self.finished_at is not None
+
+    def finish(self, **attrs):
+        """Ends trace. Trace is logged as a JSON line if it took longer than the slow threshold."""
+        with self.lock:
+            if self.finished_at is not None:
+                return
+            self.finished_at = time.perf_counter()
+            self.attrs.update(attrs)
+        if self.duration() >= self.slow_threshold:
+            print(json.dumps(self.to_dict()), flush=True)
+
+    def duration(self):
+        end = self.finished_at if self.finished_at is not None else time.perf_counter()
+        return end - self.started_at
+
+    def to_dict(self):
+        return {
+            "event": "slow_trace",
+            "trace": self.name,
+            "request_id": self.request_id,
+            "duration_ms": round(self.duration() * 1000, 3),
+            **self.attrs,
+            "spans": self.spans,
+        }
+
+
+class Tracer:
+    def __init__(self, slow_threshold=DEFAULT_SLOW_THRESHOLD):
+        self.slow_threshold = slow_threshold
+
+    def start(self, name, **attrs):
+        """Starts a new trace."""
+        return Trace(name, slow_threshold=self.slow_threshold, **attrs)
+
+
+class FirstPacketSource(discord.AudioSource):
+    """Wraps audio source to call back once the first packet has been read for sending."""
+
+    def __init__(self, original, on_first_packet):
+        self.original = original
+        self.on_first_packet = on_first_packet
+
+    def __getattr__(self, name):
+        # Forward anything else, such as ffmpeg errors read by the audio player
+        if name == "original":
+            raise AttributeError(name)
+        return getattr(self.original, name)
+
+    def read(self):
+        data = self.original.read()
+        if self.on_first_packet is not None:
+            on_first_packet = self.on_first_packet
+            self.on_first_packet = None
+            on_first_packet()
+        return data
+
+    def is_opus(self):
+        return self.original.is_opus()
+
+    def cleanup(self):
+        if "original" in self.__dict__:
+            self.original.cleanup()
@@ -3,6 +3,38 @@ from urllib.parse import urlparse
 from urllib.parse import parse_qs
 from .errors import InvalidSongURLError
 
+STDERR_TAIL_SIZE = 4096
+
+
+def is_url(arg):
+    """Checks if argument is a web URL rather than search terms."""
+    return urlparse(arg).scheme in ["http", "https"]
+
+
+def normalize_search_query(query):
+    """Normalizes search query so that searches differing only in case and spacing are treated the same."""
+    return " ".join(query.casefold().split())
+
+
+def format_duration(seconds):
+    """Formats number of seconds as hours, minutes and seconds."""
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours > 0:
+        return f"{hours}:{minutes:02}:{seconds:02}"
+    return f"{minutes}:{seconds:02}"
+
+
+def parse_timestamp(timestamp):
+    """Parses number of seconds from seconds, minutes:seconds or hours:minutes:seconds. Throws ValueError if invalid."""
+    parts = timestamp.split(":")
+    if len(parts) > 3 or any(not part.isdigit() for part in parts):
+        raise ValueError(f"invalid timestamp {timestamp}")
+    seconds = 0
+    for part in parts:
+        seconds = seconds * 60 + int(part)
+    return seconds
+
 
 def parse_youtube_video_url(url):
     """Parses Youtube video id from valid URL. Throws InvalidSongURLError if URL is invalid."""
@@ -33,3 +65,58 @@ def parse_youtube_video_url(url):
 
         video_id = query_parse.get("v")[0]
         return video_id
+
+
+def parse_youtube_playlist_url(url):
+    """Parses Youtube playlist id from valid URL. Throws InvalidSongURLError if URL is invalid."""
+    url_parse = urlparse(url)
+
+    valid_hostnames = ["youtube.com", "www.youtube.com", "m.youtube.com"]
+
+    if url_parse.hostname not in valid_hostnames:
+        raise InvalidSongURLError("invalid hostname")
+
+    if url_parse.path != "/playlist":
+        raise InvalidSongURLError("invalid path")
+
+    query_parse = parse_qs(url_parse.query)
+
+    if query_parse.get("list") is None or query_parse.get("list")[0] is None:
+        raise InvalidSongURLError("invalid playlist id")
+
+    playlist_id = query_parse.get("list")[0]
+    return playlist_id
+
+
+def parse_source_url_expiry(url):
+    """Parses expiry time from signed `expire` parameter of source URL. Returns None if URL has no expiry."""
+    url_parse = urlparse(url)
+    query_parse = parse_qs(url_parse.query)
+
+    expire = query_parse.get("expire")
+    if expire is None:
+        # Some source URLs carry their parameters in the path instead
+        m = re.search("/expire/(\\d+)", url_parse.path)
+        if m is None:
+            return None
+        expire = [m.group(1)]
+
+    try:
+        return float(expire[0])
+    except ValueError:
+        return None
+
+
+class StderrTail:
+    """File-like sink that keeps the last bytes written to it. Used to inspect ffmpeg errors."""
+
+    def __init__(self, size=STDERR_TAIL_SIZE):
+        self.size = size
+        self.data = b""
+
+    def write(self, data):
+        self.data = (self.data + data)[-self.size :]
+
+    def is_forbidden(self):
+        """Checks if ffmpeg reported an HTTP 403 from the stream server."""
+        return b"403 Forbidden" in self.data
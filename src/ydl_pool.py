@@ -0,0 +1,48 @@
+import threading
+
+
+class YoutubeDLPool:
+    """Reusable YoutubeDL instances, one for each thread and option profile. Instances keep their HTTP connections
+    open between calls."""
+
+    def __init__(self):
+        self.local = threading.local()
+        self.instances = []
+        self.lock = threading.Lock()
+
+    def get(self, profile, options):
+        """Gets instance for option profile owned by the calling thread, creating it on first use."""
+        instances = getattr(self.local, "instances", None)
+        if instances is None:
+            instances = self.local.instances = {}
+
+        ydl = instances.get(profile)
+        if ydl is None:
+            import yt_dlp
+
+            # Instance stays entered until the pool is closed
+            ydl = instances[profile] = yt_dlp.YoutubeDL(options).__enter__()
+            with self.lock:
+                self.instances.append(ydl)
+        return ydl
+
+    def close(self):
+        """Closes all instances in the pool."""
+        with self.lock:
+            instances = self.instances
+            self.instances = []
+        for ydl in instances:
+            try:
+                ydl.__exit__(None, None, None)
+            except Exception as e:
+                print(f"Error: {e}")
+
+
+# Pool of a worker process when extractions are run in a process pool
+process_pool = None
+
+
+def init_process_pool():
+    """Creates pool for the current process. Used as process pool initializer."""
+    global process_pool
+    process_pool = YoutubeDLPool()
@@ -0,0 +1,59 @@
+import os
+import pytest
+from src.audio_cache import AudioCache
+
+
+@pytest.fixture
+def fake_download(mocker):
+    youtubedl_cls = mocker.patch("yt_dlp.YoutubeDL")
+
+    def download(urls):
+        options = youtubedl_cls.call_args.args[0]
+        video_id = urls[0].split("v=")[1]
+        path = options["outtmpl"].replace("%(id)s", video_id).replace("%(ext)s", "opus")
+        with open(path, "wb") as f:
+            f.write(b"0" * 100)
+
+    youtubedl_cls.return_value.__enter__.return_value.download.side_effect = download
+    return youtubedl_cls
+
+
+def test_audio_cache_downloads_after_threshold(tmp_path, fake_download):
+    cache = AudioCache(tmp_path, play_threshold=2)
+
+    assert cache.record_play("123") is None
+    assert cache.get("123") is None
+
+    cache.record_play("123").result()
+
+    assert cache.get("123") == os.path.join(tmp_path, "123.opus")
+    assert os.listdir(cache.tmp_directory) == []
+    # Already cached songs are not downloaded again
+    assert cache.record_play("123") is None
+
+
+def test_audio_cache_evicts_least_recently_used(tmp_path, fake_download):
+    cache = AudioCache(tmp_path, max_bytes=250, play_threshold=1)
+
+    cache.record_play("1").result()
+    cache.record_play("2").result()
+    os.utime(cache.path_for("1"), (0, 0))
+    os.utime(cache.path_for("2"), (1, 1))
+    cache.get("1")
+    cache.record_play("3").result()
+
+    assert cache.get("1") is not None
+    assert cache.get("2") is None
+    assert cache.get("3") is not None
+
+
+def test_audio_cache_failed_download(tmp_path, mocker):
+    youtubedl_cls = mocker.patch("yt_dlp.YoutubeDL")
+    download = youtubedl_cls.return_value.__enter__.return_value.download
+    download.side_effect = RuntimeError("download failed")
+    cache = AudioCache(tmp_path, play_threshold=1)
+
+    cache.record_play("123").result()
+
+    assert cache.get("123") is None
+    assert "123" not in cache.downloading
@@ -0,0 +1,57 @@
+import pytest
+from benchmarks.bench_handler import main, parse_args, percentile, run_benchmark
+
+
+def test_percentile():
+    samples = [5, 1, 4, 2, 3]
+
+    assert percentile(samples, 50) == 3
+    assert percentile(samples, 99) == 5
+    assert percentile([], 50) == 0
+
+
+@pytest.mark.asyncio
+async def test_run_benchmark(capsys):
+    config = parse_args(
+        [
+            "--guilds",
+            "3",
+            "--songs-per-guild",
+            "3",
+            "--extraction-latency",
+            "0.01",
+            "--track-seconds",
+            "0.2",
+        ]
+    )
+
+    results = await run_benchmark(config)
+
+    assert results["unfinished_sessions"] == 0
+    assert results["command_latency_seconds"]["play"]["count"] == 9
+    assert results["command_latency_seconds"]["skip"]["count"] == 3
+    assert results["song_transition_gap_seconds"]["count"] > 0
+    assert results["event_loop_lag_seconds"]["count"] > 0
+    assert results["memory_per_session_bytes"] > 0
+    # Simulated songs play to the end instead of being resumed
+    assert "resuming" not in capsys.readouterr().out
+
+
+def test_main_fails_on_regression(capsys):
+    exit_code = main(
+        [
+            "--guilds",
+            "1",
+            "--songs-per-guild",
+            "1",
+            "--extraction-latency",
+            "0.05",
+            "--track-seconds",
+            "0.1",
+            "--max-command-p95",
+            "0.01",
+        ]
+    )
+
+    assert exit_code == 1
+    assert "FAILED: play p95 latency" in capsys.readouterr().err
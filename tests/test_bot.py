@@ -1,5 +1,5 @@
 import pytest
-from src.bot import create_and_run_bot
+from src.bot import create_and_run_bot, create_bot
 
 
 @pytest.mark.asyncio
@@ -9,3 +9,15 @@ async def test_create_and_run_bot(mocker):
     mocker.patch("src.handler.Handler")
 
     create_and_run_bot("my_token", "!")
+
+
+def test_create_bot_sharded(mocker):
+    mocker.patch("discord.Intents.default")
+    bot_cls = mocker.patch("discord.ext.commands.Bot")
+    sharded_bot_cls = mocker.patch("discord.ext.commands.AutoShardedBot")
+
+    create_bot("!", shard_options={"shard_ids": [0, 1], "shard_count": 4})
+
+    bot_cls.assert_not_called()
+    assert sharded_bot_cls.call_args.kwargs["shard_ids"] == [0, 1]
+    assert sharded_bot_cls.call_args.kwargs["shard_count"] == 4
@@ -0,0 +1,103 @@
+import pytest
+from src.cache import PRUNE_INTERVAL, MetadataCache, SearchCache
+
+METADATA = {"title": "It's MyGO!!!!!", "duration": 9000, "format_info": {}}
+
+
+def test_cache_happy_path():
+    cache = MetadataCache(":memory:")
+
+    assert cache.get("123") is None
+    cache.put("123", METADATA)
+
+    assert cache.get("123") == METADATA
+    assert cache.hits == 1
+    assert cache.misses == 1
+
+
+def test_cache_evicts_least_recently_used_from_memory():
+    cache = MetadataCache(":memory:", max_entries=2)
+
+    cache.put("1", METADATA)
+    cache.put("2", METADATA)
+    cache.get("1")
+    cache.put("3", METADATA)
+
+    assert list(cache.entries.keys()) == ["1", "3"]
+    # Evicted entry is still on disk
+    assert cache.get("2") == METADATA
+
+
+def test_cache_persists_to_disk(tmp_path):
+    path = tmp_path / "cache.sqlite3"
+    cache = MetadataCache(path)
+    cache.put("123", METADATA)
+    cache.close()
+
+    cache = MetadataCache(path)
+
+    assert cache.get("123") == METADATA
+
+
+def test_cache_expires_entries(mocker):
+    cache = MetadataCache(":memory:", ttl=60)
+    time_mock = mocker.patch("time.time")
+
+    time_mock.return_value = 1000
+    cache.put("123", METADATA)
+    time_mock.return_value = 1061
+
+    assert cache.get("123") is None
+
+
+def test_cache_purge():
+    cache = MetadataCache(":memory:")
+    cache.put("1", METADATA)
+    cache.put("2", METADATA)
+
+    assert cache.purge() == 2
+    assert len(cache) == 0
+    assert cache.get("1") is None
+
+
+def test_search_cache_is_separate_from_metadata_cache(tmp_path):
+    path = tmp_path / "cache.sqlite3"
+    cache = MetadataCache(path)
+    search_cache = SearchCache(path)
+
+    cache.put("123", METADATA)
+    search_cache.put("mygo", {"video_id": "123"})
+
+    assert search_cache.get("mygo") == {"video_id": "123"}
+    assert search_cache.get("123") is None
+    assert search_cache.purge() == 1
+    assert cache.get("123") == METADATA
+
+
+def test_cache_writes_in_background():
+    cache = MetadataCache(":memory:", max_entries=1)
+
+    # Puts do not wait on the database, even while it is busy
+    with cache.db_lock:
+        cache.put("1", METADATA)
+        cache.put("2", METADATA)
+        assert cache.is_in_memory("1")
+        assert cache.get("1") == METADATA
+
+    cache.flush()
+    assert not cache.is_in_memory("2")
+    assert len(cache) == 2
+
+
+def test_cache_prunes_expired_entries(mocker):
+    cache = MetadataCache(":memory:", ttl=60)
+    time_mock = mocker.patch("time.time")
+
+    time_mock.return_value = 1000
+    cache.put("1", METADATA)
+    cache.flush()
+    time_mock.return_value = 1000 + PRUNE_INTERVAL + 1
+    cache.put("2", METADATA)
+
+    assert len(cache) == 1
+    assert cache.get("2") == METADATA
@@ -0,0 +1,48 @@
+import pytest
+from src.circuit_breaker import (
+    CIRCUIT_CLOSED,
+    CIRCUIT_HALF_OPEN,
+    CIRCUIT_OPEN,
+    CircuitBreaker,
+)
+from src.errors import CircuitOpenError
+
+
+def test_opens_after_failures_in_a_row():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CIRCUIT_CLOSED
+
+    breaker.record_failure()
+    assert breaker.state == CIRCUIT_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+
+
+def test_lets_single_trial_call_through_after_reset_timeout():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+
+    breaker.check()
+    assert breaker.state == CIRCUIT_HALF_OPEN
+    breaker.reset_timeout = 30
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+
+    breaker.record_success()
+    assert breaker.state == CIRCUIT_CLOSED
+    breaker.check()
+
+
+def test_reopens_when_trial_call_fails():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=0)
+    for _ in range(3):
+        breaker.record_failure()
+    breaker.check()
+
+    breaker.record_failure()
+
+    assert breaker.state == CIRCUIT_OPEN
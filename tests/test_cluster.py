@@ -0,0 +1,100 @@
+import asyncio
+import aiohttp
+import pytest
+from src.cluster import ClusterMetricsServer, Supervisor, split_shards
+from src.metrics import Metrics, MetricsServer
+
+BOT_KWARGS = {
+    "discord_token": "my_token",
+    "discord_command_prefix": "!",
+    "journal_options": {"path": "sessions.sqlite3"},
+    "metrics_options": {"host": "127.0.0.1", "port": 9100},
+}
+
+
+def test_split_shards():
+    assert split_shards(10, 3) == [[0, 1, 2], [3, 4, 5], [6, 7, 8, 9]]
+    assert split_shards(2, 2) == [[0], [1]]
+
+
+def test_split_shards_too_few_shards():
+    with pytest.raises(ValueError):
+        split_shards(1, 2)
+
+
+def test_supervisor_worker_kwargs():
+    supervisor = Supervisor(BOT_KWARGS, shard_count=4, n_workers=2)
+
+    kwargs = supervisor.worker_kwargs(1)
+
+    assert kwargs["shard_options"] == {"shard_ids": [2, 3], "shard_count": 4}
+    assert kwargs["journal_options"]["path"] == "sessions-1.sqlite3"
+    assert kwargs["metrics_options"]["port"] == 9102
+    # Options shared with other workers are left as is
+    assert BOT_KWARGS["metrics_options"]["port"] == 9100
+    assert supervisor.worker_metrics_urls() == [
+        "http://127.0.0.1:9101/metrics",
+        "http://127.0.0.1:9102/metrics",
+    ]
+
+
+class FakeDeadProcess:
+    exitcode = 1
+
+    def is_alive(self):
+        return False
+
+    def join(self):
+        pass
+
+
+@pytest.mark.asyncio
+async def test_supervisor_restarts_exited_workers_after_delay(mocker):
+    mocker.patch("src.cluster.WORKER_CHECK_INTERVAL", 0.01)
+    supervisor = Supervisor(
+        {"discord_token": "my_token"}, shard_count=2, n_workers=2, restart_delay=0.05
+    )
+    started_at = []
+
+    def start_worker(worker_index):
+        started_at.append((worker_index, asyncio.get_running_loop().time()))
+        supervisor.processes[worker_index] = FakeDeadProcess()
+
+    mocker.patch.object(supervisor, "start_worker", side_effect=start_worker)
+
+    task = asyncio.create_task(supervisor.run())
+    await asyncio.sleep(0.3)
+    supervisor.stopping.set()
+    await task
+
+    # Workers are started, then restarted each time they are found dead after the delay
+    assert len(started_at) > 4
+    first_restart = next(t for i, t in started_at[2:] if i == 0)
+    assert first_restart - started_at[0][1] >= 0.05
+
+
+@pytest.mark.asyncio
+async def test_cluster_metrics_server(unused_tcp_port_factory):
+    ports = [unused_tcp_port_factory() for _ in range(3)]
+    worker_servers = []
+    for i, port in enumerate(ports[1:]):
+        metrics = Metrics()
+        metrics.counter("requests_total", "Requests.").inc(i + 1)
+        worker_servers.append(MetricsServer(metrics, port=port))
+    server = ClusterMetricsServer(
+        [f"http://127.0.0.1:{port}/metrics" for port in ports[1:]], port=ports[0]
+    )
+    for s in [*worker_servers, server]:
+        await s.start()
+
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f"http://127.0.0.1:{ports[0]}/metrics") as response:
+                text = await response.text()
+    finally:
+        for s in [*worker_servers, server]:
+            await s.stop()
+
+    assert text.count("# TYPE requests_total counter") == 1
+    assert 'requests_total{worker="0"} 1' in text
+    assert 'requests_total{worker="1"} 2' in text
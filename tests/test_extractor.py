@@ -0,0 +1,307 @@
+import asyncio
+import time
+import pytest
+from src.cache import MetadataCache, SearchCache
+from src.circuit_breaker import CIRCUIT_OPEN
+from src.errors import CircuitOpenError, ExtractionTimeoutError, NoSearchResultsError
+from src.extractor import Extractor
+from src.song import QUALITY_LOW
+
+
+@pytest.mark.asyncio
+async def test_extract_song_happy_path(mocker):
+    youtubedl_cls = mocker.patch("yt_dlp.YoutubeDL")
+    youtubedl_cls.return_value.__enter__.return_value.extract_info.return_value = {
+        "title": "It's MyGO!!!!!",
+        "duration": 9000,
+        "url": "https://example.com/mygo.mp3",
+    }
+    extractor = Extractor()
+
+    song = await extractor.extract_song("123")
+    source_url = await extractor.get_source_url(song)
+
+    assert song.title == "It's MyGO!!!!!"
+    assert source_url == "https://example.com/mygo.mp3"
+
+
+@pytest.mark.asyncio
+async def test_extract_song_in_lower_quality(mocker):
+    youtubedl_cls = mocker.patch("yt_dlp.YoutubeDL")
+    extract_info = youtubedl_cls.return_value.__enter__.return_value.extract_info
+    extract_info.return_value = {
+        "title": "It's MyGO!!!!!",
+        "duration": 9000,
+        "url": "https://example.com/mygo-low.webm?expire=9999999999",
+        "acodec": "opus",
+        "abr": 50,
+    }
+    extractor = Extractor()
+
+    song = await extractor.extract_song("123", quality=QUALITY_LOW)
+    source_url = await extractor.get_source_url(song, quality=QUALITY_LOW)
+
+    # Song is looked up in the lower quality format so its source URL is not resolved again
+    assert source_url == "https://example.com/mygo-low.webm?expire=9999999999"
+    assert song.get_quality() == QUALITY_LOW
+    assert youtubedl_cls.call_args.args[0]["format"].startswith("worstaudio")
+    assert extract_info.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_get_source_url_resolves_in_quality(mocker):
+    youtubedl_cls = mocker.patch("yt_dlp.YoutubeDL")
+    extract_info = youtubedl_cls.return_value.__enter__.return_value.extract_info
+    extract_info.return_value = {
+        "title": "It's MyGO!!!!!",
+        "duration": 9000,
+        "url": "https://example.com/mygo.webm?expire=9999999999",
+        "acodec": "opus",
+        "abr": 160,
+    }
+    extractor = Extractor()
+    song = await extractor.extract_song("123")
+
+    # Still valid URL is reused even if it is of higher quality
+    await extractor.get_source_url(song, quality=QUALITY_LOW)
+    assert extract_info.call_count == 1
+
+    song.invalidate_source_url()
+    extract_info.return_value = {
+        **extract_info.return_value,
+        "url": "https://example.com/mygo-low.webm?expire=9999999999",
+        "abr": 50,
+    }
+    source_url = await extractor.get_source_url(song, quality=QUALITY_LOW)
+
+    assert source_url == "https://example.com/mygo-low.webm?expire=9999999999"
+    assert song.get_quality() == QUALITY_LOW
+    assert song.format_info["abr"] == 50
+
+
+@pytest.mark.asyncio
+async def test_run_does_not_block_event_loop():
+    extractor = Extractor(max_workers=2)
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            ticks += 1
+            await asyncio.sleep(0.01)
+
+    ticker_task = asyncio.create_task(ticker())
+    await extractor.run(time.sleep, 0.2)
+    ticker_task.cancel()
+
+    assert ticks > 5
+
+
+@pytest.mark.asyncio
+async def test_run_caps_concurrency():
+    extractor = Extractor(max_workers=2)
+    running = 0
+    max_running = 0
+
+    def work():
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        time.sleep(0.05)
+        running -= 1
+
+    await asyncio.gather(*[extractor.run(work) for _ in range(6)])
+
+    assert max_running == 2
+
+
+@pytest.mark.asyncio
+async def test_run_times_out():
+    extractor = Extractor(timeout=0.05)
+
+    with pytest.raises(ExtractionTimeoutError):
+        await extractor.run(time.sleep, 0.5)
+
+
+@pytest.mark.asyncio
+async def test_extract_song_uses_cache(mocker):
+    youtubedl_cls = mocker.patch("yt_dlp.YoutubeDL")
+    extract_info = youtubedl_cls.return_value.__enter__.return_value.extract_info
+    extract_info.return_value = {
+        "title": "It's MyGO!!!!!",
+        "duration": 9000,
+        "url": "https://example.com/mygo.mp3",
+        "acodec": "opus",
+    }
+    extractor = Extractor(cache=MetadataCache(":memory:"))
+
+    await extractor.extract_song("123")
+    song = await extractor.extract_song("123")
+
+    assert extract_info.call_count == 1
+    assert song.title == "It's MyGO!!!!!"
+    assert song.format_info == {"acodec": "opus"}
+
+
+@pytest.mark.asyncio
+async def test_extract_song_coalesces_concurrent_extractions(mocker):
+    youtubedl_cls = mocker.patch("yt_dlp.YoutubeDL")
+    extract_info = youtubedl_cls.return_value.__enter__.return_value.extract_info
+
+    def slow_extract_info(*args, **kwargs):
+        time.sleep(0.05)
+        return {
+            "title": "It's MyGO!!!!!",
+            "duration": 9000,
+            "url": "https://example.com/mygo.mp3",
+        }
+
+    extract_info.side_effect = slow_extract_info
+    extractor = Extractor()
+
+    songs = await asyncio.gather(*[extractor.extract_song("123") for _ in range(3)])
+
+    assert extract_info.call_count == 1
+    assert len({id(song) for song in songs}) == 3
+    assert all(song.title == "It's MyGO!!!!!" for song in songs)
+    assert extractor.inflight == {}
+
+
+@pytest.mark.asyncio
+async def test_extract_song_retries_failures(mocker):
+    youtubedl_cls = mocker.patch("yt_dlp.YoutubeDL")
+    extract_info = youtubedl_cls.return_value.__enter__.return_value.extract_info
+    extract_info.side_effect = [
+        RuntimeError("HTTP Error 503"),
+        {
+            "title": "It's MyGO!!!!!",
+            "duration": 9000,
+            "url": "https://example.com/mygo.mp3",
+        },
+    ]
+    extractor = Extractor(retry_backoff=0)
+
+    song = await extractor.extract_song("123")
+
+    assert song.title == "It's MyGO!!!!!"
+    assert extract_info.call_count == 2
+    assert extractor.retried.get() == 1
+
+
+@pytest.mark.asyncio
+async def test_search_does_not_retry_missing_results(mocker):
+    youtubedl_cls = mocker.patch("yt_dlp.YoutubeDL")
+    extract_info = youtubedl_cls.return_value.__enter__.return_value.extract_info
+    extract_info.return_value = {"entries": []}
+    extractor = Extractor(retry_backoff=0, circuit_failure_threshold=1)
+
+    with pytest.raises(NoSearchResultsError):
+        await extractor.search("nothing")
+
+    assert extract_info.call_count == 1
+    assert extractor.circuit_breaker.n_failures == 0
+
+
+@pytest.mark.asyncio
+async def test_extract_song_fails_fast_once_circuit_opens(mocker):
+    youtubedl_cls = mocker.patch("yt_dlp.YoutubeDL")
+    extract_info = youtubedl_cls.return_value.__enter__.return_value.extract_info
+    extract_info.side_effect = RuntimeError("HTTP Error 503")
+    extractor = Extractor(retries=1, retry_backoff=0, circuit_failure_threshold=2)
+
+    with pytest.raises(RuntimeError):
+        await extractor.extract_song("123")
+    with pytest.raises(CircuitOpenError):
+        await extractor.extract_song("456")
+
+    assert extract_info.call_count == 2
+    assert extractor.circuit_breaker.state == CIRCUIT_OPEN
+    assert "guizhong_extractor_circuit_state 2" in extractor.metrics.render()
+
+
+@pytest.mark.asyncio
+async def test_extract_song_hedges_slow_extraction(mocker):
+    youtubedl_cls = mocker.patch("yt_dlp.YoutubeDL")
+    extract_info = youtubedl_cls.return_value.__enter__.return_value.extract_info
+    n_calls = 0
+
+    def extract_info_stalling_once(*args, **kwargs):
+        nonlocal n_calls
+        n_calls += 1
+        if n_calls == 21:
+            time.sleep(0.5)
+        return {
+            "title": "It's MyGO!!!!!",
+            "duration": 9000,
+            "url": "https://example.com/mygo.mp3",
+        }
+
+    extract_info.side_effect = extract_info_stalling_once
+    extractor = Extractor(hedge_quantile=0.9)
+    for i in range(20):
+        await extractor.extract_song(str(i))
+
+    started_at = time.perf_counter()
+    song = await extractor.extract_song("stalled")
+
+    assert song.title == "It's MyGO!!!!!"
+    assert time.perf_counter() - started_at < 0.4
+    assert extractor.hedged.get() == 1
+
+
+@pytest.mark.asyncio
+async def test_warm_up_loads_youtube_extractor(mocker):
+    youtubedl_cls = mocker.patch("yt_dlp.YoutubeDL")
+    extractor = Extractor()
+
+    await extractor.warm_up()
+
+    get_info_extractor = (
+        youtubedl_cls.return_value.__enter__.return_value.get_info_extractor
+    )
+    get_info_extractor.assert_called_once_with("Youtube")
+
+
+@pytest.mark.asyncio
+async def test_extractions_reuse_youtubedl_instances(mocker):
+    youtubedl_cls = mocker.patch("yt_dlp.YoutubeDL")
+    extract_info = youtubedl_cls.return_value.__enter__.return_value.extract_info
+    extract_info.return_value = {
+        "title": "It's MyGO!!!!!",
+        "duration": 9000,
+        "url": "https://example.com/mygo.mp3",
+    }
+    extractor = Extractor(max_workers=1)
+
+    for video_id in ["1", "2", "3"]:
+        await extractor.extract_song(video_id)
+
+    assert extract_info.call_count == 3
+    assert youtubedl_cls.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_search_uses_search_cache_and_seeds_metadata_cache(mocker):
+    youtubedl_cls = mocker.patch("yt_dlp.YoutubeDL")
+    extract_info = youtubedl_cls.return_value.__enter__.return_value.extract_info
+    extract_info.return_value = {
+        "entries": [
+            {
+                "id": "123",
+                "title": "It's MyGO!!!!!",
+                "duration": 9000,
+                "url": "https://example.com/mygo.mp3",
+            }
+        ]
+    }
+    cache = MetadataCache(":memory:")
+    search_cache = SearchCache(":memory:")
+    extractor = Extractor(cache=cache, search_cache=search_cache)
+
+    await extractor.search("It's MyGO")
+    song = await extractor.search("  it's   mygo ")
+
+    assert extract_info.call_count == 1
+    assert song.video_id == "123"
+    assert search_cache.get("it's mygo") == {"video_id": "123"}
+    assert cache.get("123")["title"] == "It's MyGO!!!!!"
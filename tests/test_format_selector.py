@@ -0,0 +1,43 @@
+from src.format_selector import DEFAULT_BITRATE, FormatSelector, get_bitrate
+from src.song import QUALITY_HIGH, QUALITY_LOW, QUALITY_MEDIUM, Song
+
+
+def test_no_thresholds_keeps_best_quality():
+    selector = FormatSelector()
+
+    assert selector.select(1000, 1000000) == QUALITY_HIGH
+
+
+def test_quality_is_lowered_a_step_at_a_time():
+    selector = FormatSelector(medium_sessions=10, low_sessions=20)
+
+    assert selector.select(5, 0) == QUALITY_HIGH
+    assert selector.select(10, 0) == QUALITY_MEDIUM
+    assert selector.select(20, 0) == QUALITY_LOW
+
+
+def test_quality_is_lowered_when_bandwidth_is_saturated():
+    selector = FormatSelector(medium_bandwidth=1000, low_bandwidth=2000)
+
+    assert selector.select(1, 500) == QUALITY_HIGH
+    assert selector.select(1, 1500) == QUALITY_MEDIUM
+    assert selector.select(1, 2500) == QUALITY_LOW
+
+
+def test_quality_is_raised_once_load_leaves_headroom():
+    selector = FormatSelector(medium_sessions=10, low_sessions=20)
+    selector.select(20, 0)
+
+    # Just under the threshold is not enough headroom
+    assert selector.select(19, 0) == QUALITY_LOW
+    assert selector.select(15, 0) == QUALITY_MEDIUM
+    assert selector.select(9, 0) == QUALITY_MEDIUM
+    assert selector.select(7, 0) == QUALITY_HIGH
+
+
+def test_get_bitrate():
+    song = Song(title="Song", duration=60, video_url="url")
+
+    assert get_bitrate(song) == DEFAULT_BITRATE
+    song.format_info = {"abr": 70.5}
+    assert get_bitrate(song) == 70.5
@@ -1,5 +1,18 @@
+import json
+import asyncio
+import threading
+import time
+import discord
 import pytest
-from src.handler import Handler
+from src.audio_cache import AudioCache
+from src.cache import MetadataCache
+from src.extractor import DEFAULT_PLAYLIST_PAGE_SIZE, Extractor
+from src.format_selector import FormatSelector
+from src.handler import PLAYBACK_MODE_PCM, Handler
+from src.journal import SessionJournal
+from src.loudness import LoudnessAnalyzer
+from src.prebuffer import BufferedSource
+from src.song import Song
 
 
 @pytest.fixture
@@ -8,8 +21,10 @@ def default_setup(mocker):
     voicechannel = mocker.AsyncMock()
     voicechannel.id = "111111111111111111"
     vc = mocker.AsyncMock()
+    vc.is_connected = mocker.Mock(return_value=True)
     voicechannel.connect.return_value = vc
     ctx = mocker.AsyncMock()
+    ctx.author.id = 222222222222222222
     ctx.author.voice.channel = voicechannel
     youtubedl_cls = mocker.patch("yt_dlp.YoutubeDL")
     youtubedl_cls.return_value.__enter__.return_value.extract_info.return_value = {
@@ -41,6 +56,78 @@ async def test_info_songs_queued(default_setup):
     assert "Now playing: It's MyGO!!!!!" in args[0]
 
 
+@pytest.mark.asyncio
+async def test_info_reports_format_picked_under_load(mocker, default_setup):
+    bot, ctx, vc = default_setup
+    handler = Handler(bot=bot, format_selector=FormatSelector(low_sessions=1))
+    youtubedl_cls = mocker.patch("yt_dlp.YoutubeDL")
+    youtubedl_cls.return_value.__enter__.return_value.extract_info.return_value = {
+        "title": "It's MyGO!!!!!",
+        "duration": 9000,
+        "url": "https://example.com/mygo.webm?expire=9999999999",
+        "acodec": "opus",
+        "abr": 50.2,
+    }
+
+    await handler.play(ctx, "https://youtube.com/watch?v=123")
+    await asyncio.sleep(0.1)
+    await handler.info(ctx)
+
+    args = ctx.send.call_args.args
+    assert "Format: opus, 50kbps, low quality" in args[0]
+    assert youtubedl_cls.call_args.args[0]["format"].startswith("worstaudio")
+    # Song is looked up in the chosen quality instead of being resolved again
+    assert (
+        youtubedl_cls.return_value.__enter__.return_value.extract_info.call_count == 1
+    )
+
+
+@pytest.mark.asyncio
+async def test_info_page(mocker, default_setup):
+    bot, ctx, _ = default_setup
+    handler = Handler(bot=bot)
+    youtubedl_cls = mocker.patch("yt_dlp.YoutubeDL")
+    youtubedl_cls.return_value.__enter__.return_value.extract_info.return_value = {
+        "entries": iter(
+            [{"id": str(i), "title": f"Song {i}", "duration": 60} for i in range(60)]
+        )
+    }
+
+    await handler.play(ctx, "https://www.youtube.com/playlist?list=PL123")
+    await handler.info(ctx, "3")
+
+    args = ctx.send.call_args.args
+    assert "Queue (60 songs, 1:00:00 total, page 3/12):" in args[0]
+    assert "11: Song 10" in args[0]
+    assert "15: Song 14" in args[0]
+    assert "Song 15" not in args[0]
+
+
+@pytest.mark.asyncio
+async def test_info_page_past_end_shows_last_page(default_setup):
+    bot, ctx, _ = default_setup
+    handler = Handler(bot=bot)
+
+    await handler.play(ctx, "https://youtube.com/watch?v=123")
+    await handler.info(ctx, "5")
+
+    args = ctx.send.call_args.args
+    assert "page 1/1" in args[0]
+    assert "1: It's MyGO!!!!!" in args[0]
+
+
+@pytest.mark.asyncio
+async def test_info_bad_page(default_setup):
+    bot, ctx, _ = default_setup
+    handler = Handler(bot=bot)
+
+    await handler.play(ctx, "https://youtube.com/watch?v=123")
+    await handler.info(ctx, "first")
+
+    args = ctx.send.call_args.args
+    assert "Invalid page number." in args[0]
+
+
 @pytest.mark.asyncio
 async def test_info_author_not_in_voice(no_author_in_voice_setup):
     bot, ctx, _ = no_author_in_voice_setup
@@ -93,16 +180,9 @@ async def test_play_bad_input(default_setup):
     await handler.play(ctx)
 
     args = ctx.send.call_args.args
-    assert "A single URL must be provided for this command." in args[0]
-
-    await handler.play(
-        ctx, "https://youtube.com/watch?v=123", "https://youtube.com/watch?v=456"
-    )
-
-    args = ctx.send.call_args.args
-    assert "A single URL must be provided for this command." in args[0]
+    assert "Search terms or at least one URL must be provided" in args[0]
 
-    await handler.play(ctx, "not a url")
+    await handler.play(ctx, "https://example.com/watch?v=123")
 
     args = ctx.send.call_args.args
     assert "Invalid URL provided." in args[0]
@@ -220,6 +300,33 @@ async def test_skip_multiple_removes_n_minus_one_and_stops_current_song(
     vc.stop.assert_called()
 
 
+@pytest.mark.asyncio
+async def test_song_end_changes_queue_on_event_loop(mocker, default_setup):
+    bot, ctx, vc = default_setup
+    bot.loop = asyncio.get_running_loop()
+    handler = Handler(bot=bot)
+    vc.play = mocker.MagicMock()
+    vc.stop = mocker.MagicMock()
+
+    await handler.play(
+        ctx,
+        "https://youtube.com/watch?v=1",
+        "https://youtube.com/watch?v=2",
+        "https://youtube.com/watch?v=3",
+    )
+    await asyncio.sleep(0.1)
+    queue = handler.session_cache["111111111111111111"].queue
+    await handler.skip(ctx)
+    # Audio player thread calls back while the event loop is blocked
+    player = threading.Thread(target=vc.play.call_args.kwargs["after"], args=(None,))
+    player.start()
+    player.join()
+    assert [song.video_id for song in queue] == ["1", "2", "3"]
+
+    await asyncio.sleep(0.1)
+    assert [song.video_id for song in queue] == ["2", "3"]
+
+
 @pytest.mark.asyncio
 async def test_skip_bad_inputs(default_setup):
     bot, ctx, _ = default_setup
@@ -275,3 +382,1031 @@ async def test_stop_author_not_in_voice(no_author_in_voice_setup):
 
     args = ctx.send.call_args.args
     assert "You need to be in a voice channel to use this command." in args[0]
+
+
+@pytest.mark.asyncio
+async def test_purge_cache(default_setup):
+    bot, ctx, _ = default_setup
+    handler = Handler(bot=bot, extractor=Extractor(cache=MetadataCache(":memory:")))
+
+    await handler.play(ctx, "https://youtube.com/watch?v=123")
+    await handler.purge_cache(ctx)
+
+    args = ctx.send.call_args.args
+    assert "Purged 1 cached songs." in args[0]
+
+
+@pytest.mark.asyncio
+async def test_purge_cache_no_cache(default_setup):
+    bot, ctx, _ = default_setup
+    handler = Handler(bot=bot)
+
+    await handler.purge_cache(ctx)
+
+    args = ctx.send.call_args.args
+    assert "No song metadata cache is configured." in args[0]
+
+
+@pytest.mark.asyncio
+async def test_profile_writes_cpu_profile(default_setup, tmp_path):
+    bot, ctx, _ = default_setup
+    handler = Handler(bot=bot, profile_dir=tmp_path)
+
+    await handler.profile(ctx)
+    assert "Try profiling with" in ctx.send.call_args.args[0]
+
+    await handler.profile(ctx, "start")
+    assert "Started CPU profile." in ctx.send.call_args.args[0]
+    await asyncio.sleep(0.05)
+    await handler.profile(ctx, "stop")
+    assert f"Wrote CPU profile to {tmp_path}" in ctx.send.call_args.args[0]
+
+
+@pytest.mark.asyncio
+async def test_dump_sessions(default_setup, tmp_path):
+    bot, ctx, _ = default_setup
+    handler = Handler(bot=bot, profile_dir=tmp_path)
+
+    await handler.play(ctx, "https://youtube.com/watch?v=123")
+    await handler.dump_sessions(ctx)
+
+    path = ctx.send.call_args.args[0].removeprefix("Wrote session memory to ")[:-1]
+    with open(path) as f:
+        assert "111111111111111111: " in f.read()
+
+
+@pytest.mark.asyncio
+async def test_play_reuses_source_url_from_extraction(mocker, default_setup):
+    bot, ctx, _ = default_setup
+    handler = Handler(bot=bot)
+    youtubedl_cls = mocker.patch("yt_dlp.YoutubeDL")
+    extract_info = youtubedl_cls.return_value.__enter__.return_value.extract_info
+    extract_info.return_value = {
+        "title": "It's MyGO!!!!!",
+        "duration": 9000,
+        "url": "https://example.com/mygo.mp3?expire=9999999999",
+    }
+
+    await handler.play(ctx, "https://youtube.com/watch?v=123")
+    await asyncio.sleep(0)
+
+    assert extract_info.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_play_resolves_new_source_url_on_forbidden(mocker, default_setup):
+    bot, ctx, vc = default_setup
+    bot.loop = asyncio.get_running_loop()
+    handler = Handler(bot=bot)
+    youtubedl_cls = mocker.patch("yt_dlp.YoutubeDL")
+    extract_info = youtubedl_cls.return_value.__enter__.return_value.extract_info
+    extract_info.return_value = {
+        "title": "It's MyGO!!!!!",
+        "duration": 9000,
+        "url": "https://example.com/mygo.mp3?expire=9999999999",
+    }
+    ffmpeg_cls = mocker.patch("discord.FFmpegPCMAudio")
+    vc.play = mocker.MagicMock()
+
+    await handler.play(ctx, "https://youtube.com/watch?v=123")
+    await asyncio.sleep(0)
+
+    ffmpeg_cls.call_args.kwargs["stderr"].write(b"HTTP error 403 Forbidden")
+    vc.play.call_args.kwargs["after"](RuntimeError("ffmpeg exited"))
+    await asyncio.sleep(0.1)
+
+    assert extract_info.call_count == 2
+    assert len(handler.session_cache["111111111111111111"].queue) == 1
+    assert vc.play.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_seek_restarts_song_at_position_without_extracting(mocker, default_setup):
+    bot, ctx, vc = default_setup
+    bot.loop = asyncio.get_running_loop()
+    handler = Handler(bot=bot, playback_mode=PLAYBACK_MODE_PCM)
+    youtubedl_cls = mocker.patch("yt_dlp.YoutubeDL")
+    extract_info = youtubedl_cls.return_value.__enter__.return_value.extract_info
+    extract_info.return_value = {
+        "title": "It's MyGO!!!!!",
+        "duration": 9000,
+        "url": "https://example.com/mygo.mp3?expire=9999999999",
+    }
+    ffmpeg_cls = mocker.patch("discord.FFmpegPCMAudio")
+    vc.play = mocker.MagicMock()
+    vc.stop = mocker.MagicMock()
+
+    await handler.play(ctx, "https://youtube.com/watch?v=123")
+    await asyncio.sleep(0)
+    await handler.seek(ctx, "1:30")
+    vc.play.call_args.kwargs["after"](None)
+    await asyncio.sleep(0.1)
+    session = handler.session_cache["111111111111111111"]
+
+    assert "Seeking to 1:30." in ctx.send.call_args.args[0]
+    assert extract_info.call_count == 1
+    assert vc.play.call_count == 2
+    assert len(session.queue) == 1
+    assert ffmpeg_cls.call_args.kwargs["before_options"].startswith("-ss 90.00 ")
+    assert session.source.position == 90
+
+
+@pytest.mark.asyncio
+async def test_end_of_queue_forgets_session_lock(mocker, default_setup):
+    bot, ctx, vc = default_setup
+    bot.loop = asyncio.get_running_loop()
+    handler = Handler(bot=bot)
+    vc.play = mocker.MagicMock()
+    vc.stop = mocker.MagicMock()
+
+    await handler.play(ctx, "https://youtube.com/watch?v=123")
+    await asyncio.sleep(0.1)
+    await handler.skip(ctx)
+    vc.play.call_args.kwargs["after"](None)
+    await asyncio.sleep(0.1)
+
+    assert handler.session_cache == {}
+    assert handler.session_locks == {}
+
+
+@pytest.mark.asyncio
+async def test_seek_bad_inputs(default_setup):
+    bot, ctx, _ = default_setup
+    bot.loop = asyncio.get_running_loop()
+    handler = Handler(bot=bot)
+
+    await handler.seek(ctx, "soon")
+    assert "Invalid position." in ctx.send.call_args.args[0]
+
+    await handler.seek(ctx, "1:30")
+    assert "You need to have music queued" in ctx.send.call_args.args[0]
+
+    await handler.play(ctx, "https://youtube.com/watch?v=123")
+    await asyncio.sleep(0.1)
+    await handler.seek(ctx, "3:00:00")
+    assert "Position is past the end of the song." in ctx.send.call_args.args[0]
+
+
+@pytest.mark.asyncio
+async def test_play_resumes_song_that_stopped_early(mocker, default_setup):
+    bot, ctx, vc = default_setup
+    bot.loop = asyncio.get_running_loop()
+    handler = Handler(bot=bot)
+    ffmpeg_cls = mocker.patch("discord.FFmpegPCMAudio")
+    ffmpeg_cls.return_value.read.return_value = b"frame"
+    vc.play = mocker.MagicMock()
+
+    await handler.play(ctx, "https://youtube.com/watch?v=123")
+    await asyncio.sleep(0.1)
+    source = vc.play.call_args.args[0]
+    for _ in range(500):
+        source.read()
+    vc.play.call_args.kwargs["after"](RuntimeError("connection lost"))
+    await asyncio.sleep(0.1)
+    session = handler.session_cache["111111111111111111"]
+
+    assert vc.play.call_count == 2
+    assert len(session.queue) == 1
+    assert session.n_resumes == 1
+    assert ffmpeg_cls.call_args.kwargs["before_options"].startswith("-ss 10.00 ")
+
+
+@pytest.mark.asyncio
+async def test_play_waits_for_voice_to_reconnect_before_resuming(mocker, default_setup):
+    bot, ctx, vc = default_setup
+    bot.loop = asyncio.get_running_loop()
+    mocker.patch("src.handler.RECONNECT_POLL_INTERVAL", 0.01)
+    handler = Handler(bot=bot)
+    vc.play = mocker.MagicMock()
+    vc.stop = mocker.MagicMock()
+
+    await handler.play(ctx, "https://youtube.com/watch?v=123")
+    await asyncio.sleep(0.1)
+    # Audio player gives up on song while voice is reconnecting
+    vc.is_connected.return_value = False
+    vc.play.call_args.kwargs["after"](None)
+    await asyncio.sleep(0.1)
+    assert vc.play.call_count == 1
+
+    vc.is_connected.return_value = True
+    await asyncio.sleep(0.1)
+    assert vc.play.call_count == 2
+    assert handler.session_cache["111111111111111111"].n_resumes == 1
+
+
+@pytest.mark.asyncio
+async def test_play_ends_session_if_voice_does_not_reconnect(mocker, default_setup):
+    bot, ctx, vc = default_setup
+    bot.loop = asyncio.get_running_loop()
+    mocker.patch("src.handler.RECONNECT_POLL_INTERVAL", 0.01)
+    handler = Handler(bot=bot, disconnected_timeout=0.05)
+    vc.play = mocker.MagicMock()
+
+    await handler.play(ctx, "https://youtube.com/watch?v=123")
+    await asyncio.sleep(0.1)
+    vc.is_connected.return_value = False
+    vc.play.call_args.kwargs["after"](None)
+    await asyncio.sleep(0.2)
+
+    assert vc.play.call_count == 1
+    assert handler.session_cache == {}
+    assert (
+        'guizhong_sessions_reaped_total{reason="disconnected"} 1'
+        in handler.metrics.render()
+    )
+
+
+@pytest.mark.asyncio
+async def test_play_cleans_up_source_when_voice_is_lost(mocker, default_setup):
+    bot, ctx, vc = default_setup
+    bot.loop = asyncio.get_running_loop()
+    mocker.patch("src.handler.RECONNECT_POLL_INTERVAL", 0.01)
+    handler = Handler(bot=bot)
+    ffmpeg_cls = mocker.patch("discord.FFmpegPCMAudio")
+
+    def play(source, after=None):
+        vc.is_connected.return_value = False
+        raise discord.ClientException("Not connected to voice.")
+
+    vc.play = mocker.MagicMock(side_effect=play)
+
+    await handler.play(ctx, "https://youtube.com/watch?v=123")
+    await asyncio.sleep(0.1)
+    session = handler.session_cache["111111111111111111"]
+
+    ffmpeg_cls.return_value.cleanup.assert_called_once()
+    assert session.source is None
+    assert not session.play_music_task.done()
+
+    # Song is played once voice is back
+    vc.play = mocker.MagicMock()
+    vc.is_connected.return_value = True
+    await asyncio.sleep(0.1)
+    vc.play.assert_called_once()
+    assert session.source is not None
+
+
+@pytest.mark.asyncio
+async def test_skip_does_not_resume_song(mocker, default_setup):
+    bot, ctx, vc = default_setup
+    bot.loop = asyncio.get_running_loop()
+    handler = Handler(bot=bot)
+    vc.play = mocker.MagicMock()
+    vc.stop = mocker.MagicMock()
+
+    await handler.play(ctx, "https://youtube.com/watch?v=123")
+    await asyncio.sleep(0.1)
+    await handler.skip(ctx)
+    vc.play.call_args.kwargs["after"](None)
+    await asyncio.sleep(0.1)
+
+    assert len(handler.session_cache) == 0 or (
+        len(handler.session_cache["111111111111111111"].queue) == 0
+    )
+    assert vc.play.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_play_prefetches_next_song(mocker, default_setup):
+    bot, ctx, _ = default_setup
+    handler = Handler(bot=bot)
+    resolve_source_url = mocker.spy(Song, "resolve_source_url")
+
+    await handler.play(ctx, "https://youtube.com/watch?v=123")
+    await handler.play(ctx, "https://youtube.com/watch?v=456")
+    session = handler.session_cache["111111111111111111"]
+    await session.prefetch_task
+
+    assert session.prefetch_song is session.queue[1]
+    resolve_source_url.assert_called_with(
+        "https://www.youtube.com/watch?v=456", handler.extractor.ydl_pool, "high"
+    )
+
+
+@pytest.mark.asyncio
+async def test_stop_cancels_prefetch(default_setup):
+    bot, ctx, _ = default_setup
+    handler = Handler(bot=bot)
+
+    await handler.play(ctx, "https://youtube.com/watch?v=123")
+    await handler.play(ctx, "https://youtube.com/watch?v=456")
+    session = handler.session_cache["111111111111111111"]
+    prefetch_task = session.prefetch_task
+    await handler.stop(ctx)
+    await asyncio.sleep(0)
+
+    assert session.prefetch_task is None
+    assert prefetch_task.cancelled()
+
+
+@pytest.mark.asyncio
+async def test_play_uses_prebuffered_next_song(mocker, default_setup):
+    bot, ctx, vc = default_setup
+    bot.loop = asyncio.get_running_loop()
+    handler = Handler(bot=bot, prebuffer_lead=10000)
+    youtubedl_cls = mocker.patch("yt_dlp.YoutubeDL")
+    # Songs short enough that ending right away is not mistaken for stopping early
+    youtubedl_cls.return_value.__enter__.return_value.extract_info.return_value = {
+        "title": "It's MyGO!!!!!",
+        "duration": 3,
+        "url": "https://example.com/mygo.mp3",
+    }
+    ffmpeg_cls = mocker.patch("discord.FFmpegPCMAudio")
+    ffmpeg_cls.return_value.read.side_effect = [b"frame", b""]
+    vc.play = mocker.MagicMock()
+
+    await handler.play(ctx, "https://youtube.com/watch?v=123")
+    await handler.play(ctx, "https://youtube.com/watch?v=456")
+    await asyncio.sleep(0.1)
+    session = handler.session_cache["111111111111111111"]
+
+    assert isinstance(session.prebuffer_source, BufferedSource)
+    assert session.prebuffer_song is session.queue[1]
+    assert ffmpeg_cls.call_count == 2
+
+    vc.play.call_args.kwargs["after"](None)
+    await asyncio.sleep(0.1)
+
+    # Next song is played from memory without starting ffmpeg again
+    assert ffmpeg_cls.call_count == 2
+    assert vc.play.call_args.args[0].read() == b"frame"
+
+
+@pytest.mark.asyncio
+async def test_skip_discards_prebuffered_song(mocker, default_setup):
+    bot, ctx, vc = default_setup
+    bot.loop = asyncio.get_running_loop()
+    handler = Handler(bot=bot, prebuffer_lead=10000)
+    ffmpeg_cls = mocker.patch("discord.FFmpegPCMAudio")
+    ffmpeg_cls.return_value.read.return_value = b""
+    vc.play = mocker.MagicMock()
+    vc.stop = mocker.MagicMock()
+
+    for video_id in ["1", "2", "3"]:
+        await handler.play(ctx, f"https://youtube.com/watch?v={video_id}")
+    await asyncio.sleep(0.1)
+    session = handler.session_cache["111111111111111111"]
+    prebuffer_source = session.prebuffer_source
+
+    await handler.skip(ctx, "2")
+    vc.play.call_args.kwargs["after"](None)
+    await asyncio.sleep(0.1)
+
+    assert prebuffer_source.is_closed
+    assert ffmpeg_cls.return_value.cleanup.called
+    assert session.queue[0].video_id == "3"
+    assert ffmpeg_cls.call_count == 3
+
+
+@pytest.mark.asyncio
+async def test_stop_discards_prebuffered_song(mocker, default_setup):
+    bot, ctx, vc = default_setup
+    handler = Handler(bot=bot, prebuffer_lead=10000)
+    ffmpeg_cls = mocker.patch("discord.FFmpegPCMAudio")
+    ffmpeg_cls.return_value.read.return_value = b""
+    vc.stop = mocker.MagicMock()
+
+    await handler.play(ctx, "https://youtube.com/watch?v=123")
+    await handler.play(ctx, "https://youtube.com/watch?v=456")
+    await asyncio.sleep(0.1)
+    session = handler.session_cache["111111111111111111"]
+    prebuffer_source = session.prebuffer_source
+    await handler.stop(ctx)
+
+    assert prebuffer_source.is_closed
+    assert session.prebuffer_source is None
+
+
+@pytest.mark.asyncio
+async def test_play_records_handoff_latency(mocker, default_setup):
+    bot, ctx, vc = default_setup
+    bot.loop = asyncio.get_running_loop()
+    handler = Handler(bot=bot)
+    youtubedl_cls = mocker.patch("yt_dlp.YoutubeDL")
+    youtubedl_cls.return_value.__enter__.return_value.extract_info.return_value = {
+        "title": "It's MyGO!!!!!",
+        "duration": 1,
+        "url": "https://example.com/mygo.mp3?expire=9999999999",
+    }
+    vc.play = mocker.MagicMock()
+    vc.stop = mocker.MagicMock()
+
+    await handler.play(ctx, "https://youtube.com/watch?v=123")
+    await handler.play(ctx, "https://youtube.com/watch?v=456")
+    await asyncio.sleep(0.1)
+    session = handler.session_cache["111111111111111111"]
+
+    # Seeking restarts the same song, which is not a handoff
+    await handler.seek(ctx, "0:00")
+    vc.play.call_args.kwargs["after"](None)
+    await asyncio.sleep(0.1)
+    assert vc.play.call_count == 2
+    assert handler.handoff_latency.count == 0
+
+    # Play song through to the end like the audio player would
+    source = vc.play.call_args.args[0]
+    for _ in range(50):
+        source.read()
+    vc.play.call_args.kwargs["after"](None)
+    await asyncio.sleep(0.1)
+
+    assert vc.play.call_count == 3
+    assert len(session.queue) == 1
+    assert session.n_resumes == 0
+    assert handler.handoff_latency.count == 1
+
+
+@pytest.mark.asyncio
+async def test_play_passes_opus_through(mocker, default_setup):
+    bot, ctx, _ = default_setup
+    handler = Handler(bot=bot)
+    youtubedl_cls = mocker.patch("yt_dlp.YoutubeDL")
+    youtubedl_cls.return_value.__enter__.return_value.extract_info.return_value = {
+        "title": "It's MyGO!!!!!",
+        "duration": 9000,
+        "url": "https://example.com/mygo.webm",
+        "acodec": "opus",
+    }
+    opus_cls = mocker.patch("discord.FFmpegOpusAudio")
+    pcm_cls = mocker.patch("discord.FFmpegPCMAudio")
+
+    await handler.play(ctx, "https://youtube.com/watch?v=123")
+    await asyncio.sleep(0.1)
+
+    assert opus_cls.call_args.kwargs["codec"] == "copy"
+    pcm_cls.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_play_transcodes_non_opus(mocker, default_setup):
+    bot, ctx, _ = default_setup
+    handler = Handler(bot=bot)
+    youtubedl_cls = mocker.patch("yt_dlp.YoutubeDL")
+    youtubedl_cls.return_value.__enter__.return_value.extract_info.return_value = {
+        "title": "It's MyGO!!!!!",
+        "duration": 9000,
+        "url": "https://example.com/mygo.m4a",
+        "acodec": "mp4a.40.2",
+    }
+    opus_cls = mocker.patch("discord.FFmpegOpusAudio")
+    pcm_cls = mocker.patch("discord.FFmpegPCMAudio")
+
+    await handler.play(ctx, "https://youtube.com/watch?v=123")
+    await asyncio.sleep(0.1)
+
+    pcm_cls.assert_called()
+    opus_cls.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_play_pcm_mode_always_transcodes(mocker, default_setup):
+    bot, ctx, _ = default_setup
+    handler = Handler(bot=bot, playback_mode=PLAYBACK_MODE_PCM)
+    youtubedl_cls = mocker.patch("yt_dlp.YoutubeDL")
+    youtubedl_cls.return_value.__enter__.return_value.extract_info.return_value = {
+        "title": "It's MyGO!!!!!",
+        "duration": 9000,
+        "url": "https://example.com/mygo.webm",
+        "acodec": "opus",
+    }
+    opus_cls = mocker.patch("discord.FFmpegOpusAudio")
+    pcm_cls = mocker.patch("discord.FFmpegPCMAudio")
+
+    await handler.play(ctx, "https://youtube.com/watch?v=123")
+    await asyncio.sleep(0.1)
+
+    pcm_cls.assert_called()
+    opus_cls.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_play_applies_gain_for_measured_loudness(mocker, default_setup):
+    bot, ctx, _ = default_setup
+    cache = MetadataCache(":memory:")
+    cache.put(
+        "123",
+        {"title": "It's MyGO!!!!!", "duration": 9000, "loudness": -10},
+    )
+    handler = Handler(
+        bot=bot,
+        extractor=Extractor(cache=cache),
+        playback_mode=PLAYBACK_MODE_PCM,
+        loudness_analyzer=LoudnessAnalyzer(target=-16),
+    )
+    pcm_cls = mocker.patch("discord.FFmpegPCMAudio")
+
+    await handler.play(ctx, "https://youtube.com/watch?v=123")
+    await asyncio.sleep(0.1)
+
+    assert pcm_cls.call_args.kwargs["options"] == "-vn -af volume=-6.0dB"
+
+
+@pytest.mark.asyncio
+async def test_play_measures_loudness_on_first_play(mocker, default_setup):
+    bot, ctx, _ = default_setup
+    analyzer = LoudnessAnalyzer()
+    request = mocker.patch.object(analyzer, "request")
+    handler = Handler(bot=bot, loudness_analyzer=analyzer)
+
+    await handler.play(ctx, "https://youtube.com/watch?v=123")
+    await asyncio.sleep(0.1)
+
+    song, path = request.call_args.args
+    assert song.video_id == "123"
+    assert path == "https://example.com/mygo.mp3"
+
+
+@pytest.mark.asyncio
+async def test_play_does_not_measure_loudness_of_passed_through_song(
+    mocker, default_setup
+):
+    bot, ctx, _ = default_setup
+    analyzer = LoudnessAnalyzer()
+    request = mocker.patch.object(analyzer, "request")
+    handler = Handler(bot=bot, loudness_analyzer=analyzer)
+    youtubedl_cls = mocker.patch("yt_dlp.YoutubeDL")
+    youtubedl_cls.return_value.__enter__.return_value.extract_info.return_value = {
+        "title": "It's MyGO!!!!!",
+        "duration": 9000,
+        "url": "https://example.com/mygo.webm",
+        "acodec": "opus",
+    }
+    mocker.patch("discord.FFmpegOpusAudio")
+
+    await handler.play(ctx, "https://youtube.com/watch?v=123")
+    await asyncio.sleep(0.1)
+
+    # Gain could not be applied to Opus stream copied as is
+    request.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_play_multiple_urls(default_setup):
+    bot, ctx, _ = default_setup
+    handler = Handler(bot=bot)
+
+    await handler.play(
+        ctx,
+        "https://youtube.com/watch?v=123",
+        "not a url",
+        "https://youtube.com/watch?v=456",
+    )
+
+    messages = [call.args[0] for call in ctx.send.call_args_list]
+    assert "Successfully queued It's MyGO!!!!!!" in messages[0]
+    assert "Invalid URL provided." in messages[1]
+    assert "Successfully queued It's MyGO!!!!!!" in messages[2]
+    assert len(handler.session_cache["111111111111111111"].queue) == 2
+
+
+@pytest.mark.asyncio
+async def test_play_playlist(mocker, default_setup):
+    bot, ctx, _ = default_setup
+    handler = Handler(bot=bot)
+    youtubedl_cls = mocker.patch("yt_dlp.YoutubeDL")
+    extract_info = youtubedl_cls.return_value.__enter__.return_value.extract_info
+    extract_info.return_value = {
+        "entries": iter(
+            [
+                {"id": str(i), "title": f"Song {i}", "duration": 60}
+                for i in range(DEFAULT_PLAYLIST_PAGE_SIZE + 10)
+            ]
+        )
+    }
+
+    await handler.play(ctx, "https://www.youtube.com/playlist?list=PL123")
+
+    args = ctx.send.call_args.args
+    assert "Successfully queued 60 songs from playlist!" in args[0]
+    queue = handler.session_cache["111111111111111111"].queue
+    assert len(queue) == 60
+    assert queue[0].title == "Song 0"
+    assert queue[59].video_url == "https://www.youtube.com/watch?v=59"
+    # Playlist is only enumerated, songs are resolved once they near the head of the queue
+    assert extract_info.call_args_list[0] == mocker.call(
+        "https://www.youtube.com/playlist?list=PL123", download=False, process=False
+    )
+    assert extract_info.call_count <= 3
+
+
+@pytest.mark.asyncio
+async def test_play_uses_cached_audio(mocker, tmp_path, default_setup):
+    bot, ctx, _ = default_setup
+    audio_cache = AudioCache(tmp_path)
+    (tmp_path / "123.opus").write_bytes(b"0")
+    handler = Handler(bot=bot, audio_cache=audio_cache)
+    opus_cls = mocker.patch("discord.FFmpegOpusAudio")
+    resolve_source_url = mocker.spy(Song, "resolve_source_url")
+
+    await handler.play(ctx, "https://youtube.com/watch?v=123")
+    await asyncio.sleep(0.1)
+
+    assert opus_cls.call_args.args[0] == str(tmp_path / "123.opus")
+    # Reconnect options are only valid for URLs
+    assert opus_cls.call_args.kwargs == {
+        "codec": "copy",
+        "stderr": opus_cls.call_args.kwargs["stderr"],
+    }
+    resolve_source_url.assert_not_called()
+    assert audio_cache.play_counts["123"] == 1
+
+
+@pytest.mark.asyncio
+async def test_seek_cached_audio(mocker, tmp_path, default_setup):
+    bot, ctx, vc = default_setup
+    bot.loop = asyncio.get_running_loop()
+    audio_cache = AudioCache(tmp_path)
+    (tmp_path / "123.opus").write_bytes(b"0")
+    handler = Handler(bot=bot, audio_cache=audio_cache)
+    opus_cls = mocker.patch("discord.FFmpegOpusAudio")
+    vc.play = mocker.MagicMock()
+    vc.stop = mocker.MagicMock()
+
+    await handler.play(ctx, "https://youtube.com/watch?v=123")
+    await asyncio.sleep(0.1)
+    await handler.seek(ctx, "30")
+    vc.play.call_args.kwargs["after"](None)
+    await asyncio.sleep(0.1)
+
+    assert opus_cls.call_args.args[0] == str(tmp_path / "123.opus")
+    assert opus_cls.call_args.kwargs["before_options"] == "-ss 30.00"
+
+
+@pytest.mark.asyncio
+async def test_handler_metrics(default_setup):
+    bot, ctx, _ = default_setup
+    handler = Handler(bot=bot)
+
+    await handler.play(ctx, "https://youtube.com/watch?v=123")
+    await handler.play(ctx, "https://youtube.com/watch?v=456")
+
+    text = handler.metrics.render()
+    assert "guizhong_active_sessions 1" in text
+    assert "guizhong_queued_songs 2" in text
+    assert 'guizhong_extraction_seconds_count{kind="song"} 2' in text
+
+
+@pytest.mark.asyncio
+async def test_play_traces_pipeline(mocker, capsys, default_setup):
+    bot, ctx, vc = default_setup
+    handler = Handler(bot=bot, trace_slow_threshold=0)
+    vc.play = mocker.MagicMock()
+
+    await handler.play(ctx, "https://youtube.com/watch?v=123")
+    await asyncio.sleep(0.1)
+    vc.play.call_args.args[0].read()
+
+    lines = [
+        line for line in capsys.readouterr().out.splitlines() if "slow_trace" in line
+    ]
+    assert len(lines) == 1
+    spans = [span["name"] for span in json.loads(lines[0])["spans"]]
+    assert spans == [
+        "voice_connect",
+        "parse_url",
+        "extract_song",
+        "get_source_url",
+        "ffmpeg_spawn",
+        "first_packet",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_plays_share_extraction_and_connection(mocker, default_setup):
+    bot, ctx, _ = default_setup
+    youtubedl_cls = mocker.patch("yt_dlp.YoutubeDL")
+    extract_info = youtubedl_cls.return_value.__enter__.return_value.extract_info
+
+    def slow_extract_info(*args, **kwargs):
+        time.sleep(0.05)
+        return {
+            "title": "It's MyGO!!!!!",
+            "duration": 9000,
+            "url": "https://example.com/mygo.mp3?expire=9999999999",
+        }
+
+    extract_info.side_effect = slow_extract_info
+    handler = Handler(bot=bot)
+
+    await asyncio.gather(
+        *[handler.play(ctx, "https://youtube.com/watch?v=123") for _ in range(3)]
+    )
+
+    assert extract_info.call_count == 1
+    assert ctx.author.voice.channel.connect.call_count == 1
+    assert len(handler.session_cache["111111111111111111"].queue) == 3
+    # Locks are only kept while requests hold or wait on them
+    assert handler.session_locks == {}
+    assert handler.session_lock_users == {}
+
+
+@pytest.mark.asyncio
+async def test_play_saves_session_to_journal(default_setup):
+    bot, ctx, _ = default_setup
+    journal = SessionJournal(":memory:")
+    handler = Handler(bot=bot, journal=journal)
+
+    await handler.play(
+        ctx, "https://youtube.com/watch?v=123", "https://youtube.com/watch?v=456"
+    )
+    await asyncio.sleep(0)
+
+    entries = journal.load()[111111111111111111]
+    assert [entry["video_id"] for _, entry in entries] == ["123", "456"]
+    assert entries[0][1]["source_url"] == "https://example.com/mygo.mp3"
+
+
+@pytest.mark.asyncio
+async def test_restore_sessions_resumes_queue_lazily(mocker, default_setup):
+    bot, ctx, vc = default_setup
+    voicechannel = ctx.author.voice.channel
+    voicechannel.id = 111111111111111111
+    bot.get_channel.return_value = voicechannel
+    youtubedl_cls = mocker.patch("yt_dlp.YoutubeDL")
+    extract_info = youtubedl_cls.return_value.__enter__.return_value.extract_info
+    extract_info.return_value = {
+        "title": "It's MyGO!!!!!",
+        "duration": 9000,
+        "url": "https://example.com/mygo.mp3",
+    }
+    journal = SessionJournal(":memory:")
+    journal.append(
+        voicechannel.id,
+        5,
+        [
+            {"video_id": str(i), "title": f"Song {i}", "duration": 180}
+            for i in range(10)
+        ],
+    )
+    handler = Handler(bot=bot, journal=journal)
+
+    await handler.restore_sessions()
+    await asyncio.sleep(0.1)
+
+    session = handler.session_cache[voicechannel.id]
+    assert session.queue[0].title == "Song 0"
+    assert len(session.queue) == 10
+    assert session.journal_tail == 15
+    assert vc.play.call_count == 1
+    # Only the current and next songs are resolved
+    assert extract_info.call_count <= 2
+
+
+@pytest.mark.asyncio
+async def test_restore_sessions_drops_unknown_channels(default_setup):
+    bot, _, _ = default_setup
+    bot.get_channel.return_value = None
+    journal = SessionJournal(":memory:")
+    journal.append(111, 0, [{"video_id": "123", "title": "Song", "duration": 180}])
+    handler = Handler(bot=bot, journal=journal)
+
+    await handler.restore_sessions()
+
+    assert handler.session_cache == {}
+    assert journal.load() == {}
+
+
+@pytest.fixture
+def idle_session_setup(mocker, default_setup):
+    bot, ctx, vc = default_setup
+    vc.is_paused = mocker.Mock(return_value=False)
+    vc.is_playing = mocker.Mock(return_value=True)
+    vc.is_connected = mocker.Mock(return_value=True)
+    vc.channel.members = [mocker.Mock(bot=False), mocker.Mock(bot=True)]
+    return bot, ctx, vc
+
+
+@pytest.mark.asyncio
+async def test_reap_sessions_ends_paused_session(mocker, idle_session_setup):
+    bot, ctx, vc = idle_session_setup
+    handler = Handler(bot=bot, paused_timeout=10)
+    await handler.play(ctx, "https://youtube.com/watch?v=123")
+    monotonic = mocker.patch("time.monotonic", return_value=100)
+
+    await handler.reap_sessions()
+    assert "111111111111111111" in handler.session_cache
+
+    vc.is_paused.return_value = True
+    await handler.reap_sessions()
+    monotonic.return_value = 105
+    await handler.reap_sessions()
+    assert "111111111111111111" in handler.session_cache
+
+    monotonic.return_value = 111
+    await handler.reap_sessions()
+    assert handler.session_cache == {}
+    vc.disconnect.assert_called_once_with(force=True)
+    assert handler.session_locks == {}
+    assert (
+        'guizhong_sessions_reaped_total{reason="paused"} 1' in handler.metrics.render()
+    )
+
+
+@pytest.mark.asyncio
+async def test_reap_sessions_ends_session_in_empty_channel(mocker, idle_session_setup):
+    bot, ctx, vc = idle_session_setup
+    handler = Handler(bot=bot, empty_channel_timeout=0)
+    await handler.play(ctx, "https://youtube.com/watch?v=123")
+
+    vc.channel.members = [mocker.Mock(bot=True)]
+    await handler.reap_sessions()
+
+    assert handler.session_cache == {}
+
+
+@pytest.mark.asyncio
+async def test_reap_sessions_waits_for_voice_to_reconnect(mocker, idle_session_setup):
+    bot, ctx, vc = idle_session_setup
+    handler = Handler(bot=bot, disconnected_timeout=10)
+    await handler.play(ctx, "https://youtube.com/watch?v=123")
+    monotonic = mocker.patch("time.monotonic", return_value=100)
+
+    # Short reconnect does not end session
+    vc.is_connected.return_value = False
+    await handler.reap_sessions()
+    vc.is_connected.return_value = True
+    monotonic.return_value = 105
+    await handler.reap_sessions()
+    assert "111111111111111111" in handler.session_cache
+
+    vc.is_connected.return_value = False
+    monotonic.return_value = 110
+    await handler.reap_sessions()
+    monotonic.return_value = 115
+    await handler.reap_sessions()
+    assert "111111111111111111" in handler.session_cache
+
+    monotonic.return_value = 120
+    await handler.reap_sessions()
+    assert handler.session_cache == {}
+    assert (
+        'guizhong_sessions_reaped_total{reason="disconnected"} 1'
+        in handler.metrics.render()
+    )
+
+
+@pytest.mark.asyncio
+async def test_play_rejects_too_many_sessions(mocker, default_setup):
+    bot, ctx, _ = default_setup
+    handler = Handler(bot=bot, max_sessions=1, user_rate_limit=1)
+    await handler.play(ctx, "https://youtube.com/watch?v=123")
+
+    other_ctx = mocker.AsyncMock()
+    other_ctx.author.voice.channel.id = "222222222222222222"
+    await handler.play(other_ctx, "https://youtube.com/watch?v=123")
+
+    args = other_ctx.send.call_args.args
+    assert "too many voice channels" in args[0]
+    assert list(handler.session_cache.keys()) == ["111111111111111111"]
+    # User is not charged for request bot turned away
+    assert handler.user_rate_limiter.retry_after(other_ctx.author.id) == 0
+
+
+@pytest.mark.asyncio
+async def test_play_rejects_songs_when_queue_is_full(default_setup):
+    bot, ctx, _ = default_setup
+    handler = Handler(bot=bot, max_queue_length=2)
+
+    await handler.play(
+        ctx,
+        "https://youtube.com/watch?v=1",
+        "https://youtube.com/watch?v=2",
+        "https://youtube.com/watch?v=3",
+    )
+
+    args = ctx.send.call_args.args
+    assert "Queue is full." in args[0]
+    assert len(handler.session_cache["111111111111111111"].queue) == 2
+
+
+@pytest.mark.asyncio
+async def test_play_playlist_stops_when_queue_is_full(mocker, default_setup):
+    bot, ctx, _ = default_setup
+    handler = Handler(bot=bot, max_queue_length=DEFAULT_PLAYLIST_PAGE_SIZE + 5)
+    youtubedl_cls = mocker.patch("yt_dlp.YoutubeDL")
+    extract_info = youtubedl_cls.return_value.__enter__.return_value.extract_info
+    extract_info.return_value = {
+        "entries": iter(
+            [
+                {"id": str(i), "title": f"Song {i}", "duration": 60}
+                for i in range(3 * DEFAULT_PLAYLIST_PAGE_SIZE)
+            ]
+        )
+    }
+
+    await handler.play(ctx, "https://www.youtube.com/playlist?list=PL123")
+
+    args = ctx.send.call_args.args
+    assert "Queue is full. Only queued the first 55 songs from playlist." in args[0]
+    assert len(handler.session_cache["111111111111111111"].queue) == 55
+
+
+@pytest.mark.asyncio
+async def test_play_rejects_user_over_rate_limit(mocker, default_setup):
+    bot, ctx, _ = default_setup
+    handler = Handler(bot=bot, user_rate_limit=2, rate_limit_period=60)
+
+    await handler.play(
+        ctx, "https://youtube.com/watch?v=1", "https://youtube.com/watch?v=2"
+    )
+    await handler.play(ctx, "https://youtube.com/watch?v=3")
+
+    args = ctx.send.call_args.args
+    assert (
+        "You are queueing songs too quickly. Please try again in 30 seconds." in args[0]
+    )
+    assert len(handler.session_cache["111111111111111111"].queue) == 2
+
+    # Other users in the same guild are not held back
+    other_ctx = mocker.AsyncMock()
+    other_ctx.author.id = 333333333333333333
+    other_ctx.guild = ctx.guild
+    other_ctx.author.voice.channel = ctx.author.voice.channel
+    await handler.play(other_ctx, "https://youtube.com/watch?v=3")
+
+    assert len(handler.session_cache["111111111111111111"].queue) == 3
+
+
+@pytest.mark.asyncio
+async def test_play_rejects_guild_over_rate_limit(default_setup):
+    bot, ctx, _ = default_setup
+    handler = Handler(bot=bot, user_rate_limit=None, guild_rate_limit=1)
+
+    await handler.play(ctx, "https://youtube.com/watch?v=1")
+    await handler.play(ctx, "https://youtube.com/watch?v=2")
+
+    args = ctx.send.call_args.args
+    assert "This server is queueing songs too quickly." in args[0]
+    assert (
+        'guizhong_rejected_requests_total{reason="guild_rate_limited"} 1'
+        in handler.metrics.render()
+    )
+
+
+@pytest.mark.asyncio
+async def test_play_rejects_when_extractor_is_busy(mocker, default_setup):
+    bot, ctx, _ = default_setup
+    extractor = Extractor(max_waiting=0)
+    handler = Handler(bot=bot, extractor=extractor, user_rate_limit=1)
+
+    await handler.play(ctx, "https://youtube.com/watch?v=1")
+
+    args = ctx.send.call_args.args
+    assert "Bot is busy looking up songs for other servers." in args[0]
+    assert handler.session_cache == {}
+    assert handler.user_rate_limiter.retry_after(ctx.author.id) == 0
+
+
+@pytest.mark.asyncio
+async def test_play_fails_fast_when_youtube_is_failing(default_setup):
+    bot, ctx, _ = default_setup
+    extractor = Extractor(circuit_failure_threshold=1)
+    extractor.circuit_breaker.record_failure()
+    handler = Handler(bot=bot, extractor=extractor)
+
+    await handler.play(
+        ctx, "https://youtube.com/watch?v=1", "https://youtube.com/watch?v=2"
+    )
+
+    assert ctx.send.call_count == 1
+    args = ctx.send.call_args.args
+    assert "Youtube is not responding right now." in args[0]
+
+
+@pytest.mark.asyncio
+async def test_play_search(mocker, default_setup):
+    bot, ctx, _ = default_setup
+    youtubedl_cls = mocker.patch("yt_dlp.YoutubeDL")
+    extract_info = youtubedl_cls.return_value.__enter__.return_value.extract_info
+    extract_info.return_value = {
+        "entries": [
+            {
+                "id": "123",
+                "title": "It's MyGO!!!!!",
+                "duration": 9000,
+                "url": "https://example.com/mygo.mp3?expire=9999999999",
+            }
+        ]
+    }
+    handler = Handler(bot=bot)
+
+    await handler.play(ctx, "its", "mygo")
+
+    args = ctx.send.call_args.args
+    assert "Successfully queued It's MyGO!!!!!!" in args[0]
+    extract_info.assert_called_once_with("ytsearch1:its mygo", download=False)
+
+
+@pytest.mark.asyncio
+async def test_play_search_no_results(mocker, default_setup):
+    bot, ctx, _ = default_setup
+    youtubedl_cls = mocker.patch("yt_dlp.YoutubeDL")
+    youtubedl_cls.return_value.__enter__.return_value.extract_info.return_value = {
+        "entries": []
+    }
+    handler = Handler(bot=bot)
+
+    await handler.play(ctx, "its", "mygo")
+
+    args = ctx.send.call_args.args
+    assert "No songs found." in args[0]
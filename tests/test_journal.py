@@ -0,0 +1,59 @@
+from src.journal import SessionJournal
+
+ENTRY = {"video_id": "123", "title": "It's MyGO!!!!!", "duration": 9000}
+
+
+def test_journal_happy_path():
+    journal = SessionJournal(":memory:")
+
+    journal.append(111, 0, [ENTRY, ENTRY])
+    journal.append(111, 2, [ENTRY])
+    journal.append(222, 0, [ENTRY])
+
+    assert journal.load() == {
+        111: [(0, ENTRY), (1, ENTRY), (2, ENTRY)],
+        222: [(0, ENTRY)],
+    }
+
+
+def test_journal_trims_played_songs():
+    journal = SessionJournal(":memory:")
+    journal.append(111, 0, [ENTRY, ENTRY, ENTRY])
+
+    journal.trim(111, 2)
+
+    assert journal.load() == {111: [(2, ENTRY)]}
+
+
+def test_journal_deletes_session():
+    journal = SessionJournal(":memory:")
+    journal.append(111, 0, [ENTRY])
+    journal.append(222, 0, [ENTRY])
+
+    journal.delete(111)
+
+    assert journal.load() == {222: [(0, ENTRY)]}
+
+
+def test_journal_persists_to_disk(tmp_path):
+    path = tmp_path / "sessions.sqlite3"
+    journal = SessionJournal(path)
+    journal.append(111, 0, [ENTRY])
+    journal.close()
+
+    journal = SessionJournal(path)
+
+    assert journal.load() == {111: [(0, ENTRY)]}
+
+
+def test_journal_writes_in_background_in_order():
+    journal = SessionJournal(":memory:")
+
+    # Writes do not wait on the database, even while it is busy
+    with journal.lock:
+        journal.append(111, 0, [ENTRY, ENTRY, ENTRY])
+        journal.trim(111, 1)
+        journal.delete(222)
+        journal.append(222, 0, [ENTRY])
+
+    assert journal.load() == {111: [(1, ENTRY), (2, ENTRY)], 222: [(0, ENTRY)]}
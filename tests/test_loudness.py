@@ -0,0 +1,64 @@
+from src.cache import MetadataCache
+from src.loudness import LoudnessAnalyzer, parse_integrated_loudness
+from src.song import Song
+
+EBUR128_SUMMARY = """
+[Parsed_ebur128_0 @ 0x5581] Summary:
+
+  Integrated loudness:
+    I:         -9.8 LUFS
+    Threshold: -20.1 LUFS
+
+  Loudness range:
+    LRA:         5.4 LU
+"""
+
+
+def create_song(loudness=None):
+    song = Song(
+        title="It's MyGO!!!!!",
+        duration=9000,
+        video_url="https://www.youtube.com/watch?v=123",
+        video_id="123",
+    )
+    song.loudness = loudness
+    return song
+
+
+def test_parse_integrated_loudness():
+    assert parse_integrated_loudness(EBUR128_SUMMARY) == -9.8
+    assert parse_integrated_loudness("    I:         -70.0 LUFS") is None
+    assert parse_integrated_loudness("No such file or directory") is None
+
+
+def test_get_gain():
+    analyzer = LoudnessAnalyzer(target=-16, max_gain=6)
+
+    assert analyzer.get_gain(create_song()) is None
+    assert round(analyzer.get_gain(create_song(-12)), 1) == -4.0
+    assert analyzer.get_gain(create_song(-40)) == 6
+    assert analyzer.get_gain(create_song(-16.2)) is None
+
+
+def test_request_measures_song_once_and_caches_loudness(mocker):
+    cache = MetadataCache(":memory:")
+    analyzer = LoudnessAnalyzer(cache=cache)
+    measure = mocker.patch.object(analyzer, "measure", return_value=-9.8)
+    song = create_song()
+
+    analyzer.request(song, "https://example.com/mygo.webm").result()
+
+    assert song.loudness == -9.8
+    assert cache.get("123")["loudness"] == -9.8
+    assert Song.from_metadata("123", cache.get("123")).loudness == -9.8
+    assert analyzer.request(song, "https://example.com/mygo.webm") is None
+    measure.assert_called_once_with("https://example.com/mygo.webm")
+
+
+def test_request_skips_songs_while_too_many_are_waiting(mocker):
+    analyzer = LoudnessAnalyzer(max_pending=1)
+    analyzer.analyzing.add("456")
+    submit = mocker.patch.object(analyzer.executor, "submit")
+
+    assert analyzer.request(create_song(), "https://example.com/mygo.webm") is None
+    submit.assert_not_called()
@@ -0,0 +1,102 @@
+import asyncio
+import subprocess
+import aiohttp
+import pytest
+from src.metrics import (
+    Metrics,
+    MetricsServer,
+    count_child_processes,
+    merge_expositions,
+    probe_event_loop_lag,
+)
+
+
+def test_render_counter_and_gauge():
+    metrics = Metrics()
+    metrics.counter("requests_total", "Requests.", labels={"kind": "a"}).inc(2)
+    metrics.counter("requests_total", "Requests.", labels={"kind": "b"}).inc()
+    metrics.gauge("queue_depth", "Queue depth.", fn=lambda: 7)
+
+    text = metrics.render()
+
+    assert text.count("# TYPE requests_total counter") == 1
+    assert 'requests_total{kind="a"} 2' in text
+    assert 'requests_total{kind="b"} 1' in text
+    assert "# TYPE queue_depth gauge" in text
+    assert "queue_depth 7" in text
+
+
+def test_render_histogram():
+    metrics = Metrics()
+    histogram = metrics.histogram(
+        "latency_seconds", "Latency.", labels={"command": "play"}, buckets=[0.1, 1]
+    )
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(5)
+
+    text = metrics.render()
+
+    assert 'latency_seconds_bucket{command="play",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{command="play",le="1.0"} 2' in text
+    assert 'latency_seconds_bucket{command="play",le="+Inf"} 3' in text
+    assert 'latency_seconds_count{command="play"} 3' in text
+    assert 'latency_seconds_sum{command="play"} 5.55' in text
+
+
+def test_count_child_processes():
+    process = subprocess.Popen(["sleep", "5"])
+    try:
+        assert count_child_processes("sleep") >= 1
+    finally:
+        process.kill()
+        process.wait()
+
+
+@pytest.mark.asyncio
+async def test_probe_event_loop_lag():
+    metrics = Metrics()
+    task = asyncio.create_task(probe_event_loop_lag(metrics, interval=0.01))
+    await asyncio.sleep(0.1)
+    task.cancel()
+
+    assert metrics.histogram("guizhong_event_loop_lag_seconds", "").count > 0
+
+
+@pytest.mark.asyncio
+async def test_metrics_server(unused_tcp_port):
+    metrics = Metrics()
+    metrics.counter("requests_total", "Requests.").inc()
+    server = MetricsServer(metrics, port=unused_tcp_port)
+    await server.start()
+
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.get(
+                f"http://127.0.0.1:{unused_tcp_port}/metrics"
+            ) as response:
+                text = await response.text()
+    finally:
+        await server.stop()
+
+    assert response.status == 200
+    assert "requests_total 1" in text
+
+
+def test_merge_expositions():
+    metrics = Metrics()
+    metrics.counter("requests_total", "Requests.", labels={"kind": "a"}).inc()
+    metrics.gauge("queue_depth", "Queue depth.").set(3)
+
+    text = merge_expositions({0: metrics.render(), 1: metrics.render()}, "worker")
+
+    assert text.count("# HELP requests_total Requests.") == 1
+    assert text.count("# TYPE queue_depth gauge") == 1
+    assert 'requests_total{kind="a",worker="0"} 1' in text
+    assert 'requests_total{kind="a",worker="1"} 1' in text
+    assert 'queue_depth{worker="1"} 3' in text
+    # Samples of a family are kept together
+    lines = text.splitlines()
+    assert lines.index('queue_depth{worker="1"} 3') < lines.index(
+        "# HELP requests_total Requests."
+    )
@@ -0,0 +1,47 @@
+import pytest
+from src.position import PositionSource
+
+
+class FakeSource:
+    def __init__(self, frames):
+        self.frames = list(frames)
+        self.is_cleaned_up = False
+        self.process = "ffmpeg"
+
+    def read(self):
+        return self.frames.pop(0) if self.frames else b""
+
+    def is_opus(self):
+        return True
+
+    def cleanup(self):
+        self.is_cleaned_up = True
+
+
+def test_position_counts_frames_read():
+    source = PositionSource(FakeSource([b"a"] * 100), offset=30)
+
+    assert source.position == 30
+    for _ in range(50):
+        source.read()
+    assert source.position == pytest.approx(31)
+
+
+def test_position_ignores_end_of_stream():
+    source = PositionSource(FakeSource([b"a"]))
+
+    source.read()
+    source.read()
+    source.read()
+
+    assert source.position == pytest.approx(0.02)
+
+
+def test_forwards_to_original():
+    original = FakeSource([])
+    source = PositionSource(original)
+
+    assert source.is_opus()
+    assert source.process == "ffmpeg"
+    source.cleanup()
+    assert original.is_cleaned_up
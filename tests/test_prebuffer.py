@@ -0,0 +1,63 @@
+import time
+from src.prebuffer import BufferedSource
+
+
+class FakeSource:
+    def __init__(self, frames):
+        self.frames = list(frames)
+        self.n_reads = 0
+        self.is_cleaned_up = False
+
+    def read(self):
+        self.n_reads += 1
+        return self.frames.pop(0) if self.frames else b""
+
+    def is_opus(self):
+        return True
+
+    def cleanup(self):
+        self.is_cleaned_up = True
+
+
+def wait_until(condition, timeout=1):
+    deadline = time.perf_counter() + timeout
+    while not condition() and time.perf_counter() < deadline:
+        time.sleep(0.01)
+
+
+def test_reads_frames_in_order():
+    source = BufferedSource(FakeSource([b"a", b"b", b"c"]))
+
+    assert [source.read() for _ in range(4)] == [b"a", b"b", b"c", b""]
+    assert source.is_opus()
+
+
+def test_stops_reading_ahead_at_memory_cap():
+    original = FakeSource([b"frame"] * 10)
+    source = BufferedSource(original, max_bytes=10)
+
+    source.start()
+    wait_until(lambda: source.n_bytes >= 10)
+    time.sleep(0.05)
+
+    assert source.n_bytes == 10
+    assert original.n_reads == 2
+
+    source.read()
+    wait_until(lambda: original.n_reads == 3)
+    assert original.n_reads == 3
+
+
+def test_cleanup_frees_buffer_and_original():
+    original = FakeSource([b"frame"] * 10)
+    source = BufferedSource(original, max_bytes=10)
+    source.start()
+    wait_until(lambda: source.n_bytes >= 10)
+
+    source.cleanup()
+    source.thread.join(timeout=1)
+
+    assert original.is_cleaned_up
+    assert len(source.frames) == 0
+    assert not source.thread.is_alive()
+    assert source.read() == b""
@@ -0,0 +1,85 @@
+import asyncio
+import os
+import time
+import pytest
+from src.profiler import Profiler, deep_sizeof
+from src.session import Session
+from src.song import Song
+
+
+def test_cpu_profile_samples_calling_thread(tmp_path):
+    profiler = Profiler(tmp_path)
+
+    assert profiler.start_cpu_profile(interval=0.001)
+    assert not profiler.start_cpu_profile()
+    deadline = time.perf_counter() + 0.1
+    while time.perf_counter() < deadline:
+        pass
+    path = profiler.stop_cpu_profile()
+
+    with open(path) as f:
+        lines = f.read().splitlines()
+    assert len(lines) > 0
+    assert any("test_cpu_profile_samples_calling_thread" in line for line in lines)
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+    assert profiler.stop_cpu_profile() is None
+
+
+def test_memory_snapshot_writes_growth_since_previous_snapshot(tmp_path):
+    profiler = Profiler(tmp_path)
+
+    try:
+        first_path = profiler.take_memory_snapshot()
+        data = [bytearray(1024) for _ in range(1000)]
+        second_path = profiler.take_memory_snapshot()
+    finally:
+        assert profiler.stop_memory_tracing()
+
+    with open(first_path) as f:
+        assert "Growth since previous snapshot" not in f.read()
+    with open(second_path) as f:
+        report = f.read()
+    assert "Growth since previous snapshot" in report
+    assert "test_profiler.py" in report
+    assert os.path.exists(second_path.replace(".txt", ".tracemalloc"))
+    assert len(data) == 1000
+
+
+def test_deep_sizeof_counts_queued_songs():
+    session = Session(vc=None)
+    empty_size = deep_sizeof(session)
+
+    session.queue.extend(
+        Song(title=f"Song {i}", duration=60, video_url="url") for i in range(100)
+    )
+
+    assert deep_sizeof(session) > empty_size + 100 * 200
+
+
+def test_write_session_memory(tmp_path):
+    profiler = Profiler(tmp_path)
+    session = Session(vc=None)
+    session.queue.append(Song(title="Song", duration=60, video_url="url"))
+
+    path = profiler.write_session_memory({"111111111111111111": session})
+
+    with open(path) as f:
+        report = f.read()
+    assert report.startswith("1 sessions")
+    assert "111111111111111111:" in report
+    assert "1 songs taking" in report
+
+
+@pytest.mark.asyncio
+async def test_write_tasks(tmp_path):
+    profiler = Profiler(tmp_path)
+    task = asyncio.create_task(asyncio.sleep(10), name="sleeper")
+    await asyncio.sleep(0)
+
+    path = profiler.write_tasks()
+    task.cancel()
+
+    with open(path) as f:
+        report = f.read()
+    assert "sleeper" in report
+    assert "ffmpeg processes" in report
@@ -0,0 +1,92 @@
+import asyncio
+import pytest
+from src.rate_limit import FairScheduler, RateLimiter, TokenBucket
+
+
+def test_token_bucket_refills():
+    bucket = TokenBucket(capacity=2, rate=1)
+    now = bucket.updated_at
+
+    bucket.take(now)
+    bucket.take(now)
+
+    assert bucket.retry_after(now) == 1
+    assert bucket.retry_after(now + 1) == 0
+
+
+def test_token_bucket_cost_above_capacity_waits_for_full_bucket():
+    bucket = TokenBucket(capacity=2, rate=1)
+    now = bucket.updated_at
+
+    bucket.take(now)
+
+    assert bucket.retry_after(now, cost=5) == 1
+
+
+def test_rate_limiter_limits_keys_separately():
+    limiter = RateLimiter(limit=2, period=60)
+
+    limiter.take("a", 2)
+
+    assert limiter.retry_after("a") > 0
+    assert limiter.retry_after("b") == 0
+
+
+def test_rate_limiter_gives_back_tokens():
+    limiter = RateLimiter(limit=2, period=60)
+
+    limiter.take("a", 2)
+    limiter.give_back("a", 2)
+    limiter.give_back("a", 2)
+
+    assert limiter.retry_after("a", 2) == 0
+    assert limiter.buckets["a"].tokens == 2
+
+
+@pytest.mark.asyncio
+async def test_fair_scheduler_takes_turns_between_groups():
+    scheduler = FairScheduler(max_running=1)
+    started = []
+    release = asyncio.Event()
+
+    async def job(group, name):
+        async with scheduler.slot(group):
+            started.append(name)
+            await release.wait()
+
+    blocker = asyncio.create_task(job("busy", "blocker"))
+    await asyncio.sleep(0)
+    tasks = [asyncio.create_task(job("busy", f"busy-{i}")) for i in range(3)]
+    tasks.append(asyncio.create_task(job("quiet", "quiet-0")))
+    await asyncio.sleep(0)
+    assert scheduler.n_waiting == 4
+
+    release.set()
+    await asyncio.gather(blocker, *tasks)
+
+    assert started == ["blocker", "busy-0", "quiet-0", "busy-1", "busy-2"]
+    assert scheduler.n_running == 0
+    assert scheduler.n_waiting == 0
+
+
+@pytest.mark.asyncio
+async def test_fair_scheduler_forgets_cancelled_waiters():
+    scheduler = FairScheduler(max_running=1)
+    release = asyncio.Event()
+
+    async def job(group):
+        async with scheduler.slot(group):
+            await release.wait()
+
+    blocker = asyncio.create_task(job("a"))
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(job("b"))
+    await asyncio.sleep(0)
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+
+    assert scheduler.n_waiting == 0
+    release.set()
+    await blocker
+    assert scheduler.n_running == 0
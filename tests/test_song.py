@@ -1,5 +1,6 @@
 import pytest
-from src.song import Song
+from src.errors import NoSearchResultsError
+from src.song import SOURCE_URL_EXPIRY_MARGIN, Song
 
 
 def test_song_happy_path(mocker):
@@ -19,3 +20,104 @@ def test_song_happy_path(mocker):
     source_url = song.get_source_url()
 
     assert source_url == "https://example.com/mygo.mp3"
+
+
+def test_song_reuses_source_url_until_expiry(mocker):
+    youtubedl_cls = mocker.patch("yt_dlp.YoutubeDL")
+    extract_info = youtubedl_cls.return_value.__enter__.return_value.extract_info
+    extract_info.return_value = {
+        "title": "It's MyGO!!!!!",
+        "duration": 9000,
+        "url": "https://example.com/mygo.mp3?expire=10000",
+    }
+    time_mock = mocker.patch("time.time")
+
+    song = Song.extract_song("123")
+    time_mock.return_value = 0
+    song.get_source_url()
+
+    assert extract_info.call_count == 1
+
+    time_mock.return_value = 10000 - SOURCE_URL_EXPIRY_MARGIN
+    song.get_source_url()
+
+    assert extract_info.call_count == 2
+
+
+def test_song_does_not_reuse_source_url_without_expiry(mocker):
+    youtubedl_cls = mocker.patch("yt_dlp.YoutubeDL")
+    extract_info = youtubedl_cls.return_value.__enter__.return_value.extract_info
+    extract_info.return_value = {
+        "title": "It's MyGO!!!!!",
+        "duration": 9000,
+        "url": "https://example.com/mygo.mp3",
+    }
+
+    song = Song.extract_song("123")
+    song.get_source_url()
+
+    assert extract_info.call_count == 2
+
+
+def test_song_invalidate_source_url(mocker):
+    youtubedl_cls = mocker.patch("yt_dlp.YoutubeDL")
+    extract_info = youtubedl_cls.return_value.__enter__.return_value.extract_info
+    extract_info.return_value = {
+        "title": "It's MyGO!!!!!",
+        "duration": 9000,
+        "url": "https://example.com/mygo.mp3?expire=9999999999",
+    }
+
+    song = Song.extract_song("123")
+    song.invalidate_source_url()
+    song.get_source_url()
+
+    assert extract_info.call_count == 2
+
+
+def test_song_journal_entry_round_trip():
+    song = Song(
+        title="It's MyGO!!!!!",
+        duration=9000,
+        video_url="https://www.youtube.com/watch?v=123",
+        video_id="123",
+        format_info={"acodec": "opus"},
+    )
+    song.set_source_url("https://example.com/mygo.webm?expire=9999999999")
+
+    restored = Song.from_journal_entry(song.to_journal_entry())
+
+    assert restored.video_url == song.video_url
+    assert restored.title == song.title
+    assert restored.is_opus()
+    assert restored.has_valid_source_url()
+
+
+def test_song_search(mocker):
+    youtubedl_cls = mocker.patch("yt_dlp.YoutubeDL")
+    extract_info = youtubedl_cls.return_value.__enter__.return_value.extract_info
+    extract_info.return_value = {
+        "entries": [
+            {
+                "id": "123",
+                "title": "It's MyGO!!!!!",
+                "duration": 9000,
+                "url": "https://example.com/mygo.mp3",
+            }
+        ]
+    }
+
+    song = Song.search("mygo")
+
+    extract_info.assert_called_once_with("ytsearch1:mygo", download=False)
+    assert song.video_url == "https://www.youtube.com/watch?v=123"
+    assert song.source_url == "https://example.com/mygo.mp3"
+
+
+def test_song_search_no_results(mocker):
+    youtubedl_cls = mocker.patch("yt_dlp.YoutubeDL")
+    extract_info = youtubedl_cls.return_value.__enter__.return_value.extract_info
+    extract_info.return_value = {"entries": []}
+
+    with pytest.raises(NoSearchResultsError):
+        Song.search("mygo")
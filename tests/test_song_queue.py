@@ -0,0 +1,62 @@
+from src.song import Song
+from src.song_queue import SongQueue
+
+
+def create_song(title, duration=60, requester=None):
+    song = Song(
+        title=title, duration=duration, video_url=f"https://example.com/{title}"
+    )
+    song.requester = requester
+    return song
+
+
+def test_popleft_updates_aggregates():
+    queue = SongQueue(
+        [create_song("a", 60, requester=1), create_song("b", 120, requester=2)]
+    )
+
+    song = queue.popleft()
+
+    assert song.title == "a"
+    assert len(queue) == 1
+    assert queue.total_duration == 120
+    assert queue.count_requested_by(1) == 0
+    assert queue.count_requested_by(2) == 1
+
+
+def test_remove_range_keeps_order():
+    queue = SongQueue([create_song(str(i), requester=i % 2) for i in range(10)])
+
+    queue.remove_range(1, 4)
+
+    assert [song.title for song in queue] == ["0", "4", "5", "6", "7", "8", "9"]
+    assert queue.total_duration == 7 * 60
+    assert queue.count_requested_by(0) == 4
+    assert queue.count_requested_by(1) == 3
+
+
+def test_remove_range_out_of_bounds():
+    queue = SongQueue([create_song("a"), create_song("b")])
+
+    queue.remove_range(1, 100)
+    queue.remove_range(5, 10)
+
+    assert [song.title for song in queue] == ["a"]
+
+
+def test_unknown_durations_are_counted_separately():
+    queue = SongQueue([create_song("a", None), create_song("b", 30)])
+
+    assert queue.total_duration == 30
+    assert queue.n_unknown_durations == 1
+
+    queue.popleft()
+
+    assert queue.n_unknown_durations == 0
+
+
+def test_window():
+    queue = SongQueue([create_song(str(i)) for i in range(10)])
+
+    assert [song.title for song in queue.window(5, 8)] == ["5", "6", "7"]
+    assert [song.title for song in queue.window(8, 20)] == ["8", "9"]
@@ -0,0 +1,34 @@
+import json
+import subprocess
+import sys
+from src.startup import StartupTimer
+
+
+def test_startup_timer(capsys):
+    timer = StartupTimer()
+
+    with timer.stage("import"):
+        pass
+    timer.mark("ready")
+    timer.report()
+
+    report = json.loads(capsys.readouterr().out)
+    assert report["event"] == "startup"
+    assert list(report["stages"].keys()) == ["import", "ready"]
+    assert report["stages"]["ready"]["start_ms"] == 0
+    assert report["stages"]["ready"]["duration_ms"] >= 0
+
+
+def test_bot_does_not_import_heavy_modules():
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, src.bot, src.cluster; print('yt_dlp' in sys.modules, 'aiohttp.web' in sys.modules)",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    assert result.stdout.strip() == "False False"
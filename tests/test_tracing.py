@@ -0,0 +1,55 @@
+import json
+import pytest
+from src.tracing import FirstPacketSource, Tracer
+
+
+def test_trace_logs_slow_trace(capsys):
+    trace = Tracer(slow_threshold=0).start("play", voicechannel_id=1)
+
+    with trace.span("extract_song", video_id="123"):
+        pass
+    with pytest.raises(RuntimeError):
+        with trace.span("voice_connect"):
+            raise RuntimeError("connect failed")
+    trace.finish()
+    trace.finish()
+
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 1
+    logged = json.loads(lines[0])
+    assert logged["trace"] == "play"
+    assert logged["request_id"] == trace.request_id
+    assert logged["voicechannel_id"] == 1
+    assert [span["name"] for span in logged["spans"]] == [
+        "extract_song",
+        "voice_connect",
+    ]
+    assert logged["spans"][0]["video_id"] == "123"
+    assert logged["spans"][1]["error"] == "RuntimeError"
+
+
+def test_trace_does_not_log_fast_trace(capsys):
+    trace = Tracer(slow_threshold=60).start("play")
+
+    with trace.span("extract_song"):
+        pass
+    trace.finish()
+
+    assert capsys.readouterr().out == ""
+
+
+def test_first_packet_source(mocker):
+    original = mocker.MagicMock()
+    original.read.return_value = b"packet"
+    original._current_error = RuntimeError("ffmpeg exited")
+    on_first_packet = mocker.MagicMock()
+    source = FirstPacketSource(original, on_first_packet)
+
+    assert source.read() == b"packet"
+    assert source.read() == b"packet"
+    on_first_packet.assert_called_once()
+    # Audio player reads ffmpeg errors from source
+    assert source._current_error is original._current_error
+
+    source.cleanup()
+    original.cleanup.assert_called()
@@ -1,5 +1,14 @@
 import pytest
-from src.utils import parse_youtube_video_url
+from src.utils import (
+    StderrTail,
+    format_duration,
+    is_url,
+    normalize_search_query,
+    parse_source_url_expiry,
+    parse_timestamp,
+    parse_youtube_playlist_url,
+    parse_youtube_video_url,
+)
 from src.errors import InvalidSongURLError
 
 
@@ -32,3 +41,92 @@ def test_parse_youtube_url_invalid_urls():
         assert parse_youtube_video_url("http://www.youtube.com/play?random=23")
     with pytest.raises(InvalidSongURLError):
         assert parse_youtube_video_url("https://youtu.be/not a good path")
+
+
+def test_parse_source_url_expiry():
+    assert (
+        parse_source_url_expiry(
+            "https://rr1---sn-abc.googlevideo.com/videoplayback?expire=1700000000&ei=abc"
+        )
+        == 1700000000
+    )
+    assert (
+        parse_source_url_expiry(
+            "https://manifest.googlevideo.com/api/manifest/hls_playlist/expire/1700000000/ei/abc"
+        )
+        == 1700000000
+    )
+    assert parse_source_url_expiry("https://example.com/mygo.mp3") is None
+    assert parse_source_url_expiry("https://example.com/mygo.mp3?expire=soon") is None
+
+
+def test_stderr_tail():
+    stderr = StderrTail(size=16)
+
+    stderr.write(b"Server returned ")
+    assert not stderr.is_forbidden()
+
+    stderr.write(b"403 Forbidden")
+    assert stderr.is_forbidden()
+    assert len(stderr.data) == 16
+
+
+def test_stderr_tail_ignores_other_403s():
+    stderr = StderrTail()
+
+    stderr.write(
+        b"[https @ 0x5640] Opening 'https://example.com/403.mp3' for reading\n"
+    )
+    stderr.write(b"Server returned 404 Not Found\n")
+    assert not stderr.is_forbidden()
+
+
+def test_parse_youtube_playlist_url_happy_path():
+    assert (
+        parse_youtube_playlist_url("https://www.youtube.com/playlist?list=PL123")
+        == "PL123"
+    )
+    assert (
+        parse_youtube_playlist_url("https://youtube.com/playlist?list=PL-4_5&si=abc")
+        == "PL-4_5"
+    )
+
+
+def test_parse_youtube_playlist_url_invalid_urls():
+    with pytest.raises(InvalidSongURLError):
+        assert parse_youtube_playlist_url("https://example.com/playlist?list=PL123")
+    with pytest.raises(InvalidSongURLError):
+        assert parse_youtube_playlist_url("https://www.youtube.com/watch?v=123")
+    with pytest.raises(InvalidSongURLError):
+        assert parse_youtube_playlist_url("https://www.youtube.com/playlist")
+
+
+def test_is_url():
+    assert is_url("https://www.youtube.com/watch?v=123")
+    assert is_url("http://youtu.be/123")
+    assert not is_url("never gonna give you up")
+    assert not is_url("youtube.com/watch?v=123")
+
+
+def test_normalize_search_query():
+    assert normalize_search_query("  Never Gonna\tGive  You UP ") == (
+        "never gonna give you up"
+    )
+
+
+def test_format_duration():
+    assert format_duration(0) == "0:00"
+    assert format_duration(75) == "1:15"
+    assert format_duration(3600 + 62) == "1:01:02"
+
+
+def test_parse_timestamp():
+    assert parse_timestamp("90") == 90
+    assert parse_timestamp("1:30") == 90
+    assert parse_timestamp("1:02:03") == 3723
+
+
+@pytest.mark.parametrize("timestamp", ["", "1:", "-5", "1.5", "a:30", "1:2:3:4"])
+def test_parse_timestamp_invalid(timestamp):
+    with pytest.raises(ValueError):
+        parse_timestamp(timestamp)
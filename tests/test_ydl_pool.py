@@ -0,0 +1,42 @@
+import threading
+from src.ydl_pool import YoutubeDLPool
+
+
+def test_pool_reuses_instance_in_same_thread(mocker):
+    youtubedl_cls = mocker.patch("yt_dlp.YoutubeDL")
+    pool = YoutubeDLPool()
+
+    first = pool.get("metadata", {"quiet": True})
+    second = pool.get("metadata", {"quiet": True})
+
+    assert first is second
+    youtubedl_cls.assert_called_once_with({"quiet": True})
+
+
+def test_pool_keeps_instance_for_each_thread_and_profile(mocker):
+    youtubedl_cls = mocker.patch("yt_dlp.YoutubeDL")
+    youtubedl_cls.return_value.__enter__.side_effect = lambda: object()
+    pool = YoutubeDLPool()
+    instances = []
+
+    def get():
+        instances.append(pool.get("metadata", {}))
+
+    thread = threading.Thread(target=get)
+    thread.start()
+    thread.join()
+    get()
+    instances.append(pool.get("stream", {}))
+
+    assert len({id(ydl) for ydl in instances}) == 3
+
+
+def test_pool_close(mocker):
+    youtubedl_cls = mocker.patch("yt_dlp.YoutubeDL")
+    pool = YoutubeDLPool()
+    pool.get("metadata", {})
+
+    pool.close()
+
+    youtubedl_cls.return_value.__enter__.return_value.__exit__.assert_called_once()
+    assert pool.instances == []